@@ -0,0 +1,26 @@
+"""Benchmarks for the command parsers
+
+The benchmarks use the sample outputs that ship with the unittests, so they
+should be run from a source checkout.
+"""
+
+import os
+import timeit
+
+import hwinfo
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(hwinfo.__file__))
+
+def fixture_path(module, filename):
+    """Path to a sample output under hwinfo/<module>/tests/data"""
+    return os.path.join(PACKAGE_DIR, module, 'tests', 'data', filename)
+
+def load_fixture(module, filename):
+    fh = open(fixture_path(module, filename), 'r')
+    data = fh.read()
+    fh.close()
+    return data
+
+def best_of(func, repeat=5, number=1):
+    """Return the best time in seconds for a single call to func"""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
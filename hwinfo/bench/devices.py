@@ -0,0 +1,75 @@
+"""Compare PCIDevice against the slotted PCIDeviceRecord over many devices
+
+Run with:
+
+    python -m hwinfo.bench.devices [--functions N]
+"""
+
+from argparse import ArgumentParser
+
+from prettytable import PrettyTable
+
+from hwinfo.bench import best_of
+from hwinfo.bench import generators
+from hwinfo.pci import PCIDevice, PCIDeviceRecord, PCIDeviceSet
+from hwinfo.pci import NIC_CLASSES, STORAGE_CLASSES, GPU_CLASSES
+from hwinfo.pci.lspci import LspciNNMMParser
+
+KINDS = [NIC_CLASSES, STORAGE_CLASSES, GPU_CLASSES]
+
+def legacy_filter(devices, prefixes):
+    """The pre-index filter, scanning every device for each kind"""
+    res = []
+    for device in devices:
+        for prefix in prefixes:
+            if device.get_pci_class().startswith(prefix):
+                res.append(device)
+                break
+    return res
+
+def legacy_inventory(recs, renders):
+    devices = [PCIDevice(rec) for rec in recs]
+    for kind in KINDS:
+        matched = legacy_filter(devices, kind)
+        for _ in range(renders):
+            [device.get_rec() for device in matched]
+
+def record_inventory(recs, renders):
+    devices = PCIDeviceSet(PCIDeviceRecord.from_records(recs))
+    for kind in KINDS:
+        matched = devices.filter(kind)
+        for _ in range(renders):
+            [device.get_rec() for device in matched]
+
+def legacy_render(recs):
+    [PCIDevice(rec).get_rec() for rec in recs]
+
+def record_render(recs):
+    [device.get_rec() for device in PCIDeviceRecord.from_records(recs)]
+
+def bench_devices(functions):
+    recs = LspciNNMMParser(generators.lspci_nnmm(functions)).parse_items()
+    return [
+        ('filter only', best_of(lambda: legacy_inventory(recs, 0)),
+         best_of(lambda: record_inventory(recs, 0))),
+        ('filter, render once', best_of(lambda: legacy_inventory(recs, 1)),
+         best_of(lambda: record_inventory(recs, 1))),
+        ('filter, render twice', best_of(lambda: legacy_inventory(recs, 2)),
+         best_of(lambda: record_inventory(recs, 2))),
+        ('render all once', best_of(lambda: legacy_render(recs)),
+         best_of(lambda: record_render(recs))),
+    ]
+
+def main():
+    parser = ArgumentParser(prog="hwinfo.bench.devices")
+    parser.add_argument("-n", "--functions", type=int, default=10000, help="PCI functions to build.")
+    args = parser.parse_args()
+
+    table = PrettyTable(['use', 'PCIDevice (s)', 'PCIDeviceRecord (s)'])
+    table.align['use'] = 'l'
+    for name, legacy, record in bench_devices(args.functions):
+        table.add_row([name, "%.4f" % legacy, "%.4f" % record])
+    print table
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Generators that scale the sample outputs up to very large hosts"""
+
+import re
+
+from hwinfo.bench import load_fixture
+
+def pci_bus_id(index, first_bus=0x40):
+    """The index'th bus id, filling 8 functions per device, 32 devices per bus"""
+    return "%02x:%02x.%x" % (first_bus + index // 256, (index // 8) % 32, index % 8)
+
+def cpuinfo(cpus=1024):
+    """A /proc/cpuinfo with one copy of the sample's first processor per cpu"""
+    block = load_fixture('host', 'cpuinfo').strip().split('\n\n')[0]
+    blocks = []
+    for num in range(cpus):
+        blocks.append(re.sub(r'(?m)^processor\t: \d+$', 'processor\t: %d' % num, block))
+    return "\n\n".join(blocks) + "\n\n"
+
+def dmidecode(dimms=96):
+    """A dmidecode output with its memory devices replaced by dimms copies"""
+    sections = load_fixture('host', 'dmidecode').strip().split('\n\n')
+    memory = [s for s in sections if ', DMI type 17,' in s]
+    template = memory[0]
+    devices = []
+    for num in range(dimms):
+        section = re.sub(r'Handle 0x[0-9A-F]+,', 'Handle 0x%04X,' % (0x1100 + num), template)
+        section = re.sub(r'Locator: DIMM_\w+', 'Locator: DIMM_%d' % num, section)
+        devices.append(section)
+
+    pos = sections.index(template)
+    others = [s for s in sections if s not in memory]
+    return "\n\n".join(others[:pos] + devices + others[pos:]) + "\n"
+
+def _functions(lines, functions, template, bus_id_regex):
+    """Pad lines out to functions entries with copies of template (VFs)"""
+    for index in range(functions - len(lines)):
+        lines.append(re.sub(bus_id_regex, pci_bus_id(index), template, count=1))
+    return lines[:functions]
+
+BUS_ID = r'^[0-9a-f]{2}:[0-9a-f]{2}\.[0-9a-f]'
+
+def lspci_nnmm(functions=5000):
+    """lspci -nnmm for a host with thousands of SR-IOV virtual functions"""
+    lines = load_fixture('pci', 'lspci-nnmm').strip().split('\n')
+    template = [l for l in lines if '"Ethernet controller [0200]"' in l][0]
+    template = template.replace(' Gigabit Ethernet [', ' Gigabit Ethernet Virtual Function [')
+    return "\n".join(_functions(lines, functions, template, BUS_ID)) + "\n"
+
+def lspci_n(functions=5000):
+    """lspci -n for a host with thousands of SR-IOV virtual functions"""
+    lines = load_fixture('pci', 'lspci_n').strip().split('\n')
+    template = [l for l in lines if ' 0200: ' in l][0]
+    return "\n".join(_functions(lines, functions, template, BUS_ID)) + "\n"
+
+def lspci_vv(functions=5000):
+    """lspci -vv for a host with thousands of SR-IOV virtual functions"""
+    blocks = load_fixture('pci', 'lspci_vv').strip().split('\n\n')
+    template = load_fixture('pci', 'single_network_device_lspci_vv').strip()
+    return "\n\n".join(_functions(blocks, functions, template, BUS_ID)) + "\n"
+
+def biosdevname_d(nics=512):
+    """biosdevname -d for a host with nics network interfaces"""
+    template = load_fixture('pci', 'biosdevname-d').strip().split('\n\n')[0]
+    blocks = []
+    for num in range(nics):
+        block = re.sub(r'(?m)(device|name): eth\d+$', r'\1: eth%d' % num, template)
+        block = re.sub(r'0000:06:00\.0', '0000:%s' % pci_bus_id(num), block)
+        blocks.append(block)
+    return "\n\n".join(blocks) + "\n"
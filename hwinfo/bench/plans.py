@@ -0,0 +1,89 @@
+"""Compare the per-item cost of raw regex strings against parse plans
+
+Run with:
+
+    python -m hwinfo.bench.plans
+"""
+
+import re
+
+from prettytable import PrettyTable
+
+from hwinfo.bench import load_fixture, best_of
+from hwinfo.util import combine_dicts
+from hwinfo.host.cpuinfo import CPUInfoParser
+from hwinfo.pci.lspci import LspciNNMMParser, LspciVVParser, LspciNParser
+from hwinfo.pci.biosdevname import BiosdevnameDParser
+
+SAMPLES = [
+    (CPUInfoParser, 'host', 'cpuinfo'),
+    (LspciNNMMParser, 'pci', 'lspci-nnmm'),
+    (LspciVVParser, 'pci', 'lspci_vv'),
+    (LspciNParser, 'pci', 'lspci_n'),
+    (BiosdevnameDParser, 'pci', 'biosdevname-d'),
+]
+
+def legacy_parse_item(regexs, item, purge=False):
+    """The pre-plan parse_item, matching against the raw regex strings.
+
+    With purge set the re module cache is emptied before every lookup, which
+    is what a process with more live patterns than the cache holds sees.
+    """
+    rec = {}
+    for regex in regexs:
+        if purge:
+            re.purge()
+        matches = [m.groupdict() for m in re.finditer(regex, item)]
+        mdicts = combine_dicts(matches)
+        if mdicts:
+            rec = dict(list(rec.items()) + list(mdicts.items()))
+    return rec
+
+def split_items(parser):
+    if not parser.ITEM_SEPERATOR:
+        return [parser.DATA]
+    return parser.DATA.decode().split(parser.ITEM_SEPERATOR)
+
+def bench_parser(parser_cls, data):
+    parser = parser_cls(data)
+    items = split_items(parser)
+    regexs = parser.ITEM_REGEXS
+    plan = parser.get_plan()
+
+    def run_legacy():
+        for item in items:
+            legacy_parse_item(regexs, item)
+
+    def run_legacy_purged():
+        for item in items:
+            legacy_parse_item(regexs, item, purge=True)
+
+    def run_plan():
+        for item in items:
+            plan.parse_item(item)
+
+    count = float(len(items))
+    return {
+        'parser': parser_cls.__name__,
+        'items': len(items),
+        'legacy': best_of(run_legacy) / count,
+        'legacy_purged': best_of(run_legacy_purged) / count,
+        'plan': best_of(run_plan) / count,
+    }
+
+def main():
+    table = PrettyTable(['parser', 'items', 'legacy (us/item)',
+                         'legacy, cold re cache (us/item)', 'plan (us/item)'])
+    for parser_cls, module, filename in SAMPLES:
+        res = bench_parser(parser_cls, load_fixture(module, filename))
+        table.add_row([
+            res['parser'],
+            res['items'],
+            "%.1f" % (res['legacy'] * 1e6),
+            "%.1f" % (res['legacy_purged'] * 1e6),
+            "%.1f" % (res['plan'] * 1e6),
+        ])
+    print table
+
+if __name__ == '__main__':
+    main()
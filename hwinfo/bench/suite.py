@@ -0,0 +1,178 @@
+"""Parser throughput benchmarks over synthetic large hosts
+
+Run with:
+
+    python -m hwinfo.bench.suite [--save FILE] [--compare FILE]
+
+Each benchmark runs in its own process so that its peak memory can be
+measured. Results can be saved as a baseline, and later runs on the same
+machine compared against it to catch regressions. Throughput depends on
+the machine, so no baseline is shipped.
+"""
+
+import sys
+import json
+import os
+import time
+import resource
+import multiprocessing
+from Queue import Empty
+from argparse import ArgumentParser
+
+from prettytable import PrettyTable
+
+from hwinfo.bench import best_of
+from hwinfo.bench import generators
+from hwinfo.host.cpuinfo import CPUInfoParser
+from hwinfo.host.dmidecode import DmidecodeParser
+from hwinfo.pci.lspci import LspciNNMMParser, LspciVVParser, LspciNParser
+from hwinfo.pci.biosdevname import BiosdevnameDParser
+
+# Fractional slow down, or growth in peak memory, allowed against a baseline
+TOLERANCE = 0.25
+
+# Seconds to wait for a benchmark process before giving up on it
+CHILD_TIMEOUT = 600
+
+class BenchmarkError(Exception):
+    pass
+
+def parse_items(parser):
+    return parser.parse_items()
+
+def memory_devices(parser):
+    """dmidecode's parse_items is one record for the whole system, so
+    count the memory devices instead"""
+    return parser.get_memory_devices()
+
+# (name, parser, generator, scale, parse)
+BENCHMARKS = [
+    ('cpuinfo-1024-cpus', CPUInfoParser, generators.cpuinfo, 1024, parse_items),
+    ('dmidecode-96-dimms', DmidecodeParser, generators.dmidecode, 96, memory_devices),
+    ('lspci-nnmm-5000-functions', LspciNNMMParser, generators.lspci_nnmm, 5000, parse_items),
+    ('lspci-vv-5000-functions', LspciVVParser, generators.lspci_vv, 5000, parse_items),
+    ('lspci-n-5000-functions', LspciNParser, generators.lspci_n, 5000, parse_items),
+    ('biosdevname-d-512-nics', BiosdevnameDParser, generators.biosdevname_d, 512, parse_items),
+]
+
+def peak_rss_kb():
+    """High water mark of this process' resident set size, in kB (Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(parser_cls, data, repeat=3, parse=parse_items):
+    """Time parse(parser) over data and measure the memory it needed"""
+    before = peak_rss_kb()
+    recs = parse(parser_cls(data))
+    peak_kb = peak_rss_kb() - before
+    seconds = best_of(lambda: parse(parser_cls(data)), repeat=repeat)
+    return {
+        'records': len(recs),
+        'seconds': seconds,
+        'records_per_sec': len(recs) / seconds,
+        'peak_kb': peak_kb,
+    }
+
+def _run_child(queue, index, repeat):
+    _, parser_cls, generator, scale, parse = BENCHMARKS[index]
+    queue.put(measure(parser_cls, generator(scale), repeat, parse))
+
+def run_benchmark(index, repeat=3, timeout=CHILD_TIMEOUT):
+    """Run BENCHMARKS[index] in a fresh process and return its result
+
+    Raises BenchmarkError if the process dies, or gives no result within
+    timeout seconds.
+    """
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_child, args=(queue, index, repeat))
+    proc.start()
+    deadline = time.time() + timeout
+    while True:
+        # Checked before reading, as a child that has exited has already
+        # written anything it was going to
+        alive = proc.is_alive()
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if alive and time.time() < deadline:
+                continue
+            proc.terminate()
+            proc.join()
+            raise BenchmarkError("%s gave no result within %ss (exit code %s)"
+                                 % (BENCHMARKS[index][0], timeout, proc.exitcode))
+    proc.join()
+    return result
+
+def run(names=None, repeat=3):
+    results = {}
+    for index, bench in enumerate(BENCHMARKS):
+        name = bench[0]
+        if names and name not in names:
+            continue
+        results[name] = run_benchmark(index, repeat)
+    return results
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return a description of each result that regressed against baseline"""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        res, base = results[name], baseline[name]
+        if res['records_per_sec'] < base['records_per_sec'] * (1 - tolerance):
+            regressions.append("%s: %.0f records/s, baseline %.0f records/s" % (
+                name, res['records_per_sec'], base['records_per_sec']))
+        # Ignore growth below 1MB, that is within the noise of ru_maxrss
+        if res['peak_kb'] > max(base['peak_kb'] * (1 + tolerance), base['peak_kb'] + 1024):
+            regressions.append("%s: peak memory %d kB, baseline %d kB" % (
+                name, res['peak_kb'], base['peak_kb']))
+    return regressions
+
+def load_baseline(filename):
+    fh = open(filename, 'r')
+    baseline = json.load(fh)
+    fh.close()
+    return baseline
+
+def save_baseline(filename, results):
+    fh = open(filename, 'w')
+    json.dump(results, fh, indent=4, separators=(',', ': '), sort_keys=True)
+    fh.write('\n')
+    fh.close()
+
+def tabulate_results(results):
+    table = PrettyTable(['benchmark', 'records', 'records/s', 'peak memory (kB)'])
+    table.align['benchmark'] = 'l'
+    for name in sorted(results):
+        res = results[name]
+        table.add_row([name, res['records'], "%.0f" % res['records_per_sec'], res['peak_kb']])
+    return table
+
+def main():
+    parser = ArgumentParser(prog="hwinfo.bench.suite")
+    parser.add_argument("-b", "--bench", action="append", help="Only run the named benchmark.")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timing runs per benchmark.")
+    parser.add_argument("-s", "--save", help="Save the results as a baseline file.")
+    parser.add_argument("-c", "--compare", help="Baseline file, saved on this machine, to compare against.")
+    parser.add_argument("-t", "--tolerance", type=float, default=TOLERANCE, help="Allowed fractional regression.")
+    args = parser.parse_args()
+    if args.compare and not os.path.exists(args.compare):
+        parser.error("no baseline file %s, record one with --save" % args.compare)
+
+    results = run(args.bench, args.repeat)
+    print tabulate_results(results)
+
+    if args.save:
+        save_baseline(args.save, results)
+        return
+
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.tolerance)
+        if regressions:
+            print "\nRegressions against %s:" % args.compare
+            for regression in regressions:
+                print "    %s" % regression
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
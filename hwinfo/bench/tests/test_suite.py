@@ -0,0 +1,113 @@
+"""Unittests for the benchmark generators and baseline comparison"""
+
+import unittest
+from mock import patch
+
+from hwinfo.bench import generators
+from hwinfo.bench import suite
+from hwinfo.bench import devices
+from hwinfo.pci import PCIDevice, PCIDeviceRecord, PCIDeviceSet
+from hwinfo.host.cpuinfo import CPUInfoParser
+from hwinfo.host.dmidecode import DmidecodeParser
+from hwinfo.pci.lspci import LspciNNMMParser, LspciVVParser, LspciNParser
+from hwinfo.pci.biosdevname import BiosdevnameDParser
+
+class GeneratorTests(unittest.TestCase):
+
+    def test_pci_bus_id(self):
+        self.assertEqual(generators.pci_bus_id(0), '40:00.0')
+        self.assertEqual(generators.pci_bus_id(9), '40:01.1')
+        self.assertEqual(generators.pci_bus_id(256), '41:00.0')
+
+    def test_cpuinfo(self):
+        recs = CPUInfoParser(generators.cpuinfo(16)).parse_items()
+        self.assertEqual([rec['processor'] for rec in recs], [str(n) for n in range(16)])
+
+    def test_dmidecode(self):
+        data = generators.dmidecode(12)
+        self.assertEqual(data.count(', DMI type 17,'), 12)
+        self.assertEqual(data.count('\tLocator: DIMM_11 \n'), 1)
+        rec = DmidecodeParser(data).parse()
+        self.assertEqual(rec['system_product_name'], 'PowerEdge R310')
+
+    def _assert_functions(self, parser_cls, data, functions):
+        recs = parser_cls(data).parse_items()
+        self.assertEqual(len(recs), functions)
+        bus_ids = set([rec['pci_device_bus_id'] for rec in recs])
+        self.assertEqual(len(bus_ids), functions)
+
+    def test_lspci_nnmm(self):
+        self._assert_functions(LspciNNMMParser, generators.lspci_nnmm(300), 300)
+
+    def test_lspci_n(self):
+        self._assert_functions(LspciNParser, generators.lspci_n(300), 300)
+
+    def test_lspci_vv(self):
+        self._assert_functions(LspciVVParser, generators.lspci_vv(300), 300)
+
+    def test_biosdevname_d(self):
+        recs = BiosdevnameDParser(generators.biosdevname_d(20)).parse_items()
+        self.assertEqual(recs[19]['kernel_name'], 'eth19')
+
+class CompareTests(unittest.TestCase):
+
+    BASELINE = {
+        'a': {'records_per_sec': 1000.0, 'peak_kb': 10000},
+        'b': {'records_per_sec': 1000.0, 'peak_kb': 100},
+    }
+
+    def test_no_regression(self):
+        results = {
+            'a': {'records_per_sec': 900.0, 'peak_kb': 12000},
+            'b': {'records_per_sec': 2000.0, 'peak_kb': 900},
+            'c': {'records_per_sec': 1.0, 'peak_kb': 1},
+        }
+        self.assertEqual(suite.compare(results, self.BASELINE), [])
+
+    def test_regressions(self):
+        results = {
+            'a': {'records_per_sec': 700.0, 'peak_kb': 20000},
+            'b': {'records_per_sec': 1000.0, 'peak_kb': 100},
+        }
+        self.assertEqual(len(suite.compare(results, self.BASELINE)), 2)
+
+    def test_measure(self):
+        res = suite.measure(CPUInfoParser, generators.cpuinfo(4), repeat=1)
+        self.assertEqual(res['records'], 4)
+        self.assertTrue(res['records_per_sec'] > 0)
+
+    def test_measure_dimms(self):
+        res = suite.measure(DmidecodeParser, generators.dmidecode(12), repeat=1,
+                            parse=suite.memory_devices)
+        self.assertEqual(res['records'], 12)
+
+    def test_run_benchmark(self):
+        index = [b[0] for b in suite.BENCHMARKS].index('dmidecode-96-dimms')
+        self.assertEqual(suite.run_benchmark(index, repeat=1)['records'], 96)
+
+    @patch('hwinfo.bench.suite.measure')
+    def test_failed_benchmark(self, measure):
+        measure.side_effect = ValueError("parser bug")
+        self.assertRaises(suite.BenchmarkError, suite.run_benchmark, 0, 1, 30)
+
+    @patch('hwinfo.bench.suite.load_baseline')
+    @patch('hwinfo.bench.suite.run')
+    @patch('sys.argv', ['hwinfo.bench.suite'])
+    def test_no_comparison_by_default(self, run, load_baseline):
+        run.return_value = {'a': {'records': 1, 'records_per_sec': 1.0, 'seconds': 1.0, 'peak_kb': 1}}
+        suite.main()
+        self.assertFalse(load_baseline.called)
+
+
+class DevicesBenchTests(unittest.TestCase):
+
+    def test_paths_render_the_same(self):
+        recs = LspciNNMMParser(generators.lspci_nnmm(50)).parse_items()
+        for kind in devices.KINDS:
+            legacy = [dev.get_rec() for dev in devices.legacy_filter([PCIDevice(rec) for rec in recs], kind)]
+            slotted = [dev.get_rec() for dev in PCIDeviceSet(PCIDeviceRecord.from_records(recs)).filter(kind)]
+            self.assertEqual(slotted, legacy)
+
+    def test_bench_devices(self):
+        results = devices.bench_devices(20)
+        self.assertEqual(len(results), 4)
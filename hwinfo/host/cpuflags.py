@@ -0,0 +1,152 @@
+"""Module for indexing CPU feature flags across many hosts
+
+Each flag is given a bit by a FlagRegistry, so the flags of a host are a
+single integer and fleet wide questions become bitwise operations.
+"""
+
+import json
+
+def get_rec_flags(rec):
+    """The flags of a cpuinfo record, plain or compact"""
+    flag_set = getattr(rec, 'flag_set', None)
+    if flag_set is not None:
+        return flag_set
+    return rec.get('flags', '').split()
+
+class FlagRegistry(object):
+    """Maps CPU feature flags to bit positions"""
+
+    def __init__(self, flags=None):
+        self.flags = []
+        self.bits = {}
+        for flag in flags or []:
+            self.bit(flag)
+
+    def bit(self, flag):
+        """Return the bit for flag, assigning the next free one if it is new"""
+        bit = self.bits.get(flag)
+        if bit is None:
+            bit = self.bits[flag] = len(self.flags)
+            self.flags.append(flag)
+        return bit
+
+    def encode(self, flags):
+        """Return the bitset for flags, registering any new ones"""
+        if isinstance(flags, basestring):
+            flags = flags.split()
+        mask = 0
+        for flag in flags:
+            mask |= 1 << self.bit(flag)
+        return mask
+
+    def query_mask(self, flags):
+        """Return the bitset for flags, or None if any has never been seen"""
+        if isinstance(flags, basestring):
+            flags = flags.split()
+        mask = 0
+        for flag in flags:
+            bit = self.bits.get(flag)
+            if bit is None:
+                return None
+            mask |= 1 << bit
+        return mask
+
+    def decode(self, mask):
+        """Return the set of flags in a bitset"""
+        flags = set()
+        bit = 0
+        while mask:
+            if mask & 1:
+                flags.add(self.flags[bit])
+            mask >>= 1
+            bit += 1
+        return flags
+
+class FlagIndex(object):
+    """Bitsets of the CPU flags of many hosts"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or FlagRegistry()
+        self.hosts = {}
+
+    def add_host(self, name, cpu_recs):
+        """Index a host from its get_cpu_info() records
+
+        A host's flags are those every one of its processors has.
+        """
+        mask = None
+        for rec in cpu_recs:
+            cpu_mask = self.registry.encode(get_rec_flags(rec))
+            if mask is None:
+                mask = cpu_mask
+            else:
+                mask &= cpu_mask
+        self.hosts[name] = mask or 0
+
+    def remove_host(self, name):
+        del self.hosts[name]
+
+    def get_flags(self, name):
+        return self.registry.decode(self.hosts[name])
+
+    def hosts_with(self, flags):
+        """Return the hosts that support all of flags"""
+        mask = self.registry.query_mask(flags)
+        if mask is None:
+            return []
+        return sorted([name for name, host_mask in self.hosts.iteritems()
+                       if host_mask & mask == mask])
+
+    def common_flags(self, names=None):
+        """Return the flags supported by every host in names (default all)"""
+        if names is None:
+            names = self.hosts.keys()
+        mask = None
+        for name in names:
+            if mask is None:
+                mask = self.hosts[name]
+            else:
+                mask &= self.hosts[name]
+        return self.registry.decode(mask or 0)
+
+    def missing_flags(self, name, flags):
+        """Return which of flags a host does not support"""
+        if isinstance(flags, basestring):
+            flags = flags.split()
+        unknown = set([flag for flag in flags if flag not in self.registry.bits])
+        mask = self.registry.query_mask([flag for flag in flags if flag not in unknown])
+        return self.registry.decode(mask & ~self.hosts[name]) | unknown
+
+    def hosts_missing(self, flags):
+        """Return a dict of each host lacking any of flags to the ones it lacks"""
+        missing = {}
+        for name in self.hosts:
+            host_missing = self.missing_flags(name, flags)
+            if host_missing:
+                missing[name] = host_missing
+        return missing
+
+    def to_dict(self):
+        return {
+            'flags': list(self.registry.flags),
+            'hosts': dict([(name, "%x" % mask) for name, mask in self.hosts.iteritems()]),
+        }
+
+    @classmethod
+    def from_dict(cls, rec):
+        index = cls(FlagRegistry(rec['flags']))
+        for name, mask in rec['hosts'].iteritems():
+            index.hosts[name] = int(mask, 16)
+        return index
+
+    def save(self, filename):
+        fh = open(filename, 'w')
+        json.dump(self.to_dict(), fh, separators=(',', ':'))
+        fh.close()
+
+    @classmethod
+    def load(cls, filename):
+        fh = open(filename, 'r')
+        rec = json.load(fh)
+        fh.close()
+        return cls.from_dict(rec)
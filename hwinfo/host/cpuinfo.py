@@ -1,31 +1,159 @@
 """Module for parsing the output of /proc/cpuinfo"""
 
+import re
+import weakref
+from collections import Mapping
+
 from hwinfo.util import CommandParser
 
 REGEX_TEMPLATE = r'%s([\ \t])+\:\ (?P<%s>.*)'
 
+# (cpuinfo key, record field name)
+CPUINFO_FIELDS = [
+    ('processor', 'processor'),
+    ('vendor_id', 'vendor_id'),
+    ('cpu family', 'cpu_family'),
+    ('model', 'model'),
+    ('model name', 'model_name'),
+    ('stepping', 'stepping'),
+    ('microcode', 'microcode'),
+    ('cpu MHz', 'cpu_mhz'),
+    ('cache size', 'cache_size'),
+    ('fpu', 'fpu'),
+    ('fpu_exception', 'fpu_exception'),
+    ('cpuid level', 'cpuid_level'),
+    ('wp', 'wp'),
+    ('flags', 'flags'),
+    ('bogomips', 'bogomips'),
+    ('clflush size', 'clflush_size'),
+    ('cache_alignment', 'cache_alignment'),
+    ('address sizes', 'address_sizes'),
+    ('power management', 'power_management'),
+]
+
 class CPUInfoParser(CommandParser):
 
     ITEM_SEPERATOR = "\n\n"
 
+    ITEM_KEYS = dict(CPUINFO_FIELDS)
+
     ITEM_REGEXS = [
-        REGEX_TEMPLATE % ('processor', 'processor'),
-        REGEX_TEMPLATE % ('vendor_id', 'vendor_id'),
-        REGEX_TEMPLATE % (r'cpu\ family', 'cpu_family'),
-        REGEX_TEMPLATE % ('model', 'model'),
-        REGEX_TEMPLATE % (r'model\ name', 'model_name'),
-        REGEX_TEMPLATE % ('stepping', 'stepping'),
-        REGEX_TEMPLATE % ('microcode', 'microcode'),
-        REGEX_TEMPLATE % (r'cpu\ MHz', 'cpu_mhz'),
-        REGEX_TEMPLATE % (r'cache\ size', 'cache_size'),
-        REGEX_TEMPLATE % (r'fpu', 'fpu'),
-        REGEX_TEMPLATE % (r'fpu_exception', 'fpu_exception'),
-        REGEX_TEMPLATE % (r'cpuid\ level', 'cpuid_level'),
-        REGEX_TEMPLATE % (r'wp', 'wp'),
-        REGEX_TEMPLATE % (r'flags', 'flags'),
-        REGEX_TEMPLATE % (r'bogomips', 'bogomips'),
-        REGEX_TEMPLATE % (r'clflush\ size', 'clflush_size'),
-        REGEX_TEMPLATE % (r'cache_alignment', 'cache_alignment'),
-        REGEX_TEMPLATE % (r'address\ sizes', 'address_sizes'),
-        REGEX_TEMPLATE % (r'power\ management', 'power_management'),
+        REGEX_TEMPLATE % (re.escape(key), field) for key, field in CPUINFO_FIELDS
     ]
+
+# Fields that differ between the logical processors of one kind of CPU
+PER_CPU_FIELDS = ('processor', 'cpu_mhz')
+
+# Only held weakly, so shapes and flag sets go once no record uses them
+_FLAG_SETS = weakref.WeakValueDictionary()
+_SHAPES = weakref.WeakValueDictionary()
+
+def intern_flags(flags):
+    """Return the shared frozenset of the words in a cpuinfo flags string"""
+    flag_set = _FLAG_SETS.get(flags)
+    if flag_set is None:
+        flag_set = frozenset([intern(str(flag)) for flag in flags.split()])
+        _FLAG_SETS[flags] = flag_set
+    return flag_set
+
+class CPUShape(object):
+    """The fields shared by every logical processor of one kind
+
+    Shapes are interned, so all processors with the same model, flags, etc.
+    share one instance, across hosts as well as within one, for as long as
+    any record uses it.
+    """
+
+    __slots__ = ('fields', 'flag_set', '__weakref__')
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.flag_set = intern_flags(fields.get('flags', ''))
+
+def get_cpu_shape(fields):
+    key = frozenset(fields.iteritems())
+    shape = _SHAPES.get(key)
+    if shape is None:
+        shape = _SHAPES[key] = CPUShape(fields)
+    return shape
+
+_MISSING = object()
+
+class CPURecord(object):
+    """A compact, read-only cpuinfo record
+
+    Only the PER_CPU_FIELDS are held per processor, everything else is
+    looked up in the shared CPUShape. Supports the read-only dict interface.
+    """
+
+    __slots__ = ('shape', 'per_cpu')
+
+    def __init__(self, rec):
+        fields = dict(rec)
+        self.per_cpu = tuple([fields.pop(k, _MISSING) for k in PER_CPU_FIELDS])
+        self.shape = get_cpu_shape(fields)
+
+    @property
+    def flag_set(self):
+        return self.shape.flag_set
+
+    def __getitem__(self, key):
+        if key in PER_CPU_FIELDS:
+            value = self.per_cpu[PER_CPU_FIELDS.index(key)]
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self.shape.fields[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        keys = [k for k, v in zip(PER_CPU_FIELDS, self.per_cpu) if v is not _MISSING]
+        return keys + self.shape.fields.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (CPURecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __repr__(self):
+        return "CPURecord(%r)" % self.to_dict()
+
+Mapping.register(CPURecord)
+
+def compact_cpu_recs(recs):
+    """Convert cpuinfo records, e.g. from CPUInfoParser, to CPURecords"""
+    return [CPURecord(rec) for rec in recs]
@@ -1,23 +1,157 @@
 """Module for host related info"""
 
-from hwinfo.util import CommandParser
+import re
+
+from hwinfo.util import CommandParser, BUFFER_TYPES, iter_spans, to_bytes, join_values
+
+HANDLE_REGEX = re.compile(br'Handle\ (0x[0-9A-Fa-f]+),\ DMI\ type\ (\d+),\ (\d+)\ bytes\r?\n')
+
+# DMI types
+BIOS_TYPE = 0
+SYSTEM_TYPE = 1
+BASEBOARD_TYPE = 2
+CHASSIS_TYPE = 3
+PROCESSOR_TYPE = 4
+MEMORY_DEVICE_TYPE = 17
+
+# (record key, DMI type, section field) for DmidecodeParser.parse
+INFO_FIELDS = [
+    ('bios_vendor_name', BIOS_TYPE, 'Vendor'),
+    ('bios_version', BIOS_TYPE, 'Version'),
+    ('bios_release_date', BIOS_TYPE, 'Release Date'),
+    ('system_manufacturer', SYSTEM_TYPE, 'Manufacturer'),
+    ('system_product_name', SYSTEM_TYPE, 'Product Name'),
+    ('system_serial_number', SYSTEM_TYPE, 'Serial Number'),
+    ('system_uuid', SYSTEM_TYPE, 'UUID'),
+    ('chassis_type', CHASSIS_TYPE, 'Type'),
+    ('socket_designation', PROCESSOR_TYPE, 'Socket Designation'),
+]
+
+def parse_section_fields(lines):
+    """Parse the tab indented 'Key: Value' lines of a section
+
+    A key with no value on its line, e.g. 'Flags:', takes the list of the
+    doubly indented lines that follow it.
+    """
+    fields = {}
+    current = None
+    for line in lines:
+        if line.startswith('\t\t'):
+            if current is not None:
+                current.append(line.strip())
+            continue
+        line = line.lstrip('\t')
+        key, sep, value = line.partition(': ')
+        if sep:
+            fields[key] = value
+            current = None
+        elif line.endswith(':'):
+            current = fields[line[:-1]] = []
+    return fields
+
+class DMISection(object):
+    """One 'Handle 0x...' section of the dmidecode output
+
+    Only the header is read up front. The body is decoded and its fields
+    parsed the first time they are asked for.
+    """
+
+    def __init__(self, handle, dmi_type, size, data, start, end):
+        self.handle = handle
+        self.dmi_type = dmi_type
+        self.size = size
+        self._data = data
+        self._start = start
+        self._end = end
+        self._lines = None
+        self._fields = None
+
+    def _get_lines(self):
+        if self._lines is None:
+            text = bytes(self._data[self._start:self._end]).decode('utf-8', 'replace')
+            self._lines = text.rstrip().split('\n')
+        return self._lines
+
+    @property
+    def name(self):
+        """The section title, e.g. 'BIOS Information'"""
+        return self._get_lines()[0]
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = parse_section_fields(self._get_lines()[1:])
+            self._data = None
+        return self._fields
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+def iter_sections(data):
+    """Split dmidecode output into DMISections in a single pass"""
+    for start, end in iter_spans(data, '\n\n'):
+        m = HANDLE_REGEX.match(data, start, end)
+        if m is None:
+            continue
+        yield DMISection(m.group(1).decode('ascii'), int(m.group(2)), int(m.group(3)),
+                         data, m.end(), end)
 
 class DmidecodeParser(CommandParser):
+    """Parser object for the output of dmidecode
+
+    The output is split into its DMI sections once, and indexed by DMI type.
+    The fields of a section are only parsed when they are used.
+    """
+
+    # Records come from the section index rather than ITEM_REGEXS, so the
+    # plan digest says nothing about them; bump this when _parse changes.
+    CACHE_VERSION = 2
+
+    _sections = None
+    _types = None
+
+    def _index(self):
+        data = self.DATA
+        if not isinstance(data, BUFFER_TYPES):
+            data = to_bytes(data)
+        self._sections = []
+        self._types = {}
+        for section in iter_sections(data):
+            self._sections.append(section)
+            self._types.setdefault(section.dmi_type, []).append(section)
+
+    def get_sections(self, dmi_type=None):
+        """Return all sections, or only those of one DMI type, in order"""
+        if self._sections is None:
+            self._index()
+        if dmi_type is None:
+            return list(self._sections)
+        return list(self._types.get(dmi_type, []))
+
+    def get_section(self, handle):
+        for section in self.get_sections():
+            if section.handle == handle:
+                return section
+        return None
+
+    def get_processors(self):
+        """Return the fields of each Processor (type 4) section"""
+        return [section.fields for section in self.get_sections(PROCESSOR_TYPE)]
 
-    ITEM_REGEXS = [
-        # BIOS Info
-        r'BIOS\ Information\n(.)*Vendor:\ (?P<bios_vendor_name>.*)\n',
-        r'BIOS\ Information\n(.)*\n\tVersion:\ (?P<bios_version>.*)\n',
-        r'BIOS\ Information\n(.)*\n(.)*\n\tRelease\ Date:\ (?P<bios_release_date>.*)\n',
-        # System Info
-        r'System\ Information\n\tManufacturer:\ (?P<system_manufacturer>.*)\n',
-        r'System\ Information\n(.)*\n\tProduct\ Name:\ (?P<system_product_name>.*)\n',
-        r'System\ Information\n(.)*\n(.)*\n(.)*\n\tSerial\ Number:\ (?P<system_serial_number>.*)\n',
-        r'System\ Information\n(.)*\n(.)*\n(.)*\n(.)*\n\tUUID:\ (?P<system_uuid>.*)\n',
-        # Chassis Info
-        r'Chassis\ Information\n(.)*\n\tType:\ (?P<chassis_type>.*)\n',
-        # Processor Info
-        r'Processor\ Information\n\tSocket\ Designation:\ (?P<socket_designation>.*)\n',
-    ]
+    def get_memory_devices(self):
+        """Return the fields of each Memory Device (type 17) section"""
+        return [section.fields for section in self.get_sections(MEMORY_DEVICE_TYPE)]
 
+    def _parse(self, as_lists):
+        rec = {}
+        for key, dmi_type, field in INFO_FIELDS:
+            values = [section.fields[field] for section in self.get_sections(dmi_type)
+                      if field in section.fields]
+            if values:
+                rec[key] = values
+        if as_lists:
+            return rec
+        return join_values(rec)
 
+    def _parse_items(self, as_lists):
+        return [self._parse(as_lists)]
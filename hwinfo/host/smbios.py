@@ -0,0 +1,250 @@
+"""Module for decoding the raw SMBIOS tables, without running dmidecode
+
+The tables are read from /sys/firmware/dmi/tables, or from a file written
+by 'dmidecode --dump-bin'. Structures are walked in place with
+struct.unpack_from, and only the fields that are asked for are decoded.
+"""
+
+import os
+import struct
+
+from hwinfo.util import join_values
+from hwinfo.host.dmidecode import BIOS_TYPE, SYSTEM_TYPE, CHASSIS_TYPE
+from hwinfo.host.dmidecode import PROCESSOR_TYPE, MEMORY_DEVICE_TYPE
+
+END_OF_TABLE_TYPE = 127
+
+SYSFS_TABLES_DIR = 'sys/firmware/dmi/tables'
+
+CHASSIS_TYPES = {
+    0x01: 'Other', 0x02: 'Unknown', 0x03: 'Desktop', 0x04: 'Low Profile Desktop',
+    0x05: 'Pizza Box', 0x06: 'Mini Tower', 0x07: 'Tower', 0x08: 'Portable',
+    0x09: 'Laptop', 0x0A: 'Notebook', 0x0B: 'Hand Held', 0x0C: 'Docking Station',
+    0x0D: 'All In One', 0x0E: 'Sub Notebook', 0x0F: 'Space-saving',
+    0x10: 'Lunch Box', 0x11: 'Main Server Chassis', 0x12: 'Expansion Chassis',
+    0x13: 'Sub Chassis', 0x14: 'Bus Expansion Chassis', 0x15: 'Peripheral Chassis',
+    0x16: 'RAID Chassis', 0x17: 'Rack Mount Chassis', 0x18: 'Sealed-case PC',
+    0x19: 'Multi-system', 0x1A: 'CompactPCI', 0x1B: 'AdvancedTCA', 0x1C: 'Blade',
+    0x1D: 'Blade Enclosure', 0x1E: 'Tablet', 0x1F: 'Convertible', 0x20: 'Detachable',
+    0x21: 'IoT Gateway', 0x22: 'Embedded PC', 0x23: 'Mini PC', 0x24: 'Stick PC',
+}
+
+class SMBIOSError(Exception):
+    pass
+
+def _checksum_ok(data, start, length):
+    return sum(struct.unpack_from('<%dB' % length, data, start)) & 0xFF == 0
+
+class EntryPoint(object):
+    """The SMBIOS entry point, 2.x ('_SM_') or 3.x ('_SM3_')"""
+
+    def __init__(self, data):
+        if data[:5] == b'_SM3_':
+            length, major, minor = struct.unpack_from('<BBB', data, 6)
+            self.table_length, self.table_address = struct.unpack_from('<IQ', data, 12)
+            self.structure_count = None
+        elif data[:4] == b'_SM_':
+            length, major, minor = struct.unpack_from('<BBB', data, 5)
+            if data[16:21] != b'_DMI_':
+                raise SMBIOSError("Missing _DMI_ anchor in the entry point")
+            self.table_length, self.table_address, self.structure_count = \
+                struct.unpack_from('<HIH', data, 22)
+        else:
+            raise SMBIOSError("No SMBIOS entry point anchor found")
+
+        if len(data) < length or not _checksum_ok(data, 0, length):
+            raise SMBIOSError("Bad SMBIOS entry point checksum")
+        self.version = (major, minor)
+
+class Structure(object):
+    """One structure in the DMI table, decoded on access"""
+
+    __slots__ = ('table', 'offset', 'dmi_type', 'length', 'handle', 'strings_offset', 'end')
+
+    def __init__(self, table, offset):
+        self.table = table
+        self.offset = offset
+        self.dmi_type, self.length, self.handle = struct.unpack_from('<BBH', table, offset)
+        if self.length < 4:
+            raise SMBIOSError("Bad structure length at offset %d" % offset)
+        self.strings_offset = offset + self.length
+        end = table.find(b'\x00\x00', self.strings_offset)
+        if end == -1:
+            raise SMBIOSError("Unterminated structure at offset %d" % offset)
+        self.end = end + 2
+
+    def has(self, offset, size=1):
+        return offset + size <= self.length
+
+    def byte(self, offset):
+        return struct.unpack_from('<B', self.table, self.offset + offset)[0]
+
+    def word(self, offset):
+        return struct.unpack_from('<H', self.table, self.offset + offset)[0]
+
+    def dword(self, offset):
+        return struct.unpack_from('<I', self.table, self.offset + offset)[0]
+
+    def raw(self, offset, size):
+        start = self.offset + offset
+        return self.table[start:start + size]
+
+    def string(self, offset):
+        """Resolve the string number held in the byte at offset"""
+        if not self.has(offset):
+            return None
+        index = self.byte(offset)
+        if index == 0:
+            return 'Not Specified'
+        pos = self.strings_offset
+        for _ in range(index - 1):
+            nul = self.table.find(b'\x00', pos, self.end)
+            if nul == -1 or nul + 1 >= self.end - 1:
+                return '<BAD INDEX>'
+            pos = nul + 1
+        nul = self.table.find(b'\x00', pos, self.end)
+        if pos >= self.end - 1 or nul == pos:
+            return '<BAD INDEX>'
+        return self.table[pos:nul].decode('ascii', 'replace')
+
+def iter_structures(table, structure_count=None):
+    """Walk the structures of a DMI table, up to the end of table marker"""
+    offset = 0
+    count = 0
+    while offset + 4 <= len(table):
+        if structure_count is not None and count >= structure_count:
+            break
+        structure = Structure(table, offset)
+        yield structure
+        if structure.dmi_type == END_OF_TABLE_TYPE:
+            break
+        offset = structure.end
+        count += 1
+
+def format_uuid(raw, version):
+    values = struct.unpack('<16B', raw)
+    if values == (0xFF,) * 16:
+        return 'Not Present'
+    if values == (0,) * 16:
+        return 'Not Settable'
+    if version >= (2, 6):
+        # The first three fields are little-endian since SMBIOS 2.6
+        values = values[3::-1] + values[5:3:-1] + values[7:5:-1] + values[8:]
+    return '%02X%02X%02X%02X-%02X%02X-%02X%02X-%02X%02X-%02X%02X%02X%02X%02X%02X' % values
+
+def format_memory_size(structure):
+    size = structure.word(0x0C)
+    if size == 0:
+        return 'No Module Installed'
+    if size == 0xFFFF:
+        return 'Unknown'
+    if size == 0x7FFF and structure.has(0x1C, 4):
+        return '%d MB' % (structure.dword(0x1C) & 0x7FFFFFFF)
+    if size & 0x8000:
+        return '%d kB' % (size & 0x7FFF)
+    return '%d MB' % size
+
+class SMBIOSDecoder(object):
+    """Decodes DMI structures straight from the binary SMBIOS tables"""
+
+    def __init__(self, entry_point, table):
+        self.entry_point = EntryPoint(entry_point)
+        self.table = table
+        self._structures = None
+
+    @classmethod
+    def from_sysfs(cls, root='/'):
+        tables_dir = os.path.join(root, SYSFS_TABLES_DIR)
+        return cls(read_binary(os.path.join(tables_dir, 'smbios_entry_point')),
+                   read_binary(os.path.join(tables_dir, 'DMI')))
+
+    @classmethod
+    def from_dump(cls, filename):
+        return cls.from_dump_data(read_binary(filename))
+
+    @classmethod
+    def from_dump_data(cls, data):
+        """Decode the contents of a 'dmidecode --dump-bin' file
+
+        dmidecode rewrites the entry point's table address to the table's
+        offset in the file, so it is followed as it is.
+        """
+        entry_point = EntryPoint(data)
+        start = entry_point.table_address
+        return cls(data, data[start:start + entry_point.table_length])
+
+    @property
+    def version(self):
+        return self.entry_point.version
+
+    def get_structures(self, dmi_type=None):
+        if self._structures is None:
+            self._structures = list(iter_structures(self.table, self.entry_point.structure_count))
+        if dmi_type is None:
+            return list(self._structures)
+        return [s for s in self._structures if s.dmi_type == dmi_type]
+
+    def get_processors(self):
+        """Fields of each Processor (type 4) structure, named as by dmidecode"""
+        recs = []
+        for s in self.get_structures(PROCESSOR_TYPE):
+            recs.append({
+                'Socket Designation': s.string(0x04),
+                'Manufacturer': s.string(0x07),
+                'Version': s.string(0x10),
+            })
+        return recs
+
+    def get_memory_devices(self):
+        """Fields of each Memory Device (type 17) structure, named as by dmidecode"""
+        recs = []
+        for s in self.get_structures(MEMORY_DEVICE_TYPE):
+            rec = {
+                'Size': format_memory_size(s),
+                'Locator': s.string(0x10),
+                'Bank Locator': s.string(0x11),
+            }
+            if s.has(0x15, 2):
+                speed = s.word(0x15)
+                rec['Speed'] = speed and '%d MHz' % speed or 'Unknown'
+            if s.has(0x1A):
+                rec['Manufacturer'] = s.string(0x17)
+                rec['Serial Number'] = s.string(0x18)
+                rec['Asset Tag'] = s.string(0x19)
+                rec['Part Number'] = s.string(0x1A)
+            recs.append(rec)
+        return recs
+
+    def _decode(self, dmi_type, decoder):
+        return [decoder(s) for s in self.get_structures(dmi_type)]
+
+    def parse(self, as_lists=False):
+        """Return the same record as DmidecodeParser.parse"""
+        version = self.version
+        fields = [
+            ('bios_vendor_name', BIOS_TYPE, lambda s: s.string(0x04)),
+            ('bios_version', BIOS_TYPE, lambda s: s.string(0x05)),
+            ('bios_release_date', BIOS_TYPE, lambda s: s.string(0x08)),
+            ('system_manufacturer', SYSTEM_TYPE, lambda s: s.string(0x04)),
+            ('system_product_name', SYSTEM_TYPE, lambda s: s.string(0x05)),
+            ('system_serial_number', SYSTEM_TYPE, lambda s: s.string(0x07)),
+            ('system_uuid', SYSTEM_TYPE,
+             lambda s: s.has(0x08, 16) and format_uuid(s.raw(0x08, 16), version) or None),
+            ('chassis_type', CHASSIS_TYPE,
+             lambda s: s.has(0x05) and CHASSIS_TYPES.get(s.byte(0x05) & 0x7F, '<OUT OF SPEC>') or None),
+            ('socket_designation', PROCESSOR_TYPE, lambda s: s.string(0x04)),
+        ]
+        rec = {}
+        for key, dmi_type, decoder in fields:
+            values = [v for v in self._decode(dmi_type, decoder) if v is not None]
+            if values:
+                rec[key] = values
+        if as_lists:
+            return rec
+        return join_values(rec)
+
+def read_binary(filename):
+    fh = open(filename, 'rb')
+    data = fh.read()
+    fh.close()
+    return data
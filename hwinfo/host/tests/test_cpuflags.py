@@ -0,0 +1,66 @@
+"""Module for unittesting the CPU flag index"""
+
+import os
+import tempfile
+import unittest
+from hwinfo.host.cpuflags import *
+from hwinfo.host.cpuinfo import CPUInfoParser, compact_cpu_recs
+
+DATA_DIR = 'hwinfo/host/tests/data'
+
+class FlagRegistryTests(unittest.TestCase):
+
+    def test_encode_decode(self):
+        registry = FlagRegistry()
+        mask = registry.encode('fpu sse avx')
+        self.assertEqual(mask, 7)
+        self.assertEqual(registry.encode(['avx', 'sha_ni']), 12)
+        self.assertEqual(registry.decode(12), set(['avx', 'sha_ni']))
+
+    def test_query_mask_unknown_flag(self):
+        registry = FlagRegistry(['fpu'])
+        self.assertEqual(registry.query_mask('fpu'), 1)
+        self.assertEqual(registry.query_mask('fpu avx512f'), None)
+        self.assertEqual(registry.flags, ['fpu'])
+
+class FlagIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FlagIndex()
+        self.index.add_host('old', [{'flags': 'fpu sse sse2'}, {'flags': 'fpu sse sse2'}])
+        self.index.add_host('new', [{'flags': 'fpu sse sse2 avx avx512f sha_ni'}])
+        self.index.add_host('mixed', [{'flags': 'fpu sse sse2 avx'}, {'flags': 'fpu sse avx'}])
+
+    def test_hosts_with(self):
+        self.assertEqual(self.index.hosts_with('avx512f sha_ni'), ['new'])
+        self.assertEqual(self.index.hosts_with(['avx']), ['mixed', 'new'])
+        self.assertEqual(self.index.hosts_with('sse2'), ['new', 'old'])
+        self.assertEqual(self.index.hosts_with('amx_tile'), [])
+
+    def test_common_flags(self):
+        self.assertEqual(self.index.common_flags(), set(['fpu', 'sse']))
+        self.assertEqual(self.index.common_flags(['new', 'mixed']), set(['fpu', 'sse', 'avx']))
+
+    def test_missing_flags(self):
+        self.assertEqual(self.index.missing_flags('old', 'avx sse amx_tile'), set(['avx', 'amx_tile']))
+        self.assertEqual(self.index.hosts_missing('avx sse2'),
+                         {'old': set(['avx']), 'mixed': set(['sse2'])})
+
+    def test_save_load(self):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        self.index.save(filename)
+        index = FlagIndex.load(filename)
+        os.remove(filename)
+        self.assertEqual(index.hosts, self.index.hosts)
+        self.assertEqual(index.hosts_with('avx512f sha_ni'), ['new'])
+        self.assertEqual(index.get_flags('mixed'), set(['fpu', 'sse', 'avx']))
+
+    def test_add_cpuinfo_recs(self):
+        fh = open("%s/cpuinfo" % DATA_DIR)
+        recs = CPUInfoParser(fh.read()).parse_items()
+        fh.close()
+        self.index.add_host('plain', recs)
+        self.index.add_host('compact', compact_cpu_recs(recs))
+        self.assertEqual(self.index.hosts['plain'], self.index.hosts['compact'])
+        self.assertEqual(self.index.get_flags('plain'), set(recs[0]['flags'].split()))
@@ -1,7 +1,9 @@
 """Module for unittesting dmidecode methods"""
 
+import gc
 import unittest
-from hwinfo.host.cpuinfo import CPUInfoParser
+from hwinfo.host import cpuinfo
+from hwinfo.host.cpuinfo import CPUInfoParser, CPURecord, compact_cpu_recs
 
 DATA_DIR = 'hwinfo/host/tests/data'
 
@@ -126,3 +128,84 @@ class CPUInfoMultipleParseTest(unittest.TestCase):
     def test_number_of_processors(self):
         recs = self.parser.parse_items()
         self.assertEqual(len(recs), 4)
+
+class CPUInfoTokenizerTest(unittest.TestCase):
+
+    DATA_FILE = "%s/cpuinfo" % DATA_DIR
+
+    def setUp(self):
+        fh = open(self.DATA_FILE)
+        self.data = fh.read()
+        fh.close()
+
+    def test_matches_regex_parse(self):
+        recs = CPUInfoParser(self.data).parse_items()
+        regex_parser = CPUInfoParser(self.data, CPUInfoParser.ITEM_REGEXS)
+        self.assertEqual(regex_parser.ITEM_KEYS, None)
+        self.assertEqual(recs, regex_parser.parse_items())
+
+    def test_unknown_keys_ignored(self):
+        data = "processor\t: 0\nbugs\t\t: spectre_v1\npower management:\n"
+        rec = CPUInfoParser(data).parse_items()[0]
+        self.assertEqual(rec, {'processor': '0'})
+
+class CompactCPURecordTest(unittest.TestCase):
+
+    DATA_FILE = "%s/cpuinfo" % DATA_DIR
+
+    def setUp(self):
+        fh = open(self.DATA_FILE)
+        data = fh.read()
+        fh.close()
+        self.recs = CPUInfoParser(data).parse_items()
+        self.compact = compact_cpu_recs(self.recs)
+
+    def test_dict_access(self):
+        for rec, crec in zip(self.recs, self.compact):
+            self.assertEqual(crec, rec)
+            self.assertEqual(rec, crec)
+            self.assertEqual(crec.to_dict(), rec)
+            self.assertEqual(crec['processor'], rec['processor'])
+            self.assertEqual(crec['model_name'], rec['model_name'])
+            self.assertEqual(sorted(crec.keys()), sorted(rec.keys()))
+            self.assertTrue('flags' in crec)
+
+    def test_shape_is_shared(self):
+        shapes = set([id(crec.shape) for crec in self.compact])
+        self.assertEqual(len(shapes), 1)
+        again = compact_cpu_recs(self.recs)
+        self.assertTrue(again[0].shape is self.compact[0].shape)
+
+    def test_flag_set(self):
+        flag_set = self.compact[0].flag_set
+        self.assertTrue(isinstance(flag_set, frozenset))
+        self.assertTrue('sse4_2' in flag_set)
+        self.assertTrue(self.compact[3].flag_set is flag_set)
+
+    def test_per_cpu_fields(self):
+        rec = dict(self.recs[0])
+        rec['processor'] = '7'
+        rec['cpu_mhz'] = '1200.000'
+        crec = CPURecord(rec)
+        self.assertTrue(crec.shape is self.compact[0].shape)
+        self.assertEqual(crec['cpu_mhz'], '1200.000')
+
+    def test_unused_shapes_released(self):
+        rec = dict(self.recs[0])
+        rec['bogomips'] = '1234.56'
+        rec['flags'] = 'fpu only_this_host'
+        crec = CPURecord(rec)
+        shapes = len(cpuinfo._SHAPES)
+        flag_sets = len(cpuinfo._FLAG_SETS)
+        del crec
+        gc.collect()
+        self.assertEqual(len(cpuinfo._SHAPES), shapes - 1)
+        self.assertEqual(len(cpuinfo._FLAG_SETS), flag_sets - 1)
+        self.assertTrue(self.compact[0].shape in cpuinfo._SHAPES.values())
+
+    def test_missing_per_cpu_field(self):
+        crec = CPURecord({'processor': '0', 'flags': 'fpu'})
+        self.assertFalse('cpu_mhz' in crec)
+        self.assertEqual(crec.get('cpu_mhz'), None)
+        self.assertRaises(KeyError, lambda: crec['cpu_mhz'])
+        self.assertEqual(len(crec), 2)
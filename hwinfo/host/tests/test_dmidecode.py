@@ -58,3 +58,57 @@ class DmidecodeParserTests(unittest.TestCase):
 
     def test_dmidecode_socket_designation_type(self):
         return self._assert_equal('socket_designation')
+
+class DmidecodeSectionTests(unittest.TestCase):
+
+    DATA_FILE = "%s/%s" % (DATA_DIR, 'dmidecode')
+
+    def setUp(self):
+        fh = open(self.DATA_FILE)
+        data = fh.read()
+        fh.close()
+        self.parser = DmidecodeParser(data)
+
+    def test_sections_indexed_by_type(self):
+        self.assertEqual(len(self.parser.get_sections()), 66)
+        self.assertEqual(len(self.parser.get_sections(MEMORY_DEVICE_TYPE)), 6)
+        self.assertEqual(len(self.parser.get_sections(PROCESSOR_TYPE)), 2)
+        self.assertEqual(self.parser.get_sections(1000), [])
+
+    def test_section_header(self):
+        section = self.parser.get_sections(BIOS_TYPE)[0]
+        self.assertEqual(section.handle, '0x0000')
+        self.assertEqual(section.size, 24)
+        self.assertEqual(section.name, 'BIOS Information')
+        self.assertTrue(self.parser.get_section('0x0000') is section)
+
+    def test_fields_parsed_lazily(self):
+        section = self.parser.get_sections(SYSTEM_TYPE)[0]
+        self.assertEqual(section._fields, None)
+        self.assertEqual(section.get('Product Name'), 'PowerEdge R310')
+        self.assertTrue(section.fields is section.fields)
+
+    def test_memory_devices(self):
+        dimms = self.parser.get_memory_devices()
+        self.assertEqual(dimms[0]['Locator'], 'DIMM_A1 ')
+        self.assertEqual(dimms[0]['Size'], '2048 MB')
+        self.assertEqual(dimms[0]['Type'], 'DDR3')
+
+    def test_processor_list_fields(self):
+        cpu = self.parser.get_processors()[0]
+        self.assertEqual(cpu['Socket Designation'], 'CPU1')
+        self.assertEqual(cpu['Flags'][0], 'FPU (Floating-point unit on-chip)')
+        self.assertEqual(len(cpu['Flags']), 28)
+        self.assertEqual(cpu['Upgrade'], 'Socket LGA1366')
+
+    def test_parse_as_lists(self):
+        rec = self.parser.parse(as_lists=True)
+        self.assertEqual(rec['socket_designation'], ['CPU1', 'CPU2'])
+        self.assertEqual(rec['bios_version'], ['1.0.0'])
+
+    def test_parse_items(self):
+        self.assertEqual(self.parser.parse_items(), [self.parser.parse()])
+
+    def test_parse_section_fields(self):
+        fields = parse_section_fields(['\tA: 1', '\tB:', '\t\tx', '\t\ty', '\tC: a: b', '\tD: '])
+        self.assertEqual(fields, {'A': '1', 'B': ['x', 'y'], 'C': 'a: b', 'D': ''})
@@ -0,0 +1,100 @@
+"""Module for unittesting the SMBIOS table decoder"""
+
+import unittest
+import struct
+
+from hwinfo.host.smbios import *
+from hwinfo.host.dmidecode import DmidecodeParser
+
+DATA_DIR = 'hwinfo/host/tests/data'
+
+class SMBIOSDecoderTests(unittest.TestCase):
+
+    SYSFS_ROOT = "%s/%s" % (DATA_DIR, 'sysfs')
+    DUMP_FILE = "%s/%s" % (DATA_DIR, 'dmidecode.bin')
+
+    DATA_REC = {
+        'bios_vendor_name': 'Dell Inc.',
+        'bios_version': '1.0.0',
+        'bios_release_date': '02/11/2010',
+        'system_manufacturer': 'Dell Inc.',
+        'system_product_name': 'PowerEdge R310',
+        'system_serial_number': 'GZ7BS4J',
+        'system_uuid': '4C4C4544-005A-3710-8042-C7C04F53344A',
+        'chassis_type': 'Rack Mount Chassis',
+        'socket_designation': 'CPU1, CPU2',
+    }
+
+    def setUp(self):
+        self.decoder = SMBIOSDecoder.from_sysfs(self.SYSFS_ROOT)
+
+    def test_sysfs_version(self):
+        self.assertEqual(self.decoder.version, (2, 6))
+
+    def test_dump_version(self):
+        self.assertEqual(SMBIOSDecoder.from_dump(self.DUMP_FILE).version, (3, 0))
+
+    def test_sysfs_parse(self):
+        self.assertEqual(self.decoder.parse(), self.DATA_REC)
+
+    def test_dump_parse(self):
+        self.assertEqual(SMBIOSDecoder.from_dump(self.DUMP_FILE).parse(), self.DATA_REC)
+
+    def test_parse_as_lists(self):
+        rec = self.decoder.parse(as_lists=True)
+        self.assertEqual(rec['socket_designation'], ['CPU1', 'CPU2'])
+
+    def test_matches_dmidecode_text(self):
+        fh = open("%s/%s" % (DATA_DIR, 'dmidecode'))
+        data = fh.read()
+        fh.close()
+        self.assertEqual(self.decoder.parse(), DmidecodeParser(data).parse())
+
+    def test_structures(self):
+        structures = self.decoder.get_structures()
+        self.assertEqual(len(structures), 9)
+        self.assertEqual(structures[-1].dmi_type, END_OF_TABLE_TYPE)
+        self.assertEqual([s.handle for s in self.decoder.get_structures(4)], [0x0400, 0x0401])
+
+    def test_unset_string(self):
+        system = self.decoder.get_structures(1)[0]
+        self.assertEqual(system.string(0x06), 'Not Specified')
+
+    def test_memory_devices(self):
+        devices = self.decoder.get_memory_devices()
+        self.assertEqual(len(devices), 2)
+        self.assertEqual(devices[0]['Locator'], 'DIMM_A1 ')
+        self.assertEqual(devices[0]['Size'], '2048 MB')
+        self.assertEqual(devices[0]['Speed'], '1333 MHz')
+        self.assertEqual(devices[1]['Serial Number'], '8A9B1C2E')
+
+    def test_processors(self):
+        procs = self.decoder.get_processors()
+        self.assertEqual([p['Socket Designation'] for p in procs], ['CPU1', 'CPU2'])
+        self.assertEqual(procs[0]['Manufacturer'], 'Intel')
+
+    def test_bad_anchor(self):
+        self.assertRaises(SMBIOSError, EntryPoint, '_XX_' + '\x00' * 27)
+
+    def test_bad_checksum(self):
+        fh = open("%s/sys/firmware/dmi/tables/smbios_entry_point" % self.SYSFS_ROOT, 'rb')
+        data = fh.read()
+        fh.close()
+        data = data[:4] + struct.pack('<B', (ord(data[4]) + 1) & 0xFF) + data[5:]
+        self.assertRaises(SMBIOSError, EntryPoint, data)
+
+class UUIDTests(unittest.TestCase):
+
+    RAW = '\x44\x45\x4C\x4C\x5A\x00\x10\x37\x80\x42\xC7\xC0\x4F\x53\x34\x4A'
+
+    def test_little_endian_fields(self):
+        self.assertEqual(format_uuid(self.RAW, (2, 6)), '4C4C4544-005A-3710-8042-C7C04F53344A')
+
+    def test_old_versions_big_endian(self):
+        self.assertEqual(format_uuid(self.RAW, (2, 5)), '44454C4C-5A00-1037-8042-C7C04F53344A')
+
+    def test_not_present(self):
+        self.assertEqual(format_uuid('\xFF' * 16, (2, 6)), 'Not Present')
+
+    def test_not_settable(self):
+        self.assertEqual(format_uuid('\x00' * 16, (2, 6)), 'Not Settable')
@@ -1,5 +1,47 @@
 """Core PCI module"""
 
+# Class code prefixes for each kind of device
+NIC_CLASSES = ['02']
+STORAGE_CLASSES = ['00', '01', '0c04', '0c06']
+GPU_CLASSES = ['03']
+
+# Usable Gb/s per PCIe lane at each link speed, after line encoding:
+# 8b/10b up to 5GT/s, 128b/130b from 8GT/s, and 242B/256B flits at 64GT/s
+LANE_GBPS = {
+    '2.5GT/s': 2.0,
+    '5GT/s': 4.0,
+    '8GT/s': 8 * 128 / 130.0,
+    '16GT/s': 16 * 128 / 130.0,
+    '32GT/s': 32 * 128 / 130.0,
+    '64GT/s': 64 * 242 / 256.0,
+}
+
+def link_bandwidth(link):
+    """Usable Gb/s of a {'speed': '8GT/s', 'width': 'x8'} link, or None"""
+    if not link or link['speed'] not in LANE_GBPS:
+        return None
+    return LANE_GBPS[link['speed']] * int(link['width'][1:])
+
+def link_degradation(capability, status):
+    """Describe a link that trained below its capability, or return None
+
+    A link with no lanes up (x0) is down rather than degraded, and is not
+    reported.
+    """
+    capable_gbps = link_bandwidth(capability)
+    current_gbps = link_bandwidth(status)
+    if capable_gbps is None or current_gbps is None or not current_gbps:
+        return None
+    if current_gbps >= capable_gbps:
+        return None
+    return {
+        'capable': "%s %s" % (capability['speed'], capability['width']),
+        'current': "%s %s" % (status['speed'], status['width']),
+        'capable_gbps': round(capable_gbps, 1),
+        'current_gbps': round(current_gbps, 1),
+        'lost_gbps': round(capable_gbps - current_gbps, 1),
+    }
+
 class PCIDevice(object):
 
     NONE_VALUE = 'unknown'
@@ -90,6 +132,34 @@ class PCIDevice(object):
     def is_subdevice(self):
         return self.lookup_value('pci_subvendor_id') and self.lookup_value('pci_subdevice_id') or self.lookup_value('pci_device_sub_string')
 
+    def get_kernel_name(self):
+        """Network interface name(s), for NICs joined with their sysfs entries"""
+        return self._fmt(self.lookup_value('kernel_name'))
+
+    def get_driver(self):
+        return self._fmt(self.lookup_value('driver'))
+
+    def get_bios_device(self):
+        return self._fmt(self.lookup_value('bios_device'))
+
+    def _get_link(self, prefix):
+        speed = self.lookup_value(prefix + '_speed')
+        width = self.lookup_value(prefix + '_width')
+        if not speed or not width:
+            return None
+        return {'speed': speed, 'width': width}
+
+    def get_link_capability(self):
+        """The PCIe link speed and width the device supports (LnkCap)"""
+        return self._get_link('pci_device_link_cap')
+
+    def get_link_status(self):
+        """The PCIe link speed and width that was negotiated (LnkSta)"""
+        return self._get_link('pci_device_link_sta')
+
+    def get_link_degradation(self):
+        return link_degradation(self.get_link_capability(), self.get_link_status())
+
     def get_info(self):
 
         if self.is_subdevice():
@@ -111,3 +181,231 @@ class PCIDevice(object):
         rec['subdevice_id'] = self.get_subdevice_id()
 
         return rec
+
+def _name(name, fallback, device_id, none_value):
+    """A device or subdevice name, as PCIDevice.get_device_name works it out"""
+    wrap = None
+    if not name:
+        # Fall back to the lspci -vv device string, marked with dashes
+        name = fallback
+        wrap = '-'
+    if name == 'Device':
+        # lspci's name for an id missing from its pci.ids
+        return '[Device %s]' % device_id
+    if not name:
+        return none_value
+    if wrap:
+        return "%s%s%s" % (wrap, name, wrap)
+    return name
+
+def _link(record, prefix):
+    speed = record.get(prefix + '_speed')
+    width = record.get(prefix + '_width')
+    if not speed or not width:
+        return None
+    return (speed, width)
+
+# The record fields PCIDeviceRecord keeps as they are, in __init__'s order
+_RECORD_KEYS = ('pci_device_class', 'pci_device_bus_id', 'pci_vendor_name', 'pci_vendor_id',
+                'pci_device_id', 'pci_subvendor_name', 'pci_subvendor_id', 'pci_subdevice_id',
+                'kernel_name', 'driver', 'bios_device')
+
+class PCIDeviceRecord(object):
+    """A slotted PCIDevice with every value worked out when it is built
+
+    Each field is normalized once, in __init__, and the record itself is
+    not kept, so lookup_value is not available. Strings are shared through
+    a table, so devices built together by from_records hold one copy of
+    each repeated vendor name, device name, info string, etc.
+    """
+
+    __slots__ = ('pci_class', 'device_bus_id', 'vendor_name', 'device_name',
+                 'vendor_id', 'device_id', 'subvendor_name', 'subdevice_name',
+                 'subvendor_id', 'subdevice_id', 'subdevice', 'pci_id', 'info',
+                 'link_capability', 'link_status', 'kernel_name', 'driver',
+                 'bios_device')
+
+    NONE_VALUE = PCIDevice.NONE_VALUE
+
+    def __init__(self, record, strings=None):
+        if strings is None:
+            strings = {}
+        share = strings.setdefault
+        none = self.NONE_VALUE
+        get = record.get
+
+        # Shared copies of each field, or NONE_VALUE when missing or empty
+        pci_class, bus_id, vendor_name, vendor_id, device_id, subvendor_name, \
+            subvendor_id, subdevice_id, kernel_name, driver, bios_device = \
+            [value and share(value, value) or none for value in
+             [get(key) for key in _RECORD_KEYS]]
+        self.pci_class = pci_class
+        self.device_bus_id = bus_id
+        self.vendor_name = vendor_name
+        self.vendor_id = vendor_id
+        self.device_id = device_id
+        self.subvendor_name = subvendor_name
+        self.subvendor_id = subvendor_id
+        self.subdevice_id = subdevice_id
+        self.kernel_name = kernel_name
+        self.driver = driver
+        self.bios_device = bios_device
+
+        device_name = _name(get('pci_device_name'), get('pci_device_string'), device_id, none)
+        self.device_name = device_name = share(device_name, device_name)
+        subdevice_name = _name(get('pci_subdevice_name'), get('pci_device_sub_string'), subdevice_id, none)
+        self.subdevice_name = subdevice_name = share(subdevice_name, subdevice_name)
+
+        self.subdevice = subdevice = bool(get('pci_subvendor_id') and get('pci_subdevice_id')
+                                          or get('pci_device_sub_string'))
+        pci_id = "%s:%s %s:%s" % (vendor_id, device_id, subvendor_id, subdevice_id)
+        self.pci_id = share(pci_id, pci_id)
+        if subdevice:
+            info = "%s %s (%s %s)" % (subvendor_name, subdevice_name, vendor_name, device_name)
+        else:
+            info = "%s %s" % (vendor_name, device_name)
+        self.info = share(info, info)
+
+        self.link_capability = _link(record, 'pci_device_link_cap')
+        self.link_status = _link(record, 'pci_device_link_sta')
+
+    @classmethod
+    def from_records(cls, records):
+        """Build devices for a list of records, sharing repeated strings"""
+        strings = {}
+        return [cls(record, strings) for record in records]
+
+    def get_pci_class(self):
+        return self.pci_class
+
+    def get_device_name(self):
+        return self.device_name
+
+    def get_device_id(self):
+        return self.device_id
+
+    def get_device_bus_id(self):
+        return self.device_bus_id
+
+    def get_vendor_name(self):
+        return self.vendor_name
+
+    def get_vendor_id(self):
+        return self.vendor_id
+
+    def get_subdevice_name(self):
+        return self.subdevice_name
+
+    def get_subdevice_id(self):
+        return self.subdevice_id
+
+    def get_subvendor_name(self):
+        return self.subvendor_name
+
+    def get_subvendor_id(self):
+        return self.subvendor_id
+
+    def get_pci_id(self):
+        return self.pci_id
+
+    def is_subdevice(self):
+        return self.subdevice
+
+    def get_kernel_name(self):
+        return self.kernel_name
+
+    def get_driver(self):
+        return self.driver
+
+    def get_bios_device(self):
+        return self.bios_device
+
+    def get_info(self):
+        return self.info
+
+    def get_link_capability(self):
+        if self.link_capability is None:
+            return None
+        return {'speed': self.link_capability[0], 'width': self.link_capability[1]}
+
+    def get_link_status(self):
+        if self.link_status is None:
+            return None
+        return {'speed': self.link_status[0], 'width': self.link_status[1]}
+
+    def get_link_degradation(self):
+        return link_degradation(self.get_link_capability(), self.get_link_status())
+
+    def get_rec(self):
+        return {
+            'device_bus_id': self.device_bus_id,
+            'vendor_name': self.vendor_name,
+            'device_name': self.device_name,
+            'vendor_id': self.vendor_id,
+            'device_id': self.device_id,
+            'class': self.pci_class,
+            'subvendor_name': self.subvendor_name,
+            'subdevice_name': self.subdevice_name,
+            'subvendor_id': self.subvendor_id,
+            'subdevice_id': self.subdevice_id,
+        }
+
+# Lengths of the base class, subclass and prog-if prefixes of a class code
+CLASS_PREFIX_LENGTHS = (2, 4, 6)
+
+class PCIDeviceSet(object):
+    """A list of PCI devices indexed by class code
+
+    Devices are grouped by class code, and each code is indexed under its
+    base class ('02'), subclass ('0200') and prog-if ('020000') prefixes,
+    so a filter on those is a lookup. Other prefixes, such as '023', are
+    checked against each distinct code, of which a host has a handful.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        # class code -> positions of its devices
+        self.by_class = {}
+        for position, device in enumerate(self.devices):
+            pci_class = device.get_pci_class()
+            positions = self.by_class.get(pci_class)
+            if positions is None:
+                self.by_class[pci_class] = [position]
+            else:
+                positions.append(position)
+        # base class, subclass or prog-if prefix -> class codes
+        self.by_prefix = {}
+        for pci_class in self.by_class:
+            for length in CLASS_PREFIX_LENGTHS:
+                if len(pci_class) >= length:
+                    self.by_prefix.setdefault(pci_class[:length], []).append(pci_class)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def _classes(self, prefix):
+        if len(prefix) in CLASS_PREFIX_LENGTHS:
+            return self.by_prefix.get(prefix, [])
+        return [pci_class for pci_class in self.by_class if pci_class.startswith(prefix)]
+
+    def filter(self, prefixes):
+        """Devices whose class starts with any of prefixes, in their original order"""
+        classes = set()
+        for prefix in prefixes:
+            classes.update(self._classes(prefix))
+        positions = []
+        for pci_class in classes:
+            positions.extend(self.by_class[pci_class])
+        return [self.devices[position] for position in sorted(positions)]
+
+    def nics(self):
+        return self.filter(NIC_CLASSES)
+
+    def storage(self):
+        return self.filter(STORAGE_CLASSES)
+
+    def gpus(self):
+        return self.filter(GPU_CLASSES)
@@ -1,6 +1,9 @@
 """Module for inspecting PCI device info"""
 
-from hwinfo.util import CommandParser
+import re
+
+from hwinfo.pci import link_degradation
+from hwinfo.util import CommandParser, BUFFER_TYPES, iter_spans, to_bytes
 
 class ParserException(Exception):
     pass
@@ -9,13 +12,185 @@ LABEL_REGEX = r'[\w+\ \.\,\:\+\&\-\/\[\]\(\)]+'
 CODE_REGEX = r'[0-9a-fA-F]{4}'
 BUSID_REGEX = r'[0-9a-fA-F]{2}:[0-9a-fA-F]{2}\.[0-9a-fA-F]'
 
+# lspci -D, and lspci on machines with more than one PCI domain, put the
+# domain in front of the bus id. It is dropped, as parse_items drops it.
+DOMAIN_REGEX = r'[0-9a-fA-F]{4}:'
+
+VV_HEADER_REGEX = re.compile(br'(?:' + to_bytes(DOMAIN_REGEX) + br')?(' + to_bytes(BUSID_REGEX) + br')\ (' + to_bytes(LABEL_REGEX) + br'):\ ([^\n]*)')
+
+CAPABILITY_REGEX = re.compile(r'\[([0-9a-fA-F]+)(?:\ v\d+)?\]\ (.*)')
+
+# Newer lspci adds '(downgraded)' after a LnkSta speed or width
+LINK_REGEX = re.compile(r'Speed\ ([^,\ ]+)[^,]*,\ Width\ (x\d+)')
+
+def parse_link(value):
+    """Pull the speed and width out of a LnkCap or LnkSta value"""
+    m = LINK_REGEX.search(value or '')
+    if m is None:
+        return None
+    return {'speed': m.group(1), 'width': m.group(2)}
+
+def _add_field(fields, line):
+    key, sep, value = line.partition(':')
+    if sep:
+        fields[key] = value.strip()
+        return key
+    return None
+
+def parse_device_details(lines):
+    """Parse the body of an lspci -vv device block
+
+    Top level 'Key: value' lines become fields, 'Region' lines are listed
+    in regions, and each 'Capabilities:' entry gets its own fields. A line
+    indented deeper than the field before it continues that field.
+    """
+    details = {'fields': {}, 'regions': [], 'capabilities': []}
+    fields = details['fields']
+    current = None
+    key = None
+    for line in lines:
+        depth = len(line) - len(line.lstrip('\t'))
+        line = line.strip()
+        if depth <= 1:
+            current = None
+            key = None
+            if line.startswith('Region '):
+                details['regions'].append(line)
+            elif line.startswith('Capabilities: '):
+                m = CAPABILITY_REGEX.match(line[len('Capabilities: '):])
+                if m is not None:
+                    current = {'offset': m.group(1), 'name': m.group(2), 'fields': {}}
+                    details['capabilities'].append(current)
+            else:
+                key = _add_field(fields, line)
+        elif current is not None and depth == 2:
+            key = _add_field(current['fields'], line)
+        elif key is not None:
+            # A continuation of the last field
+            target = current is not None and current['fields'] or fields
+            target[key] = ("%s %s" % (target[key], line)).strip()
+    return details
+
+class LspciVVDevice(object):
+    """One device block of the lspci -vv output
+
+    Only the header line is parsed up front. The rest of the block is kept
+    as offsets into the output, and parsed the first time any detail is
+    asked for.
+    """
+
+    def __init__(self, bus_id, class_name, device_string, data, start, end):
+        self.bus_id = bus_id
+        self.class_name = class_name
+        self.device_string = device_string
+        self._data = data
+        self._start = start
+        self._end = end
+        self._details = None
+
+    @property
+    def details(self):
+        if self._details is None:
+            text = bytes(self._data[self._start:self._end]).decode('utf-8', 'replace')
+            self._details = parse_device_details(text.split('\n'))
+            self._data = None
+        return self._details
+
+    @property
+    def fields(self):
+        return self.details['fields']
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    @property
+    def regions(self):
+        return self.details['regions']
+
+    @property
+    def capabilities(self):
+        return self.details['capabilities']
+
+    def get_capability(self, name):
+        """The first capability whose name starts with name, e.g. 'MSI-X'"""
+        for capability in self.capabilities:
+            if capability['name'].startswith(name):
+                return capability
+        return None
+
+    def get_kernel_driver(self):
+        return self.get('Kernel driver in use')
+
+    def get_kernel_modules(self):
+        return self.get('Kernel modules')
+
+    def _get_express_field(self, key):
+        capability = self.get_capability('Express')
+        if capability is None:
+            return None
+        return capability['fields'].get(key)
+
+    def get_lnkcap(self):
+        return self._get_express_field('LnkCap')
+
+    def get_lnksta(self):
+        return self._get_express_field('LnkSta')
+
+    def get_link_capability(self):
+        """The PCIe link speed and width the device supports (LnkCap)"""
+        return parse_link(self.get_lnkcap())
+
+    def get_link_status(self):
+        """The PCIe link speed and width that was negotiated (LnkSta)"""
+        return parse_link(self.get_lnksta())
+
+    def get_link_degradation(self):
+        return link_degradation(self.get_link_capability(), self.get_link_status())
+
+    def get_msix(self):
+        return self.get_capability('MSI-X')
+
+    def get_rec(self):
+        """The record LspciVVParser.parse_items gives for this device"""
+        rec = {
+            'pci_device_bus_id': self.bus_id,
+            'pci_device_class_name': self.class_name,
+            'pci_device_string': self.device_string,
+        }
+        if 'Subsystem' in self.fields:
+            rec['pci_device_sub_string'] = self.fields['Subsystem']
+        vpd = self.get_capability('Vital Product Data')
+        if vpd is not None and 'Product Name' in vpd['fields']:
+            rec['pci_device_vpd_product_name'] = vpd['fields']['Product Name']
+        for prefix, link in [('pci_device_link_cap', self.get_link_capability()),
+                             ('pci_device_link_sta', self.get_link_status())]:
+            if link is not None:
+                rec[prefix + '_speed'] = link['speed']
+                rec[prefix + '_width'] = link['width']
+        return rec
+
+def iter_vv_devices(data):
+    """Split lspci -vv output into LspciVVDevices, reading only the header lines"""
+    for start, end in iter_spans(data, '\n\n'):
+        m = VV_HEADER_REGEX.match(data, start, end)
+        if m is None:
+            continue
+        bus_id, class_name, device_string = [g.decode('utf-8', 'replace') for g in m.groups()]
+        yield LspciVVDevice(bus_id, class_name, device_string.rstrip('\r'), data, m.end(), end)
+
 class LspciVVParser(CommandParser):
-    """Parser object for the output of lspci -vv"""
+    """Parser object for the output of lspci -vv
+
+    parse_items gives a record per device. get_devices instead gives an
+    LspciVVDevice per device, whose details are only parsed when used.
+    """
 
     ITEM_REGEXS = [
         r'(?P<pci_device_bus_id>(' + BUSID_REGEX + r'))\ (?P<pci_device_class_name>' + LABEL_REGEX + r'):\ (?P<pci_device_string>(.*))\n',
         r'Product\ Name:\ (?P<pci_device_vpd_product_name>(.)*)\n',
         r'Subsystem:\ (?P<pci_device_sub_string>(.)*)\n',
+        r'LnkCap:\s+Port\ \#\d+,\ Speed\ (?P<pci_device_link_cap_speed>[^,\ ]+)[^,]*,\ Width\ (?P<pci_device_link_cap_width>x\d+)',
+        r'LnkSta:\s+Speed\ (?P<pci_device_link_sta_speed>[^,\ ]+)[^,]*,\ Width\ (?P<pci_device_link_sta_width>x\d+)',
     ]
 
     ITEM_SEPERATOR = "\n\n"
@@ -26,6 +201,22 @@ class LspciVVParser(CommandParser):
         'pci_device_string',
     ]
 
+    _devices = None
+
+    def get_devices(self):
+        if self._devices is None:
+            data = self.DATA
+            if not isinstance(data, BUFFER_TYPES):
+                data = to_bytes(data)
+            self._devices = list(iter_vv_devices(data))
+        return list(self._devices)
+
+    def get_device(self, bus_id):
+        for device in self.get_devices():
+            if device.bus_id == bus_id:
+                return device
+        return None
+
 class LspciNParser(CommandParser):
     """Parser object for the output of lspci -n"""
 
@@ -0,0 +1,261 @@
+"""Module for looking up PCI names in a pci.ids database
+
+Parsing the pci.ids text file into dicts takes far longer than the
+lookups a host needs. Instead it is compiled once into a binary index of
+sorted, fixed size entries which is memory-mapped and binary searched.
+Each pci.ids file gets its own index, rebuilt whenever the contents of the
+file it came from change.
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+
+from hwinfo.util import map_file
+
+DEFAULT_PCI_IDS = [
+    '/usr/share/hwdata/pci.ids',
+    '/usr/share/misc/pci.ids',
+    '/usr/share/pci.ids',
+]
+
+DEFAULT_INDEX_DIR = os.path.join('~', '.cache', 'hwinfo')
+
+MAGIC = b'HWPCIID2'
+
+# Magic, then the size and SHA-1 digest of the pci.ids file the index came from
+HEADER = struct.Struct('<8sQ20s')
+
+# Entry count and file offset of each table
+TABLE = struct.Struct('<II')
+
+# Key, then the file offset and length of the name
+ENTRY = struct.Struct('<QII')
+
+# Tables, in the order they are stored
+VENDORS, DEVICES, SUBSYSTEMS, BASE_CLASSES, SUBCLASSES = range(5)
+TABLE_COUNT = 5
+
+class PCIIdsError(Exception):
+    pass
+
+def _split(line):
+    code, name = line.split(None, 1)
+    return int(code, 16), name.strip()
+
+def parse_pci_ids(fh):
+    """Yield (table, key, name) for each entry of a pci.ids file"""
+    vendor = device = base = None
+    in_classes = False
+    for line in fh:
+        line = line.rstrip(b'\r\n')
+        if not line.strip() or line.startswith(b'#'):
+            continue
+        try:
+            if line.startswith(b'C '):
+                in_classes = True
+                base, name = _split(line[2:])
+                yield BASE_CLASSES, base, name
+            elif in_classes and line.startswith(b'\t'):
+                # Programming interfaces, at two tabs, are not looked up
+                if not line.startswith(b'\t\t') and base is not None:
+                    subclass, name = _split(line[1:])
+                    yield SUBCLASSES, base << 8 | subclass, name
+            elif line.startswith(b'\t\t'):
+                if device is not None:
+                    subvendor, rest = line[2:].split(None, 1)
+                    subdevice, name = _split(rest)
+                    key = vendor << 48 | device << 32 | int(subvendor, 16) << 16 | subdevice
+                    yield SUBSYSTEMS, key, name
+            elif line.startswith(b'\t'):
+                if vendor is not None:
+                    device, name = _split(line[1:])
+                    yield DEVICES, vendor << 16 | device, name
+            else:
+                in_classes = False
+                vendor = device = None
+                vendor, name = _split(line)
+                yield VENDORS, vendor, name
+        except ValueError:
+            # Skip lines we can't make sense of rather than failing
+            continue
+
+def read_pci_ids(ids_path):
+    fh = open(ids_path, 'rb')
+    try:
+        return fh.read()
+    finally:
+        fh.close()
+
+def default_index_path(ids_path):
+    """Where the index for ids_path is kept, unique to that file"""
+    digest = hashlib.sha1(os.path.realpath(ids_path)).hexdigest()
+    return os.path.join(os.path.expanduser(DEFAULT_INDEX_DIR), 'pci.ids-%s.idx' % digest[:16])
+
+def compile_index(ids_path):
+    """Compile the pci.ids file at ids_path into the bytes of an index"""
+    ids = read_pci_ids(ids_path)
+    tables = [{} for _ in range(TABLE_COUNT)]
+    for table, key, name in parse_pci_ids(ids.splitlines()):
+        tables[table].setdefault(key, name)
+
+    header = [HEADER.pack(MAGIC, len(ids), hashlib.sha1(ids).digest())]
+    entries = []
+    names = []
+    name_offsets = {}
+    offset = HEADER.size + TABLE.size * TABLE_COUNT
+    strings_offset = offset + ENTRY.size * sum([len(t) for t in tables])
+    for table in tables:
+        header.append(TABLE.pack(len(table), offset))
+        offset += ENTRY.size * len(table)
+        for key in sorted(table):
+            name = table[key]
+            if name not in name_offsets:
+                name_offsets[name] = strings_offset
+                strings_offset += len(name)
+                names.append(name)
+            entries.append(ENTRY.pack(key, name_offsets[name], len(name)))
+    return b''.join(header + entries + names)
+
+def write_index(data, index_path):
+    directory = os.path.dirname(index_path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmppath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        fh = os.fdopen(fd, 'wb')
+        try:
+            fh.write(data)
+        finally:
+            fh.close()
+        os.rename(tmppath, index_path)
+    except EnvironmentError:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+def build_index(ids_path, index_path):
+    """Compile the pci.ids file at ids_path into an index at index_path"""
+    write_index(compile_index(ids_path), index_path)
+
+class PCIIds(object):
+    """Name lookups on a memory-mapped pci.ids index
+
+    Ids are taken as the hex strings found in parsed records, e.g. '14e4'.
+    The index is mapped from index_path, or given as data if it has only
+    been compiled in memory.
+    """
+
+    def __init__(self, index_path, data=None):
+        self.index_path = index_path
+        if data is None:
+            data = map_file(index_path)
+        self.data = data
+        if len(self.data) < HEADER.size + TABLE.size * TABLE_COUNT:
+            raise PCIIdsError("'%s' is not a pci.ids index" % index_path)
+        magic, self.source_size, self.source_digest = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise PCIIdsError("'%s' is not a pci.ids index" % index_path)
+        self.tables = [TABLE.unpack_from(self.data, HEADER.size + TABLE.size * i)
+                       for i in range(TABLE_COUNT)]
+
+    def is_stale(self, ids_path):
+        """Whether the contents of ids_path differ from those indexed"""
+        if os.path.getsize(ids_path) != self.source_size:
+            return True
+        return hashlib.sha1(read_pci_ids(ids_path)).digest() != self.source_digest
+
+    def close(self):
+        if hasattr(self.data, 'close'):
+            self.data.close()
+
+    def _lookup(self, table, key):
+        count, start = self.tables[table]
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_key, offset, length = ENTRY.unpack_from(self.data, start + ENTRY.size * mid)
+            if entry_key < key:
+                lo = mid + 1
+            elif entry_key > key:
+                hi = mid
+            else:
+                return self.data[offset:offset + length].decode('utf-8', 'replace')
+        return None
+
+    def vendor_name(self, vendor):
+        return self._lookup(VENDORS, int(vendor, 16))
+
+    def device_name(self, vendor, device):
+        return self._lookup(DEVICES, int(vendor, 16) << 16 | int(device, 16))
+
+    def subsystem_name(self, vendor, device, subvendor, subdevice):
+        key = int(vendor, 16) << 48 | int(device, 16) << 32 | int(subvendor, 16) << 16 | int(subdevice, 16)
+        return self._lookup(SUBSYSTEMS, key)
+
+    def class_name(self, pci_class):
+        """Name of a class code such as '0200', falling back to its base class"""
+        code = int(pci_class, 16)
+        return self._lookup(SUBCLASSES, code) or self._lookup(BASE_CLASSES, code >> 8)
+
+    def fill_names(self, rec):
+        """Add the names lspci -nnmm would give to a record holding only ids
+
+        Names already in the record are kept. As with lspci, a device or
+        subsystem missing from the database is named 'Device'.
+        """
+        vendor = rec.get('pci_vendor_id')
+        device = rec.get('pci_device_id')
+        subvendor = rec.get('pci_subvendor_id')
+        subdevice = rec.get('pci_subdevice_id')
+
+        if vendor and not rec.get('pci_vendor_name'):
+            name = self.vendor_name(vendor)
+            if name:
+                rec['pci_vendor_name'] = name
+        if vendor and device and not rec.get('pci_device_name'):
+            rec['pci_device_name'] = self.device_name(vendor, device) or 'Device'
+        if subvendor and not rec.get('pci_subvendor_name'):
+            name = self.vendor_name(subvendor)
+            if name:
+                rec['pci_subvendor_name'] = name
+        if vendor and device and subvendor and subdevice and not rec.get('pci_subdevice_name'):
+            rec['pci_subdevice_name'] = self.subsystem_name(vendor, device, subvendor, subdevice) or 'Device'
+        if rec.get('pci_device_class') and not rec.get('pci_device_class_name'):
+            name = self.class_name(rec['pci_device_class'])
+            if name:
+                rec['pci_device_class_name'] = name
+        return rec
+
+def find_pci_ids():
+    for path in DEFAULT_PCI_IDS:
+        if os.path.exists(path):
+            return path
+    raise PCIIdsError("Could not find a pci.ids file in %s" % ', '.join(DEFAULT_PCI_IDS))
+
+def load_pci_ids(ids_path=None, index_path=None):
+    """Open the index for a pci.ids file, building it first if needed
+
+    If the index can't be written, e.g. to a read-only home directory, it
+    is used from memory instead.
+    """
+    if ids_path is None:
+        ids_path = find_pci_ids()
+    if index_path is None:
+        index_path = default_index_path(ids_path)
+    else:
+        index_path = os.path.expanduser(index_path)
+    try:
+        pci_ids = PCIIds(index_path)
+        if not pci_ids.is_stale(ids_path):
+            return pci_ids
+        pci_ids.close()
+    except (EnvironmentError, PCIIdsError):
+        pass
+    data = compile_index(ids_path)
+    try:
+        write_index(data, index_path)
+    except EnvironmentError:
+        return PCIIds(None, data)
+    return PCIIds(index_path)
@@ -0,0 +1,153 @@
+"""Module for enumerating PCI devices and NICs from sysfs, without running lspci"""
+
+import os
+
+SYSFS_PCI_DIR = 'sys/bus/pci/devices'
+
+SYSFS_NET_DIR = 'sys/class/net'
+
+# (record key, sysfs attribute) for the ids of every device
+ID_FIELDS = [
+    ('pci_vendor_id', 'vendor'),
+    ('pci_device_id', 'device'),
+]
+
+SUBSYSTEM_FIELDS = [
+    ('pci_subvendor_id', 'subsystem_vendor'),
+    ('pci_subdevice_id', 'subsystem_device'),
+]
+
+def read_attr(path, attr):
+    fh = open(os.path.join(path, attr), 'r')
+    value = fh.read().strip()
+    fh.close()
+    return value
+
+def format_id(value):
+    """Turn a sysfs id such as '0x14e4' into the form lspci prints, '14e4'"""
+    return value[2:].lower().zfill(4)
+
+def format_bus_id(address):
+    """Drop the PCI domain when it is 0000, as lspci does"""
+    if address.startswith('0000:'):
+        return address[5:]
+    return address
+
+def get_device_record(path, address):
+    """Build the record LspciNNMMParser would give, minus the names
+
+    The names are not held in sysfs, and are left out of the record.
+    """
+    rec = {'pci_device_bus_id': format_bus_id(address)}
+    for key, attr in ID_FIELDS:
+        rec[key] = format_id(read_attr(path, attr))
+    # The class attribute is base class, sub class and prog-if: 0x020000
+    rec['pci_device_class'] = read_attr(path, 'class')[2:6].lower()
+    try:
+        subsystem = [(key, format_id(read_attr(path, attr))) for key, attr in SUBSYSTEM_FIELDS]
+    except IOError:
+        # Not every kind of device has subsystem ids
+        return rec
+    # lspci leaves out the subsystem when it is all zeros
+    if [value for _, value in subsystem if value != '0000']:
+        rec.update(subsystem)
+    return rec
+
+def iter_device_records(root='/'):
+    """Yield a record for each device under root, in bus order"""
+    devices_dir = os.path.join(root, SYSFS_PCI_DIR)
+    for address in sorted(os.listdir(devices_dir)):
+        yield get_device_record(os.path.join(devices_dir, address), address)
+
+def get_device_records(root='/'):
+    return list(iter_device_records(root))
+
+def link_name(path):
+    """The name a sysfs symlink points to, e.g. 'igb' for a driver link"""
+    return os.path.basename(os.readlink(path))
+
+def get_nic_pci_address(device_path):
+    """The PCI address behind a network interface's device link, or None
+
+    A virtio NIC's device is a virtio device, whose parent is the PCI
+    function. NICs on other buses, e.g. USB, are not PCI devices.
+    """
+    try:
+        subsystem = link_name(os.path.join(device_path, 'subsystem'))
+    except OSError:
+        return None
+    path = os.path.realpath(device_path)
+    if subsystem == 'virtio':
+        path = os.path.dirname(path)
+    elif subsystem != 'pci':
+        return None
+    return os.path.basename(path)
+
+def get_onboard_index(device_path):
+    """The firmware's index for an onboard device, or None
+
+    Only devices the firmware lists as onboard have an acpi_index, and
+    biosdevname names them em<index>. NICs in slots are named from the
+    slot, which sysfs doesn't give, so they get no index here.
+    """
+    try:
+        index = int(read_attr(device_path, 'acpi_index'))
+    except (IOError, ValueError):
+        return None
+    if index < 1:
+        return None
+    return index
+
+def get_nic_record(net_path, name):
+    """Build the fields BiosdevnameDParser gives that sysfs can answer"""
+    device_path = os.path.join(net_path, 'device')
+    address = get_nic_pci_address(device_path)
+    if address is None:
+        return None
+    rec = {
+        'kernel_name': name,
+        'bus_info': address,
+    }
+    try:
+        rec['driver'] = link_name(os.path.join(device_path, 'driver'))
+    except OSError:
+        pass
+    try:
+        rec['assigned_mac'] = read_attr(net_path, 'address').upper()
+    except IOError:
+        pass
+    index = get_onboard_index(device_path)
+    if index is not None:
+        rec['bios_device'] = 'em%d' % index
+    return rec
+
+def get_nic_records(root='/'):
+    """Map PCI bus ids to the fields of the network interfaces on them
+
+    Where a function has several interfaces, e.g. one per port, their
+    fields are joined with ', '.
+    """
+    net_dir = os.path.join(root, SYSFS_NET_DIR)
+    nics = {}
+    for name in sorted(os.listdir(net_dir)):
+        rec = get_nic_record(os.path.join(net_dir, name), name)
+        if rec is None:
+            continue
+        bus_id = format_bus_id(rec['bus_info'])
+        if bus_id in nics:
+            for k, v in rec.items():
+                if k in nics[bus_id] and nics[bus_id][k] != v:
+                    nics[bus_id][k] = "%s, %s" % (nics[bus_id][k], v)
+                else:
+                    nics[bus_id][k] = v
+        else:
+            nics[bus_id] = rec
+    return nics
+
+def join_nic_records(recs, nics):
+    """Add the NIC fields for each PCI record's bus id to the record"""
+    for rec in recs:
+        nic = nics.get(rec.get('pci_device_bus_id'))
+        if nic is not None:
+            rec.update(nic)
+    return recs
@@ -70,6 +70,99 @@ class TestMultiDeviceVVParse(unittest.TestCase):
                 found = True
         self.assertEqual(found, True)
 
+class TestLazyVVDevices(unittest.TestCase):
+
+    SAMPLE_DEVICE_FILE = "%s/single_network_device_lspci_vv" % DATA_DIR
+    MULTI_DEVICE_FILE = "%s/lspci_vv" % DATA_DIR
+    DOMAIN_DEVICE_FILE = "%s/lspci_vv_domains" % DATA_DIR
+
+    def _load(self, filename):
+        fh = open(filename)
+        data = fh.read()
+        fh.close()
+        return LspciVVParser(data)
+
+    def setUp(self):
+        self.parser = self._load(self.SAMPLE_DEVICE_FILE)
+        self.device = self.parser.get_devices()[0]
+
+    def test_header(self):
+        self.assertEqual(self.device.bus_id, '02:00.0')
+        self.assertEqual(self.device.class_name, 'Ethernet controller')
+        self.assertEqual(self.device.device_string,
+                         'Broadcom Corporation NetXtreme II BCM5716 Gigabit Ethernet (rev 20)')
+
+    def test_details_parsed_on_demand(self):
+        self.assertEqual(self.device._details, None)
+        self.assertEqual(self.device.get_kernel_driver(), 'bnx2')
+        self.assertTrue(self.device.details is self.device.details)
+
+    def test_kernel_modules(self):
+        self.assertEqual(self.device.get_kernel_modules(), 'bnx2')
+
+    def test_regions(self):
+        self.assertEqual(self.device.regions,
+                         ['Region 0: Memory at ea000000 (64-bit, non-prefetchable) [size=32M]'])
+
+    def test_capabilities(self):
+        offsets = [c['offset'] for c in self.device.capabilities]
+        self.assertEqual(offsets, ['48', '50', '58', 'a0', 'ac', '100', '110', '150', '160'])
+
+    def test_link(self):
+        self.assertEqual(parse_link(self.device.get_lnkcap()), {'speed': '2.5GT/s', 'width': 'x4'})
+        self.assertEqual(parse_link(self.device.get_lnksta()), {'speed': '2.5GT/s', 'width': 'x2'})
+
+    def test_link_degradation(self):
+        rec = self.device.get_link_degradation()
+        self.assertEqual(rec['capable'], '2.5GT/s x4')
+        self.assertEqual(rec['current'], '2.5GT/s x2')
+        device = self._load(self.MULTI_DEVICE_FILE).get_devices()[0]
+        self.assertEqual(device.get_link_degradation(), None)
+
+    def test_msix(self):
+        msix = self.device.get_msix()
+        self.assertEqual(msix['name'], 'MSI-X: Enable+ Count=9 Masked-')
+        self.assertEqual(msix['fields']['Vector table'], 'BAR=0 offset=0000c000')
+
+    def test_continuation_lines(self):
+        lnkcap = self.device.get_lnkcap()
+        self.assertTrue(lnkcap.endswith('ClockPM- Surprise- LLActRep- BwNot-'))
+
+    def test_get_device(self):
+        self.assertTrue(self.parser.get_device('02:00.0') is self.device)
+        self.assertEqual(self.parser.get_device('03:00.0'), None)
+
+    def test_recs_match_parse_items(self):
+        for filename in [self.SAMPLE_DEVICE_FILE, self.MULTI_DEVICE_FILE]:
+            parser = self._load(filename)
+            self.assertEqual([d.get_rec() for d in parser.get_devices()], parser.parse_items())
+
+    def test_domain_prefixed_headers(self):
+        parser = self._load(self.DOMAIN_DEVICE_FILE)
+        devices = parser.get_devices()
+        self.assertEqual(len(devices), 58)
+        self.assertEqual(len(devices), len(parser.parse_items()))
+        self.assertEqual(devices[0].bus_id, '00:00.0')
+        self.assertEqual([d.get_rec() for d in devices],
+                         [d.get_rec() for d in self._load(self.MULTI_DEVICE_FILE).get_devices()])
+
+    def test_downgraded_link(self):
+        value = 'Speed 8GT/s (downgraded), Width x8 (downgraded)'
+        self.assertEqual(parse_link(value), {'speed': '8GT/s', 'width': 'x8'})
+
+    def test_link_fields_in_parse_items(self):
+        rec = self.parser.parse_items()[0]
+        self.assertEqual(rec['pci_device_link_cap_speed'], '2.5GT/s')
+        self.assertEqual(rec['pci_device_link_cap_width'], 'x4')
+        self.assertEqual(rec['pci_device_link_sta_speed'], '2.5GT/s')
+        self.assertEqual(rec['pci_device_link_sta_width'], 'x2')
+
+    def test_no_express_capability(self):
+        parser = self._load(self.MULTI_DEVICE_FILE)
+        device = parser.get_devices()[0]
+        self.assertEqual(device.get_lnksta(), None)
+        self.assertEqual(parse_link(device.get_lnksta()), None)
+
 class TestSingleDeviceNParse(unittest.TestCase):
 
     DATA = "ff:10.5 0880: 8086:0eb5 (rev 04)"
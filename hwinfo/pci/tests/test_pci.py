@@ -68,3 +68,142 @@ class TestPCIDeviceObject(unittest.TestCase):
     def test_get_device_class(self):
         pci_class = self.device.get_pci_class()
         self.assertEqual(pci_class, '0200')
+
+
+class TestPCIDeviceRecord(TestPCIDeviceObject):
+
+    def setUp(self):
+        self.device = PCIDeviceRecord(self.DEVICE_REC)
+
+    def test_get_rec_matches(self):
+        self.assertEqual(self.device.get_rec(), PCIDevice(self.DEVICE_REC).get_rec())
+
+    def test_slotted(self):
+        self.assertFalse(hasattr(self.device, '__dict__'))
+        self.assertFalse(hasattr(self.device, 'rec'))
+
+    def test_from_records_shares_strings(self):
+        first = dict((k, ''.join(v)) for k, v in self.DEVICE_REC.items())
+        other = dict((k, ''.join(v)) for k, v in self.DEVICE_REC.items())
+        other['pci_device_bus_id'] = '02:00.1'
+        devices = PCIDeviceRecord.from_records([first, other])
+        self.assertEqual([d.get_device_bus_id() for d in devices], ['02:00.0', '02:00.1'])
+        for name in ['get_info', 'get_pci_id', 'get_vendor_name', 'get_device_name', 'get_subdevice_name']:
+            self.assertTrue(getattr(devices[0], name)() is getattr(devices[1], name)(), name)
+
+    def test_nic_fields(self):
+        rec = dict(self.DEVICE_REC, kernel_name='eth0', driver='bnx2', bios_device='em1')
+        for device in [PCIDevice(rec), PCIDeviceRecord(rec)]:
+            self.assertEqual(device.get_kernel_name(), 'eth0')
+            self.assertEqual(device.get_driver(), 'bnx2')
+            self.assertEqual(device.get_bios_device(), 'em1')
+
+    def test_record_not_kept(self):
+        rec = dict(self.DEVICE_REC)
+        device = PCIDeviceRecord(rec)
+        rec['pci_vendor_name'] = 'changed'
+        self.assertEqual(device.get_vendor_name(), 'Broadcom Corporation')
+        self.assertEqual(device.get_rec(), PCIDevice(self.DEVICE_REC).get_rec())
+
+    def test_device_string_fallback(self):
+        rec = {'pci_device_string': 'Ethernet', 'pci_device_sub_string': 'Device', 'pci_subdevice_id': '02a3'}
+        for name in ['get_device_name', 'get_subdevice_name', 'get_info', 'get_pci_id']:
+            self.assertEqual(getattr(PCIDeviceRecord(rec), name)(), getattr(PCIDevice(rec), name)(), name)
+        self.assertTrue(PCIDeviceRecord(rec).is_subdevice())
+
+    def test_missing_values(self):
+        device = PCIDeviceRecord({'pci_device_bus_id': '00:00.0'})
+        self.assertEqual(device.get_vendor_name(), 'unknown')
+        self.assertFalse(device.is_subdevice())
+
+
+class TestPCIDeviceSet(unittest.TestCase):
+
+    CLASSES = ['0230', '0340', '0210', '0100', '0c04', '060400']
+
+    def setUp(self):
+        devices = [PCIDeviceRecord({'pci_device_class': c, 'pci_device_bus_id': '00:0%d.0' % i})
+                   for i, c in enumerate(self.CLASSES)]
+        self.devices = PCIDeviceSet(devices)
+
+    def _classes(self, devices):
+        return [d.get_pci_class() for d in devices]
+
+    def test_len(self):
+        self.assertEqual(len(self.devices), 6)
+
+    def test_filter_base_class(self):
+        self.assertEqual(self._classes(self.devices.filter(['02'])), ['0230', '0210'])
+
+    def test_filter_any_prefix(self):
+        self.assertEqual(self._classes(self.devices.filter(['023'])), ['0230'])
+        self.assertEqual(len(self.devices.filter(['0'])), 6)
+
+    def test_filter_prog_if(self):
+        self.assertEqual(self._classes(self.devices.filter(['060400'])), ['060400'])
+
+    def test_filter_keeps_order_without_duplicates(self):
+        self.assertEqual(self._classes(self.devices.filter(['0210', '02', '0c04'])),
+                         ['0230', '0210', '0c04'])
+
+    def test_prefix_index(self):
+        self.assertEqual(sorted(self.devices.by_prefix['02']), ['0210', '0230'])
+        self.assertEqual(self.devices.by_prefix['0604'], ['060400'])
+        self.assertEqual(self.devices.by_prefix['060400'], ['060400'])
+        self.assertFalse('023' in self.devices.by_prefix)
+
+    def test_filter_match_none(self):
+        self.assertEqual(self.devices.filter(['0234']), [])
+
+    def test_nics(self):
+        self.assertEqual(self._classes(self.devices.nics()), ['0230', '0210'])
+
+    def test_storage(self):
+        self.assertEqual(self._classes(self.devices.storage()), ['0100', '0c04'])
+
+    def test_gpus(self):
+        self.assertEqual(self._classes(self.devices.gpus()), ['0340'])
+
+
+class TestLinkDegradation(unittest.TestCase):
+
+    DEVICE_REC = {
+        'pci_device_bus_id': '41:00.0',
+        'pci_device_link_cap_speed': '16GT/s',
+        'pci_device_link_cap_width': 'x16',
+        'pci_device_link_sta_speed': '8GT/s',
+        'pci_device_link_sta_width': 'x8',
+    }
+
+    def test_link_capability(self):
+        device = PCIDevice(self.DEVICE_REC)
+        self.assertEqual(device.get_link_capability(), {'speed': '16GT/s', 'width': 'x16'})
+        self.assertEqual(device.get_link_status(), {'speed': '8GT/s', 'width': 'x8'})
+
+    def test_degraded(self):
+        rec = PCIDevice(self.DEVICE_REC).get_link_degradation()
+        self.assertEqual(rec['capable'], '16GT/s x16')
+        self.assertEqual(rec['current'], '8GT/s x8')
+        self.assertEqual(rec['capable_gbps'], 252.1)
+        self.assertEqual(rec['current_gbps'], 63.0)
+        self.assertEqual(rec['lost_gbps'], 189.0)
+
+    def test_record_matches(self):
+        self.assertEqual(PCIDeviceRecord(self.DEVICE_REC).get_link_degradation(),
+                         PCIDevice(self.DEVICE_REC).get_link_degradation())
+
+    def test_full_link(self):
+        rec = dict(self.DEVICE_REC, pci_device_link_sta_speed='16GT/s', pci_device_link_sta_width='x16')
+        self.assertEqual(PCIDevice(rec).get_link_degradation(), None)
+
+    def test_link_down(self):
+        rec = dict(self.DEVICE_REC, pci_device_link_sta_width='x0')
+        self.assertEqual(PCIDevice(rec).get_link_degradation(), None)
+
+    def test_no_link(self):
+        device = PCIDevice({'pci_device_bus_id': '00:00.0'})
+        self.assertEqual(device.get_link_capability(), None)
+        self.assertEqual(device.get_link_degradation(), None)
+
+    def test_unknown_speed(self):
+        self.assertEqual(link_bandwidth({'speed': 'unknown', 'width': 'x1'}), None)
@@ -0,0 +1,127 @@
+"""Unit tests for the pci.ids name database"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+from mock import patch
+
+from hwinfo.pci.pciids import *
+from hwinfo.pci.lspci import LspciNNMMParser
+
+DATA_DIR = 'hwinfo/pci/tests/data'
+
+class TestPCIIds(unittest.TestCase):
+
+    IDS_FILE = "%s/pci.ids" % DATA_DIR
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmpdir, 'pci.ids.idx')
+        self.pci_ids = load_pci_ids(self.IDS_FILE, self.index)
+
+    def tearDown(self):
+        self.pci_ids.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_vendor_name(self):
+        self.assertEqual(self.pci_ids.vendor_name('14e4'), 'Broadcom Corporation')
+
+    def test_device_name(self):
+        self.assertEqual(self.pci_ids.device_name('14e4', '163b'),
+                         'NetXtreme II BCM5716 Gigabit Ethernet')
+
+    def test_subsystem_name(self):
+        self.assertEqual(self.pci_ids.subsystem_name('1000', '0058', '1028', '1f0f'),
+                         'SAS 6/iR Integrated Blades RAID Controller')
+
+    def test_class_name(self):
+        self.assertEqual(self.pci_ids.class_name('0200'), 'Ethernet controller')
+
+    def test_class_name_falls_back_to_base(self):
+        self.assertEqual(self.pci_ids.class_name('0c80'), 'Serial bus controller')
+
+    def test_unknown(self):
+        self.assertEqual(self.pci_ids.vendor_name('abcd'), None)
+        self.assertEqual(self.pci_ids.device_name('8086', 'ffff'), None)
+
+    def test_uppercase_ids(self):
+        self.assertEqual(self.pci_ids.device_name('8086', 'D130'), 'Core Processor DMI')
+
+    def test_fill_names_matches_lspci(self):
+        fh = open("%s/lspci-nnmm" % DATA_DIR)
+        data = fh.read()
+        fh.close()
+        for expected in LspciNNMMParser(data).parse_items():
+            rec = dict((k, v) for k, v in expected.items()
+                       if v is not None and not k.endswith('_name'))
+            self.assertEqual(self.pci_ids.fill_names(rec),
+                             dict((k, v) for k, v in expected.items() if v is not None))
+
+    def test_fill_names_keeps_existing(self):
+        rec = {'pci_vendor_id': '14e4', 'pci_vendor_name': 'Broadcom'}
+        self.assertEqual(self.pci_ids.fill_names(rec)['pci_vendor_name'], 'Broadcom')
+
+    def test_index_reused(self):
+        mtime = os.stat(self.index).st_mtime
+        load_pci_ids(self.IDS_FILE, self.index).close()
+        self.assertEqual(os.stat(self.index).st_mtime, mtime)
+
+    def test_index_rebuilt_when_stale(self):
+        ids = os.path.join(self.tmpdir, 'pci.ids')
+        shutil.copy(self.IDS_FILE, ids)
+        load_pci_ids(ids, self.index).close()
+        fh = open(ids, 'a')
+        fh.write('abcd  Example Vendor\n')
+        fh.close()
+        pci_ids = load_pci_ids(ids, self.index)
+        self.assertEqual(pci_ids.vendor_name('abcd'), 'Example Vendor')
+        pci_ids.close()
+
+    def test_index_rebuilt_when_contents_change(self):
+        ids = os.path.join(self.tmpdir, 'pci.ids')
+        shutil.copy(self.IDS_FILE, ids)
+        st = os.stat(ids)
+        load_pci_ids(ids, self.index).close()
+        # Same size and mtime, different vendor
+        data = open(ids, 'rb').read().replace('Broadcom Corporation', 'Broadcom CorporatioN')
+        fh = open(ids, 'wb')
+        fh.write(data)
+        fh.close()
+        os.utime(ids, (st.st_atime, st.st_mtime))
+        pci_ids = load_pci_ids(ids, self.index)
+        self.assertEqual(pci_ids.vendor_name('14e4'), 'Broadcom CorporatioN')
+        pci_ids.close()
+
+    def test_index_per_ids_file(self):
+        ids = os.path.join(self.tmpdir, 'pci.ids')
+        shutil.copy(self.IDS_FILE, ids)
+        self.assertNotEqual(default_index_path(ids), default_index_path(self.IDS_FILE))
+        self.assertEqual(default_index_path(ids),
+                         default_index_path(os.path.join(self.tmpdir, '.', 'pci.ids')))
+
+    @patch('tempfile.mkstemp')
+    def test_unwritable_index_used_from_memory(self, mkstemp):
+        mkstemp.side_effect = OSError(13, "Permission denied")
+        pci_ids = load_pci_ids(self.IDS_FILE, os.path.join(self.tmpdir, 'other.idx'))
+        self.assertEqual(pci_ids.index_path, None)
+        self.assertEqual(pci_ids.vendor_name('14e4'), 'Broadcom Corporation')
+        self.assertEqual(os.listdir(self.tmpdir), ['pci.ids.idx'])
+
+    @patch('os.rename')
+    def test_failed_write_cleaned_up(self, rename):
+        rename.side_effect = OSError(28, "No space left on device")
+        pci_ids = load_pci_ids(self.IDS_FILE, os.path.join(self.tmpdir, 'other.idx'))
+        self.assertEqual(pci_ids.vendor_name('14e4'), 'Broadcom Corporation')
+        self.assertEqual(os.listdir(self.tmpdir), ['pci.ids.idx'])
+
+    def test_bad_index(self):
+        fh = open(self.index, 'wb')
+        fh.write('x' * 128)
+        fh.close()
+        self.assertRaises(PCIIdsError, PCIIds, self.index)
+
+    def test_skips_bad_lines(self):
+        lines = ['8086  Intel Corporation\n', 'zzzz  Not a vendor\n', '\t1234  Orphan\n', '\t\tjunk\n']
+        self.assertEqual(list(parse_pci_ids(lines)), [(VENDORS, 0x8086, 'Intel Corporation')])
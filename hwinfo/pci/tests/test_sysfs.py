@@ -0,0 +1,163 @@
+"""Unit tests for the sysfs PCI module"""
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from hwinfo.pci.sysfs import *
+from hwinfo.pci.lspci import LspciNNMMParser
+
+DATA_DIR = 'hwinfo/pci/tests/data'
+
+def write_device(root, address, attrs):
+    path = os.path.join(root, SYSFS_PCI_DIR, address)
+    os.makedirs(path)
+    for attr, value in attrs.items():
+        fh = open(os.path.join(path, attr), 'w')
+        fh.write(value + '\n')
+        fh.close()
+
+def lspci_records():
+    fh = open("%s/lspci-nnmm" % DATA_DIR)
+    data = fh.read()
+    fh.close()
+    return LspciNNMMParser(data).parse_items()
+
+class TestSysfsDevices(unittest.TestCase):
+
+    NAME_KEYS = ['pci_device_class_name', 'pci_vendor_name', 'pci_device_name',
+                 'pci_subvendor_name', 'pci_subdevice_name']
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # Mirror the lspci fixture in a fake sysfs tree
+        for rec in lspci_records():
+            attrs = {
+                'vendor': '0x%s' % rec['pci_vendor_id'],
+                'device': '0x%s' % rec['pci_device_id'],
+                'class': '0x%s00' % rec['pci_device_class'],
+                'subsystem_vendor': '0x%s' % (rec.get('pci_subvendor_id') or '0000'),
+                'subsystem_device': '0x%s' % (rec.get('pci_subdevice_id') or '0000'),
+            }
+            write_device(self.root, '0000:%s' % rec['pci_device_bus_id'], attrs)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_lspci_ids(self):
+        expected = []
+        for rec in lspci_records():
+            for key in self.NAME_KEYS:
+                rec.pop(key, None)
+            # lspci gives None for an empty subsystem, sysfs leaves it out
+            expected.append(dict((k, v) for k, v in rec.items() if v is not None))
+        self.assertEqual(get_device_records(self.root), expected)
+
+    def test_record(self):
+        rec = get_device_records(self.root)[0]
+        self.assertEqual(rec, {
+            'pci_device_bus_id': '00:00.0',
+            'pci_device_class': '0600',
+            'pci_vendor_id': '8086',
+            'pci_device_id': 'd130',
+            'pci_subvendor_id': '1028',
+            'pci_subdevice_id': '02a3',
+        })
+
+    def test_missing_subsystem(self):
+        write_device(self.root, '0000:ff:1f.0',
+                     {'vendor': '0x8086', 'device': '0x2c70', 'class': '0x060000'})
+        rec = get_device_records(self.root)[-1]
+        self.assertEqual(rec['pci_device_bus_id'], 'ff:1f.0')
+        self.assertFalse('pci_subvendor_id' in rec)
+
+    def test_domain_kept(self):
+        write_device(self.root, '0001:00:00.0',
+                     {'vendor': '0x8086', 'device': '0x2c70', 'class': '0x060000'})
+        recs = get_device_records(self.root)
+        self.assertEqual(recs[-1]['pci_device_bus_id'], '0001:00:00.0')
+
+    def test_format_id(self):
+        self.assertEqual(format_id('0x14E4'), '14e4')
+
+def make_link(target, link):
+    if not os.path.isdir(os.path.dirname(link)):
+        os.makedirs(os.path.dirname(link))
+    os.symlink(target, link)
+
+def write_nic(root, name, device, subsystem, driver=None, acpi_index=None, mac=None):
+    """Add a network interface to a fake tree, as the kernel lays it out"""
+    device_dir = os.path.join(root, 'sys/devices', device)
+    os.makedirs(device_dir)
+    depth = device.count('/') + 2
+    make_link('../' * depth + 'bus/' + subsystem, os.path.join(device_dir, 'subsystem'))
+    if driver:
+        make_link('../' * depth + 'bus/%s/drivers/%s' % (subsystem, driver),
+                  os.path.join(device_dir, 'driver'))
+    if acpi_index:
+        fh = open(os.path.join(device_dir, 'acpi_index'), 'w')
+        fh.write(acpi_index + '\n')
+        fh.close()
+    net_dir = os.path.join(root, SYSFS_NET_DIR, name)
+    make_link('../../../devices/' + device, os.path.join(net_dir, 'device'))
+    if mac:
+        fh = open(os.path.join(net_dir, 'address'), 'w')
+        fh.write(mac + '\n')
+        fh.close()
+
+class TestSysfsNics(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_nic(self.root, 'eth0', 'pci0000:00/0000:06:00.0', 'pci', 'igb', '1', '6c:ae:8b:22:b7:ca')
+        write_nic(self.root, 'eth1', 'pci0000:00/0000:06:00.1', 'pci', 'igb', '2')
+        write_nic(self.root, 'eth2', 'pci0000:00/0000:00:04.0/virtio3', 'virtio', 'virtio_net')
+        write_nic(self.root, 'usb0', 'pci0000:00/0000:00:14.0/usb1/1-1/1-1:1.0', 'usb', 'cdc_ether')
+        os.makedirs(os.path.join(self.root, SYSFS_NET_DIR, 'lo'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_nic_records(self):
+        nics = get_nic_records(self.root)
+        self.assertEqual(sorted(nics.keys()), ['00:04.0', '06:00.0', '06:00.1'])
+        self.assertEqual(nics['06:00.0'], {
+            'kernel_name': 'eth0',
+            'bus_info': '0000:06:00.0',
+            'driver': 'igb',
+            'assigned_mac': '6C:AE:8B:22:B7:CA',
+            'bios_device': 'em1',
+        })
+
+    def test_virtio_nic(self):
+        nic = get_nic_records(self.root)['00:04.0']
+        self.assertEqual(nic['kernel_name'], 'eth2')
+        self.assertEqual(nic['driver'], 'virtio_net')
+        self.assertFalse('bios_device' in nic)
+
+    def test_slot_nic(self):
+        write_nic(self.root, 'eth4', 'pci0000:00/0000:00:01.0/0000:81:00.0', 'pci', 'ixgbe')
+        nic = get_nic_records(self.root)['81:00.0']
+        self.assertEqual(nic['kernel_name'], 'eth4')
+        self.assertFalse('bios_device' in nic)
+
+    def test_invalid_acpi_index(self):
+        write_nic(self.root, 'eth4', 'pci0000:00/0000:81:00.0', 'pci', 'ixgbe', '0')
+        write_nic(self.root, 'eth5', 'pci0000:00/0000:82:00.0', 'pci', 'ixgbe', 'bogus')
+        nics = get_nic_records(self.root)
+        self.assertFalse('bios_device' in nics['81:00.0'])
+        self.assertFalse('bios_device' in nics['82:00.0'])
+
+    def test_ports_on_one_function(self):
+        make_link('../../../devices/pci0000:00/0000:06:00.0', os.path.join(self.root, SYSFS_NET_DIR, 'eth3', 'device'))
+        nic = get_nic_records(self.root)['06:00.0']
+        self.assertEqual(nic['kernel_name'], 'eth0, eth3')
+        self.assertEqual(nic['driver'], 'igb')
+
+    def test_join(self):
+        recs = [{'pci_device_bus_id': '06:00.1'}, {'pci_device_bus_id': '07:00.0'}]
+        join_nic_records(recs, get_nic_records(self.root))
+        self.assertEqual(recs[0]['kernel_name'], 'eth1')
+        self.assertEqual(recs[0]['bios_device'], 'em2')
+        self.assertEqual(recs[1], {'pci_device_bus_id': '07:00.0'})
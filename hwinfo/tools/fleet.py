@@ -0,0 +1,132 @@
+"""Module for scanning many hosts at once
+
+Hosts are read from the list lazily and handed to a fixed number of
+worker threads through a bounded queue, so memory stays the same however
+long the list is. Each host's result is written as one JSON line as soon
+as its scan finishes.
+"""
+
+import json
+import sys
+import threading
+import time
+from Queue import Queue
+
+DEFAULT_WORKERS = 16
+
+def read_host_list(fh):
+    """Yield the host addresses in fh, one per line, skipping '#' comments"""
+    for line in fh:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield line
+
+class FleetProgress(object):
+    """Reports each host's scan time, and a summary at the end"""
+
+    def __init__(self, out=sys.stderr, clock=time.time):
+        self.out = out
+        self.clock = clock
+        self.start = clock()
+        self.done = 0
+        self.failed = 0
+
+    def host_done(self, rec):
+        self.done += 1
+        if 'error' in rec:
+            self.failed += 1
+            status = "failed: %s" % rec['error']
+        else:
+            status = "ok"
+        self.out.write("[%d] %s %s in %.2fs\n" % (self.done, rec['host'], status, rec['seconds']))
+        self.out.flush()
+
+    def finish(self):
+        self.out.write("Scanned %d hosts (%d failed) in %.2fs\n"
+                       % (self.done, self.failed, self.clock() - self.start))
+        self.out.flush()
+
+def error_message(e):
+    """e's message, or its class name if it has none, as plain ASCII"""
+    try:
+        message = unicode(e)
+    except UnicodeError:
+        message = str(e).decode('utf-8', 'replace')
+    return message.encode('ascii', 'backslashreplace') or e.__class__.__name__
+
+def scan_one(scan, address, clock=time.time):
+    """Run scan(address), returning its result or error along with the time taken"""
+    start = clock()
+    rec = {'host': address}
+    try:
+        rec['hwinfo'] = scan(address)
+    except Exception, e:
+        rec['error'] = error_message(e)
+    rec['seconds'] = round(clock() - start, 3)
+    return rec
+
+def scan_fleet(addresses, scan, out, workers=DEFAULT_WORKERS, progress=None):
+    """Call scan(address) for each address, at most workers at a time
+
+    Each result is written to out as a JSON line as soon as it is ready,
+    so lines come out in the order hosts finish rather than the order
+    given. Returns the number of hosts that failed.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1, not %s" % workers)
+    queue = Queue(maxsize=workers * 2)
+    lock = threading.Lock()
+    failed = [0]
+
+    def worker():
+        while True:
+            address = queue.get()
+            if address is None:
+                queue.task_done()
+                return
+            # Whatever goes wrong, the worker carries on with the next host,
+            # or the feeder would block on the full queue for ever
+            rec = None
+            try:
+                rec = scan_one(scan, address)
+                try:
+                    line = json.dumps(rec, separators=(',', ':'))
+                except (TypeError, ValueError), e:
+                    # e.g. output that isn't UTF-8, or can't be put in JSON
+                    rec = {'host': address, 'error': error_message(e), 'seconds': rec['seconds']}
+                    line = json.dumps(rec, separators=(',', ':'))
+                with lock:
+                    out.write(line + '\n')
+                    out.flush()
+            except Exception, e:
+                rec = {'host': address, 'error': error_message(e),
+                       'seconds': rec and rec['seconds'] or 0.0}
+            # The host's result is settled; reporting it can't change it
+            try:
+                with lock:
+                    if 'error' in rec:
+                        failed[0] += 1
+                    if progress:
+                        progress.host_done(rec)
+            except Exception:
+                pass
+            finally:
+                queue.task_done()
+
+    threads = []
+    for _ in range(workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for address in addresses:
+        queue.put(address)
+    for _ in threads:
+        queue.put(None)
+    for thread in threads:
+        thread.join()
+
+    if progress:
+        progress.finish()
+    return failed[0]
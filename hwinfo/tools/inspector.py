@@ -3,47 +3,149 @@
 from argparse import ArgumentParser
 import paramiko
 import subprocess
+import shlex
 import os
+import socket
 import sys
+import time
 import tarfile
 import tempfile
 import shutil
 import json
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
 
 from prettytable import PrettyTable
 
-from hwinfo.pci import PCIDevice
+from hwinfo.util import join_values, map_file, BUFFER_TYPES
+from hwinfo.util.cache import MemoCache
+from hwinfo.pci import PCIDeviceRecord, PCIDeviceSet
+from hwinfo.pci import NIC_CLASSES, STORAGE_CLASSES, GPU_CLASSES
 from hwinfo.pci.lspci import *
+from hwinfo.pci import sysfs as pci_sysfs
+from hwinfo.pci.pciids import load_pci_ids
 
 from hwinfo.host import dmidecode
 from hwinfo.host import cpuinfo
-
-def get_ssh_client(host, username, password, timeout=10):
+from hwinfo.host import smbios
+from hwinfo.tools.local import LocalCollector
+from hwinfo.tools import fleet
+from hwinfo.tools.sshpool import pool_key, DEFAULT_ACQUIRE_TIMEOUT
+
+# Seconds a Host keeps the results it has collected. Off unless asked for,
+# e.g. with --cache-ttl, so a Host polled over time sees fresh output.
+DEFAULT_CACHE_TTL = 0
+
+# Seconds allowed to open an SSH connection
+CONNECT_TIMEOUT = 10
+
+# Seconds a remote host is given from connecting to its last command, so a
+# host that hangs can't hold up a fleet scan for ever
+DEFAULT_HOST_TIMEOUT = 300
+
+# Host accessors Host.collect() can run, by section name
+SECTIONS = {
+    'info': 'get_info',
+    'os_info': 'get_os_info',
+    'cpu_info': 'get_cpu_info',
+    'pci_devices': 'get_pci_devices',
+    'degraded_pci_links': 'get_degraded_pci_links',
+}
+
+# Commands each section runs on a remote host
+SECTION_COMMANDS = {
+    'info': [['dmidecode'], ['cat', '/etc/xensource-inventory']],
+    'os_info': [['cat', '/etc/xensource-inventory']],
+    'cpu_info': [['cat', '/proc/cpuinfo']],
+    'pci_devices': [['lspci', '-nnmm']],
+    'degraded_pci_links': [['lspci', '-vv']],
+}
+
+# The section each CLI option is built from
+OPTION_SECTIONS = {
+    'bios': 'info',
+    'cpu': 'cpu_info',
+    'nic': 'pci_devices',
+    'storage': 'pci_devices',
+    'gpu': 'pci_devices',
+    'link': 'degraded_pci_links',
+}
+
+def get_ssh_client(host, username, password, timeout=CONNECT_TIMEOUT):
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(host, username=username, password=password, timeout=timeout)
+    client.connect(host, username=username, password=password, timeout=timeout,
+                   banner_timeout=timeout, auth_timeout=timeout)
     return client
 
-def remote_command(client, cmd):
+class CommandError(Exception):
+    """A command exited with an error, or wrote to stderr"""
+    pass
+
+class HostTimeout(Exception):
+    """A host used up the time it was given"""
+    pass
+
+def remote_command(client, cmd, timeout=None):
+    """Run cmd on client, waiting at most timeout seconds for each read"""
     cmdstr = ' '.join(cmd)
     #print "Executing '%s' on host '%s'" % (cmdstr, host)
-    _, stdout, stderr = client.exec_command(cmdstr)
+    _, stdout, stderr = client.exec_command(cmdstr, timeout=timeout)
     output = stdout.readlines()
     error = stderr.readlines()
     if error:
-        raise Exception("stderr: %s" % error)
+        raise CommandError("stderr: %s" % error)
     return ''.join(output)
 
-def local_command(cmd):
+class CommandStream(object):
+    """File-like access to a command's output while it is still running"""
+
+    def __init__(self, stdout, on_close=None):
+        self.stdout = stdout
+        self.on_close = on_close
+
+    def read(self, size=-1):
+        return self.stdout.read(size)
+
+    def close(self):
+        self.stdout.close()
+        if self.on_close:
+            self.on_close()
+
+def remote_stream_command(client, cmd, timeout=None):
     cmdstr = ' '.join(cmd)
-    process = subprocess.Popen(cmdstr, stdout=subprocess.PIPE, shell=True)
+    _, stdout, stderr = client.exec_command(cmdstr, timeout=timeout)
+
+    def check_stderr():
+        error = stderr.readlines()
+        if error:
+            raise CommandError("stderr: %s" % error)
+
+    return CommandStream(stdout, check_stderr)
+
+def split_command(cmd):
+    if isinstance(cmd, basestring):
+        return shlex.split(cmd)
+    return cmd
+
+def local_command(cmd):
+    process = subprocess.Popen(split_command(cmd), stdout=subprocess.PIPE)
     stdout, stderr = process.communicate()
     if process.returncode == 0:
         return str(stdout).strip()
     else:
         print "RC: %s" % process.returncode
         print stdout
-        raise Exception("stderr: %s" % str(stderr))
+        raise CommandError("stderr: %s" % str(stderr))
+
+def local_stream_command(cmd):
+    process = subprocess.Popen(split_command(cmd), stdout=subprocess.PIPE)
+
+    def check_returncode():
+        if process.wait() != 0:
+            raise CommandError("RC: %s" % process.returncode)
+
+    return CommandStream(process.stdout, check_returncode)
 
 def find_in_tarball(tarball, filename):
     tar = tarfile.open(tarball)
@@ -92,6 +194,8 @@ def read_from_tarball(tarball, filename):
 
 def parse_kvp_string(data):
     rec = {}
+    if isinstance(data, BUFFER_TYPES):
+        data = bytes(data[:])
     lines = data.split('\n')
     for line in lines:
         if not line:
@@ -100,43 +204,240 @@ def parse_kvp_string(data):
         rec[k] = v.strip("'")
     return rec
 
+def copy_result(value):
+    """Copy a cached result, so callers can't change what is cached
+
+    Lists and dicts are copied, along with the lists and dicts directly in
+    them, which is as deep as collected results go. PCIDeviceRecord and
+    CPURecord objects are read-only and are shared rather than copied.
+    """
+    if isinstance(value, list):
+        return [_copy_container(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(k, _copy_container(v)) for k, v in value.iteritems()])
+    return value
+
+def _copy_container(value):
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+class CollectResults(dict):
+    """Sections collected by Host.collect(), keyed by section
+
+    errors holds the sys.exc_info() of each section that failed.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.errors = {}
+
 class Host(object):
 
     client = None
-
-    def __init__(self, host='localhost', username=None, password=None):
+    # An SSHPool to borrow connections from, e.g. Host.ssh_pool = SSHPool()
+    ssh_pool = None
+    pci_ids = None
+    cache_ttl = DEFAULT_CACHE_TTL
+    timeout = None
+    deadline = None
+    # Threads collect() runs sections on. Enough for every section at once,
+    # and no more however many sections are asked for.
+    collect_workers = len(SECTIONS)
+    _cache = None
+
+    def __init__(self, host='localhost', username=None, password=None, root='/', timeout=None):
         self.host = host
         self.username = username
         self.password = password
+        self.local = LocalCollector(root)
+        if timeout:
+            # Remote hosts only; local commands aren't limited
+            self.timeout = timeout
+            self.deadline = time.time() + timeout
         if self.is_remote():
-            self.client = get_ssh_client(self.host, self.username, self.password)
+            self.client = self._connect()
 
     def __del__(self):
+        self.close()
+
+    def _connect(self):
+        if self.ssh_pool is None:
+            return get_ssh_client(self.host, self.username, self.password,
+                                  self._time_left(CONNECT_TIMEOUT))
+        key = pool_key(self.host, self.username, self.password)
+        connect = lambda: get_ssh_client(self.host, self.username, self.password,
+                                         self._time_left(CONNECT_TIMEOUT))
+        return self.ssh_pool.acquire(key, connect, self._time_left(DEFAULT_ACQUIRE_TIMEOUT))
+
+    def _time_left(self, limit=None):
+        """Seconds the next remote step may take, at most limit
+
+        Raises HostTimeout once the host's deadline has passed.
+        """
+        if self.deadline is None:
+            return limit
+        left = self.deadline - time.time()
+        if left <= 0:
+            raise HostTimeout("%s timed out after %ss" % (self.host, self.timeout))
+        if limit is None:
+            return left
+        return min(left, limit)
+
+    def close(self):
+        """Close the SSH connection, or return it to the pool it came from"""
         if self.client:
-            self.client.close()
+            if self.ssh_pool is not None:
+                self.ssh_pool.release(self.client)
+            else:
+                self.client.close()
+            self.client = None
 
     def is_remote(self):
         return self.host != 'localhost'
 
+    def set_cache_ttl(self, ttl):
+        """Keep collected results for ttl seconds, or not at all if ttl is 0 or None"""
+        self.cache_ttl = ttl
+        self._cache = None
+
+    def get_cache(self):
+        if not self.cache_ttl:
+            return None
+        if self._cache is None:
+            self._cache = MemoCache(self.cache_ttl)
+        return self._cache
+
+    def invalidate(self, name=None):
+        """Forget cached results, either all of them or those of one kind
+
+        name is the first part of the cache key, e.g. 'exec', 'file' or
+        'pci_devices'.
+        """
+        if self._cache is None:
+            return
+        if name is None:
+            self._cache.invalidate()
+            return
+        for key in self._cache.keys():
+            if key[0] == name:
+                self._cache.invalidate(key)
+
+    def _cached(self, key, create):
+        cache = self.get_cache()
+        if cache is None:
+            return create()
+        return copy_result(cache.fetch(key, create))
+
+    def collect(self, sections):
+        """Collect several sections at once, on a pool of collect_workers threads
+
+        The commands run side by side, as local subprocesses or as separate
+        channels on the one SSH connection, and each output is parsed as it
+        arrives. Returns a CollectResults keyed by section. Sections that
+        failed are left out, and collected() raises their error again.
+        """
+        for section in sections:
+            if section not in SECTIONS:
+                raise ValueError("Unknown section '%s'" % section)
+        # Create the cache up front, so the threads share one
+        self.get_cache()
+
+        results = CollectResults()
+
+        def run(section):
+            try:
+                results[section] = getattr(self, SECTIONS[section])()
+            except Exception:
+                results.errors[section] = sys.exc_info()
+
+        sections = set(sections)
+        pool = ThreadPool(min(len(sections), self.collect_workers) or 1)
+        try:
+            pool.map(run, sections)
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+    def set_pci_ids(self, pci_ids):
+        """Use pci_ids to name devices found with only their numeric ids"""
+        self.pci_ids = pci_ids
+        self.invalidate('pci_devices')
+
+    def _fill_pci_names(self, recs):
+        if self.pci_ids is not None:
+            for rec in recs:
+                self.pci_ids.fill_names(rec)
+        return recs
+
     def exec_command(self, cmd):
+        key = ('exec', isinstance(cmd, list) and tuple(cmd) or cmd)
+        return self._cached(key, lambda: self._exec_command(cmd))
+
+    def _exec_command(self, cmd):
         if self.is_remote():
-            return remote_command(self.client, cmd)
+            try:
+                return remote_command(self.client, cmd, self._time_left())
+            except socket.timeout:
+                raise HostTimeout("%s timed out after %ss" % (self.host, self.timeout))
         else:
             return local_command(cmd)
 
+    def stream_command(self, cmd):
+        if self.is_remote():
+            return remote_stream_command(self.client, cmd, self._time_left())
+        else:
+            return local_stream_command(cmd)
+
+    def read_file(self, path):
+        if self.is_remote():
+            return self.exec_command(['cat', path])
+        else:
+            return self._cached(('file', path), lambda: self.local.read_file(path))
+
+    def open_file(self, path):
+        if self.is_remote():
+            return self.stream_command(['cat', path])
+        else:
+            return self.local.open_file(path)
+
     def get_lspci_data(self):
         return self.exec_command(['lspci', '-nnmm'])
 
+    def get_lspci_stream(self):
+        return self.stream_command(['lspci', '-nnmm'])
+
+    def get_lspci_vv_data(self):
+        return self.exec_command(['lspci', '-vv'])
+
     def get_dmidecode_data(self):
         return self.exec_command(['dmidecode'])
 
+    def get_smbios_decoder(self):
+        """Decoder for the raw SMBIOS tables, or None if they can't be read"""
+        if self.is_remote():
+            return None
+        try:
+            return smbios.SMBIOSDecoder.from_sysfs(self.local.root)
+        except (IOError, OSError, smbios.SMBIOSError):
+            return None
+
     def get_cpuinfo_data(self):
-        return self.exec_command(['cat /proc/cpuinfo'])
+        return self.read_file('/proc/cpuinfo')
+
+    def get_cpuinfo_stream(self):
+        return self.open_file('/proc/cpuinfo')
 
     def get_os_data(self):
-        return self.exec_command(['cat', '/etc/xensource-inventory'])
+        return self.read_file('/etc/xensource-inventory')
 
     def get_os_info(self):
+        return self._cached(('os_info',), self._get_os_info)
+
+    def _get_os_info(self):
         rec = {}
         os_rec = parse_kvp_string(self.get_os_data())
         rec['os'] = os_rec['PRODUCT_BRAND']
@@ -144,19 +445,67 @@ class Host(object):
         rec['build'] = os_rec['BUILD_NUMBER']
         return rec
 
-    def get_pci_devices(self):
-        data = self.get_lspci_data()
-        parser = LspciNNMMParser(data)
-        devices = parser.parse_items()
-        return [PCIDevice(device) for device in devices]
+    def get_nic_records(self):
+        """NIC fields, e.g. kernel_name and driver, keyed by PCI bus id"""
+        if self.is_remote():
+            return {}
+        try:
+            return pci_sysfs.get_nic_records(self.local.root)
+        except (IOError, OSError):
+            return {}
+
+    def get_pci_devices(self, stream=False, sysfs=False):
+        return self._cached(('pci_devices', stream, sysfs),
+                            lambda: self._get_pci_devices(stream, sysfs))
+
+    def _get_pci_devices(self, stream, sysfs):
+        if sysfs and not self.is_remote():
+            # Read the ids straight from sysfs, without forking lspci
+            devices = self._fill_pci_names(pci_sysfs.get_device_records(self.local.root))
+        elif stream:
+            devices = parse_stream(LspciNNMMParser, self.get_lspci_stream())
+        else:
+            data = self.get_lspci_data()
+            parser = LspciNNMMParser(data)
+            devices = parser.parse_items()
+        devices = pci_sysfs.join_nic_records(devices, self.get_nic_records())
+        return PCIDeviceRecord.from_records(devices)
+
+    def get_degraded_pci_links(self):
+        """Devices whose PCIe link trained below its capability
+
+        lspci only shows the link registers when run as root.
+        """
+        return self._cached(('degraded_pci_links',), self._get_degraded_pci_links)
+
+    def _get_degraded_pci_links(self):
+        parser = LspciVVParser(self.get_lspci_vv_data())
+        recs = []
+        for device in parser.get_devices():
+            rec = device.get_link_degradation()
+            if rec is not None:
+                rec['device_bus_id'] = device.bus_id
+                rec['class_name'] = device.class_name
+                rec['device_string'] = device.device_string
+                recs.append(rec)
+        return recs
 
     def get_info(self):
-        data = self.get_dmidecode_data()
-        parser = dmidecode.DmidecodeParser(data)
-        rec = parser.parse()
+        return self._cached(('info',), self._get_info)
+
+    def _get_info(self):
+        decoder = self.get_smbios_decoder()
+        if decoder is not None:
+            rec = decoder.parse(as_lists=True)
+        else:
+            #Fall back to running dmidecode
+            data = self.get_dmidecode_data()
+            parser = dmidecode.DmidecodeParser(data)
+            rec = parser.parse(as_lists=True)
         #Count sockets
         if 'socket_designation' in rec:
-            rec['socket_count'] = len(rec['socket_designation'].split(','))
+            rec['socket_count'] = len(rec['socket_designation'])
+        rec = join_values(rec)
 
         try:
             os_rec = self.get_os_info()
@@ -168,10 +517,21 @@ class Host(object):
 
         return rec
 
-    def get_cpu_info(self):
-        data = self.get_cpuinfo_data()
-        parser = cpuinfo.CPUInfoParser(data)
-        return parser.parse_items()
+    def get_cpu_info(self, stream=False, compact=False):
+        return self._cached(('cpu_info', stream, compact),
+                            lambda: self._get_cpu_info(stream, compact))
+
+    def _get_cpu_info(self, stream, compact):
+        if stream:
+            recs = parse_stream(cpuinfo.CPUInfoParser, self.get_cpuinfo_stream())
+        else:
+            data = self.get_cpuinfo_data()
+            parser = cpuinfo.CPUInfoParser(data)
+            recs = parser.parse_items()
+        if compact:
+            # Share one copy of the fields common to each kind of processor
+            return cpuinfo.compact_cpu_recs(recs)
+        return recs
 
 class FileNotFound(Exception):
     pass
@@ -192,6 +552,13 @@ def parse_data(parser, data):
     p = parser(data)
     return p.parse_items()
 
+def parse_stream(parser, fh):
+    """Parse records from fh as it is read, closing it when done"""
+    try:
+        return list(parser().iter_items(fh))
+    finally:
+        fh.close()
+
 def combine_recs(rec_list, key):
     """Use a common key to combine a list of recs"""
     final_recs = {}
@@ -209,28 +576,68 @@ def combine_recs(rec_list, key):
 
 class HostFromLogs(Host):
 
+    # Files mapped by _load_from_file, unmapped by close()
+    mappings = ()
+
     def __init__(self, dirname):
         self.dirname = dirname
+        self.mappings = []
 
     def _load_from_file(self, filename):
+        """Find filename and memory-map it, so parsers can run in place
+
+        The mapping stays open until close(), as lazily parsed records
+        read their details from it.
+        """
         filename = search_for_file(self.dirname, filename)
-        return read_from_file(filename)
+        data = map_file(filename)
+        if data:
+            self.mappings.append(data)
+        return data
+
+    def close(self):
+        """Unmap the files loaded so far"""
+        for data in self.mappings:
+            data.close()
+        self.mappings = []
+        super(HostFromLogs, self).close()
+
+    def _open_file(self, filename):
+        return open(search_for_file(self.dirname, filename), 'r')
 
     def get_lspci_data(self):
         return self._load_from_file('lspci-nnm.out')
 
+    def get_lspci_stream(self):
+        return self._open_file('lspci-nnm.out')
+
+    def get_lspci_vv_data(self):
+        return self._load_from_file('lspci-vv.out')
+
+    def get_nic_records(self):
+        return {}
+
     def get_dmidecode_data(self):
         return self._load_from_file('dmidecode.out')
 
+    def get_smbios_decoder(self):
+        try:
+            return smbios.SMBIOSDecoder.from_dump_data(self._load_from_file('dmidecode.bin'))
+        except (FileNotFound, smbios.SMBIOSError):
+            return None
+
     def get_cpuinfo_data(self):
         return self._load_from_file('cpuinfo')
 
+    def get_cpuinfo_stream(self):
+        return self._open_file('cpuinfo')
+
     def get_os_data(self):
         return self._load_from_file('xensource-inventory')
 
-    def get_pci_devices(self):
+    def _get_pci_devices(self, stream, sysfs):
         try:
-            devs = super(HostFromLogs, self).get_pci_devices()
+            devs = super(HostFromLogs, self)._get_pci_devices(stream, False)
             return devs
         except FileNotFound:
             # Fall back to looking for the file lspci-vv.out
@@ -239,7 +646,7 @@ class HostFromLogs(Host):
             lspci_n_recs = parse_data(LspciNParser, self._load_from_file('lspci-n.out'))
             all_recs = lspci_vv_recs + lspci_n_recs
             recs = combine_recs(all_recs, 'pci_device_bus_id')
-            return [PCIDevice(rec) for rec in recs]
+            return PCIDeviceRecord.from_records(self._fill_pci_names(recs))
 
 class HostFromTarball(HostFromLogs):
 
@@ -277,6 +684,57 @@ class HostFromTarball(HostFromLogs):
             filepath = find_in_tarball(self.tarloc, filename)
             return read_from_tarball(self.tarloc, filepath)
 
+    def _open_file(self, filename):
+        """Find filename in tar, and open it for streaming"""
+        if filename in self.fdata:
+            return StringIO(self.fdata[filename])
+        filepath = find_in_tarball(self.tarloc, filename)
+        tar = tarfile.open(self.tarloc)
+        return CommandStream(tar.extractfile(filepath), tar.close)
+
+class OutputMissing(Exception):
+    pass
+
+def get_section_commands(sections):
+    """The commands needed to collect sections, without duplicates"""
+    cmds = []
+    for section in sections:
+        for cmd in SECTION_COMMANDS[section]:
+            if cmd not in cmds:
+                cmds.append(cmd)
+    return cmds
+
+class HostFromOutputs(Host):
+    """A Host built from command outputs that were collected elsewhere
+
+    This leaves the I/O to the caller, e.g. an asyncio service running
+    the commands over its own SSH connections. Run the commands from
+    get_section_commands(), hand each output over with set_output(), and
+    then use the accessors as usual; none of them block.
+    """
+
+    def __init__(self, outputs=None):
+        self.outputs = {}
+        for cmd, output in (outputs or {}).iteritems():
+            self.set_output(cmd, output)
+
+    def is_remote(self):
+        # Outputs are those of a remote host, so nothing is read locally
+        return True
+
+    def set_output(self, cmd, output):
+        self.outputs[tuple(split_command(cmd))] = output
+        self.invalidate()
+
+    def _exec_command(self, cmd):
+        try:
+            return self.outputs[tuple(split_command(cmd))]
+        except KeyError:
+            raise OutputMissing("No output given for '%s'" % ' '.join(split_command(cmd)))
+
+    def stream_command(self, cmd):
+        return StringIO(self._exec_command(cmd))
+
 def pci_filter(devices, types):
     res = []
     for device in devices:
@@ -287,16 +745,43 @@ def pci_filter(devices, types):
     return res
 
 def pci_filter_for_nics(devices):
-    nic_types = ['02']
-    return pci_filter(devices, nic_types)
+    return pci_filter(devices, NIC_CLASSES)
 
 def pci_filter_for_storage(devices):
-    storage_types = ['00', '01', '0c04', '0c06']
-    return pci_filter(devices, storage_types)
+    return pci_filter(devices, STORAGE_CLASSES)
 
 def pci_filter_for_gpu(devices):
-    gpu_types = ['03']
-    return pci_filter(devices, gpu_types)
+    return pci_filter(devices, GPU_CLASSES)
+
+def collect_system_info(host, options):
+    """Collect every section the options need at once"""
+    sections = []
+    for option in options:
+        section = OPTION_SECTIONS.get(option)
+        if section and section not in sections:
+            sections.append(section)
+    return host.collect(sections)
+
+def collected(host, results, section):
+    """A section from the results of collect(), or from its accessor if not collected
+
+    If the section was collected but failed, its error is raised again
+    rather than running its commands a second time.
+    """
+    if results is not None:
+        if section in results:
+            return results[section]
+        errors = getattr(results, 'errors', {})
+        if section in errors:
+            exc_type, exc_value, exc_tb = errors[section]
+            raise exc_type, exc_value, exc_tb
+    return getattr(host, SECTIONS[section])()
+
+def get_pci_device_set(host, options, results=None):
+    """Collect and index the host's PCI devices once, if any option needs them"""
+    if 'nic' in options or 'storage' in options or 'gpu' in options:
+        return PCIDeviceSet(collected(host, results, 'pci_devices'))
+    return None
 
 def rec_to_table(rec):
     table = PrettyTable(["Key", "Value"])
@@ -327,6 +812,24 @@ def tabulate_pci_recs(recs):
     ]
     return tabulate_recs(recs, header)
 
+def tabulate_link_recs(recs):
+    header = [
+        'device_bus_id',
+        'class_name',
+        'device_string',
+        'capable',
+        'current',
+        'lost_gbps',
+    ]
+    return tabulate_recs(recs, header)
+
+def get_degraded_pci_links(host, results=None):
+    try:
+        return collected(host, results, 'degraded_pci_links')
+    except (CommandError, OSError, FileNotFound, OutputMissing):
+        #Ignore lspci -vv failing or missing, e.g. not installed.
+        return []
+
 def tabulate_cpu_recs(recs):
     header = [
         'processor',
@@ -343,82 +846,129 @@ def create_unit(title, content):
     return "\n%s\n\n%s\n" % (str(title), str(content))
 
 def validate_args(args):
-    if args.machine != 'localhost':
+    if args.machine != 'localhost' or args.hosts:
         if not args.username or not args.password:
             print "Error: you must specify a username and password to query a remote machine."
             sys.exit(1)
 
 def system_info(host, options):
     info = []
+    results = collect_system_info(host, options)
 
     if 'bios' in options:
-        info.append(create_unit("Bios Info:", rec_to_table(host.get_info())))
+        info.append(create_unit("Bios Info:", rec_to_table(collected(host, results, 'info'))))
 
     if 'cpu' in options:
-        info.append(create_unit("CPU Info:", tabulate_cpu_recs(host.get_cpu_info())))
+        info.append(create_unit("CPU Info:", tabulate_cpu_recs(collected(host, results, 'cpu_info'))))
+
+    pci_devices = get_pci_device_set(host, options, results)
 
     if 'nic' in options:
-        devices = pci_filter_for_nics(host.get_pci_devices())
+        devices = pci_devices.nics()
         info.append(create_unit("Ethernet Controller Info:", tabulate_pci_recs([dev.get_rec() for dev in devices])))
 
     if 'storage' in options:
-        devices = pci_filter_for_storage(host.get_pci_devices())
+        devices = pci_devices.storage()
         info.append(create_unit("Storage Controller Info:", tabulate_pci_recs([dev.get_rec() for dev in devices])))
 
     if 'gpu' in options:
-        devices = pci_filter_for_gpu(host.get_pci_devices())
+        devices = pci_devices.gpus()
         if devices:
             info.append(create_unit("GPU Info:", tabulate_pci_recs([dev.get_rec() for dev in devices])))
 
+    if 'link' in options:
+        links = get_degraded_pci_links(host, results)
+        if links:
+            info.append(create_unit("Degraded PCIe Link Info:", tabulate_link_recs(links)))
+
     return "".join(info).strip()
 
-def export_system_info(host, options):
+def get_system_info_rec(host, options):
     rec = {}
+    results = collect_system_info(host, options)
 
     if 'bios' in options:
-        rec["bios"] = host.get_info()
+        rec["bios"] = collected(host, results, 'info')
 
     if 'cpu' in options:
-        rec["cpu"] = host.get_cpu_info()
+        rec["cpu"] = collected(host, results, 'cpu_info')
+
+    pci_devices = get_pci_device_set(host, options, results)
 
     if 'nic' in options:
-        devices = pci_filter_for_nics(host.get_pci_devices())
+        devices = pci_devices.nics()
         rec["nics"] = [dev.get_rec() for dev in devices]
 
     if 'storage' in options:
-        devices = pci_filter_for_storage(host.get_pci_devices())
+        devices = pci_devices.storage()
         rec["storage_controllers"] = [dev.get_rec() for dev in devices]
 
     if 'gpu' in options:
-        devices = pci_filter_for_gpu(host.get_pci_devices())
+        devices = pci_devices.gpus()
         rec["gpus"] = [dev.get_rec() for dev in devices]
 
-    return json.dumps(rec, indent=4, separators=(',', ': '))
+    if 'link' in options:
+        rec["degraded_pci_links"] = get_degraded_pci_links(host, results)
+
+    return rec
+
+def export_system_info(host, options):
+    return json.dumps(get_system_info_rec(host, options), indent=4, separators=(',', ': '))
+
+def scan_host(address, username, password, options, cache_ttl=DEFAULT_CACHE_TTL, timeout=None):
+    """Connect to one host of a fleet and return its system info record
+
+    The host is given timeout seconds in all, after which HostTimeout is
+    raised.
+    """
+    host = Host(address, username, password, timeout=timeout)
+    host.set_cache_ttl(cache_ttl)
+    try:
+        return get_system_info_rec(host, options)
+    finally:
+        host.close()
+
+def scan_fleet(args, options):
+    """Scan each host listed in args.hosts, writing one JSON line per host"""
+    if args.hosts == '-':
+        fh = sys.stdin
+    else:
+        fh = open(args.hosts, 'r')
+
+    def scan(address):
+        return scan_host(address, args.username, args.password, options, args.cache_ttl, args.timeout)
+
+    try:
+        return fleet.scan_fleet(fleet.read_host_list(fh), scan, sys.stdout,
+                                workers=args.workers, progress=fleet.FleetProgress())
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
 
 def main():
     """Entry Point"""
 
     parser = ArgumentParser(prog="hwinfo")
 
-    filter_choices = ['bios', 'nic', 'storage', 'gpu', 'cpu']
+    filter_choices = ['bios', 'nic', 'storage', 'gpu', 'cpu', 'link']
     parser.add_argument("-f", "--filter", choices=filter_choices, help="Query a specific class.")
     parser.add_argument("-m", "--machine", default='localhost', help="Remote host address.")
     parser.add_argument("-u", "--username", help="Username for remote host.")
     parser.add_argument("-p", "--password", help="Password for remote host.")
     parser.add_argument("-l", "--logs", help="Path to the directory with the logfiles.")
     parser.add_argument("-e", "--export", action="store_true", help="Export result in JSON format.")
+    parser.add_argument("-i", "--pci-ids", help="Path to a pci.ids file, used to name devices listed only by id.")
+    parser.add_argument("-H", "--hosts", help="File listing remote hosts to scan, one per line, or - for stdin.")
+    parser.add_argument("-w", "--workers", type=int, default=fleet.DEFAULT_WORKERS,
+                        help="Number of hosts to scan at once with --hosts.")
+    parser.add_argument("-t", "--cache-ttl", type=int, default=DEFAULT_CACHE_TTL,
+                        help="Seconds to keep each host's command output and parsed results (0 for no caching).")
+    parser.add_argument("-T", "--timeout", type=int, default=DEFAULT_HOST_TIMEOUT,
+                        help="Seconds allowed for each remote host, connecting included (0 for no limit).")
 
     args = parser.parse_args()
     validate_args(args)
 
-    if args.logs:
-        if ".tar" in args.logs:
-            host = HostFromTarball(args.logs)
-        else:
-            host = HostFromLogs(args.logs)
-    else:
-        host = Host(args.machine, args.username, args.password)
-
     options = []
 
     if args.filter:
@@ -428,7 +978,27 @@ def main():
     else:
         options = filter_choices
 
-    if args.export:
-        print export_system_info(host, options)
+    if args.hosts:
+        failed = scan_fleet(args, options)
+        sys.exit(failed and 1 or 0)
+
+    if args.logs:
+        if ".tar" in args.logs:
+            host = HostFromTarball(args.logs)
+        else:
+            host = HostFromLogs(args.logs)
     else:
-        print system_info(host, options)
+        host = Host(args.machine, args.username, args.password, timeout=args.timeout)
+
+    host.set_cache_ttl(args.cache_ttl)
+
+    if args.pci_ids:
+        host.set_pci_ids(load_pci_ids(args.pci_ids))
+
+    try:
+        if args.export:
+            print export_system_info(host, options)
+        else:
+            print system_info(host, options)
+    finally:
+        host.close()
@@ -0,0 +1,25 @@
+"""Module for collecting data on the local machine without spawning processes"""
+
+import os
+
+class LocalCollector(object):
+    """Reads local sources such as /proc and /etc files directly
+
+    All paths are taken relative to root, so tests can point a collector at
+    a fake tree instead of the real filesystem.
+    """
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def read_file(self, path):
+        fh = open(self.path(path), 'r')
+        data = fh.read()
+        fh.close()
+        return data
+
+    def open_file(self, path):
+        return open(self.path(path), 'r')
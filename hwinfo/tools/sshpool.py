@@ -0,0 +1,207 @@
+"""Module for sharing SSH connections between Host objects
+
+Opening a connection costs a key exchange and authentication. An SSHPool
+keeps connections open after their Host is done with them, so the next
+Host for the same machine and user borrows one instead of connecting
+again.
+"""
+
+import hashlib
+import threading
+import time
+
+DEFAULT_MAX_PER_HOST = 4
+
+# Seconds an unused connection is kept open
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Seconds between keepalive packets, so idle connections aren't dropped
+DEFAULT_KEEPALIVE = 30
+
+# Seconds to wait for a connection when a host is at its cap
+DEFAULT_ACQUIRE_TIMEOUT = 60
+
+class SSHPoolError(Exception):
+    pass
+
+def pool_key(host, username, password):
+    """Key connections are shared under
+
+    Connections are per host and user. The password is part of the key,
+    hashed, so a wrong password can't borrow a connection opened with
+    the right one.
+    """
+    return (host, username, hashlib.sha1(password or '').hexdigest())
+
+def is_active(client):
+    """Whether the client's transport thread is still running"""
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+def is_healthy(client):
+    """Whether the connection still works, checked by sending it a packet
+
+    A transport can look active after the other end has gone away. Sending
+    an SSH ignore message fails on a connection that has been dropped.
+    """
+    if not is_active(client):
+        return False
+    try:
+        client.get_transport().send_ignore()
+    except Exception:
+        return False
+    return True
+
+class SSHPool(object):
+    """Open paramiko clients, lent out to one borrower at a time
+
+    At most max_per_host connections are open for each key, whether idle
+    or borrowed. An idle connection is sent a packet before being lent
+    out, and is dropped if that fails. Connections whose transport has
+    stopped are dropped when returned or while idle. Times, including
+    the acquire timeout, are measured with clock.
+    """
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 keepalive=DEFAULT_KEEPALIVE, clock=time.time):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.clock = clock
+        self.closed = False
+        self.cond = threading.Condition()
+        # key -> [(time released, client)], most recently released last
+        self.idle = {}
+        # key -> number of connections open, idle or borrowed
+        self.open = {}
+        # client -> key, for the clients lent out
+        self.borrowed = {}
+
+    def acquire(self, key, connect, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """Borrow a connection for key, calling connect() to open one if needed
+
+        Waits up to timeout seconds if key is already at its cap. Raises
+        SSHPoolError if the pool has been closed.
+        """
+        deadline = self.clock() + timeout
+        while True:
+            client = self._reserve(key, deadline)
+            if client is None:
+                break
+            # Probe outside the lock, so a slow host doesn't hold up the
+            # rest of the pool
+            healthy = is_healthy(client)
+            with self.cond:
+                if healthy and not self.closed:
+                    self.borrowed[client] = key
+                    return client
+                self._drop(key, client)
+                self.cond.notify_all()
+
+        # Connect outside the lock, so other hosts aren't held up
+        try:
+            client = connect()
+        except Exception:
+            with self.cond:
+                self.open[key] -= 1
+                self.cond.notify_all()
+            raise
+        transport = client.get_transport()
+        if transport is not None and self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        with self.cond:
+            self.borrowed[client] = key
+        return client
+
+    def _reserve(self, key, deadline):
+        """Take an idle connection for key, or a slot to open one in
+
+        Returns the idle client, or None once a slot has been counted
+        against the cap for the caller to connect in.
+        """
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise SSHPoolError("SSHPool is closed")
+                self._evict_idle()
+                idle = self.idle.get(key)
+                if idle:
+                    _, client = idle.pop()
+                    return client
+                if self.open.get(key, 0) < self.max_per_host:
+                    self.open[key] = self.open.get(key, 0) + 1
+                    return None
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    raise SSHPoolError("Timed out waiting for a connection to %s" % key[0])
+                self.cond.wait(remaining)
+
+    def release(self, client):
+        """Return a borrowed connection, closing it if it has died"""
+        with self.cond:
+            key = self.borrowed.pop(client, None)
+            if key is None:
+                # Not one of ours
+                client.close()
+                return
+            if not self.closed and is_active(client):
+                self.idle.setdefault(key, []).append((self.clock(), client))
+            else:
+                self._drop(key, client)
+            self.cond.notify_all()
+
+    def discard(self, client):
+        """Close a borrowed connection rather than returning it"""
+        with self.cond:
+            key = self.borrowed.pop(client, None)
+            if key is None:
+                client.close()
+                return
+            self._drop(key, client)
+            self.cond.notify_all()
+
+    def _drop(self, key, client):
+        client.close()
+        self.open[key] -= 1
+        if not self.open[key]:
+            del self.open[key]
+
+    def _evict_idle(self):
+        now = self.clock()
+        for key, idle in self.idle.items():
+            keep = []
+            for released, client in idle:
+                if now - released >= self.idle_timeout or not is_active(client):
+                    self._drop(key, client)
+                else:
+                    keep.append((released, client))
+            if keep:
+                self.idle[key] = keep
+            else:
+                del self.idle[key]
+
+    def evict_idle(self):
+        """Close connections that have been idle too long, or have died"""
+        with self.cond:
+            self._evict_idle()
+            self.cond.notify_all()
+
+    def size(self, key=None):
+        """Number of open connections, for key or in total"""
+        with self.cond:
+            if key is not None:
+                return self.open.get(key, 0)
+            return sum(self.open.values())
+
+    def close(self):
+        """Close every idle connection, and lend out no more
+
+        Borrowed connections are closed when returned.
+        """
+        with self.cond:
+            self.closed = True
+            for key, idle in self.idle.items():
+                for _, client in idle:
+                    self._drop(key, client)
+            self.idle = {}
+            self.cond.notify_all()
@@ -0,0 +1,155 @@
+import unittest
+import json
+import threading
+from StringIO import StringIO
+
+from hwinfo.tools import fleet
+
+class ReadHostListTests(unittest.TestCase):
+
+    def test_read_host_list(self):
+        fh = StringIO("10.0.0.1\n\n# rack 2\n10.0.0.2  # spare\n  10.0.0.3\n")
+        self.assertEqual(list(fleet.read_host_list(fh)), ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+
+class ScanFleetTests(unittest.TestCase):
+
+    def _lines(self, out):
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_one_line_per_host(self):
+        out = StringIO()
+        failed = fleet.scan_fleet(['a', 'b', 'c'], lambda address: {'cpu': address}, out, workers=2)
+        self.assertEqual(failed, 0)
+        recs = sorted(self._lines(out), key=lambda rec: rec['host'])
+        self.assertEqual([rec['host'] for rec in recs], ['a', 'b', 'c'])
+        self.assertEqual(recs[0]['hwinfo'], {'cpu': 'a'})
+        self.assertTrue('seconds' in recs[0])
+
+    def test_failures(self):
+        def scan(address):
+            if address == 'b':
+                raise Exception("Authentication failed.")
+            return {}
+
+        out = StringIO()
+        self.assertEqual(fleet.scan_fleet(['a', 'b'], scan, out, workers=2), 1)
+        errors = [rec for rec in self._lines(out) if 'error' in rec]
+        self.assertEqual(errors[0]['host'], 'b')
+        self.assertEqual(errors[0]['error'], "Authentication failed.")
+        self.assertFalse('hwinfo' in errors[0])
+
+    def test_workers_bound_concurrency(self):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+
+        def scan(address):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            threading.Event().wait(0.01)
+            with lock:
+                running[0] -= 1
+            return {}
+
+        out = StringIO()
+        fleet.scan_fleet(['host%d' % i for i in range(20)], scan, out, workers=3)
+        self.assertEqual(len(self._lines(out)), 20)
+        self.assertTrue(1 < most[0] <= 3)
+
+    def test_written_as_each_host_finishes(self):
+        out = StringIO()
+
+        def scan(address):
+            if address == 'slow':
+                # Only finishes once the fast host's line is out
+                for _ in range(500):
+                    if 'fast' in out.getvalue():
+                        break
+                    threading.Event().wait(0.01)
+            return {}
+
+        fleet.scan_fleet(['slow', 'fast'], scan, out, workers=2)
+        self.assertEqual([rec['host'] for rec in self._lines(out)], ['fast', 'slow'])
+
+    def _scan_in_thread(self, *args, **kwargs):
+        """Run scan_fleet in a thread, so a hang fails the test rather than the run"""
+        result = []
+        thread = threading.Thread(target=lambda: result.append(fleet.scan_fleet(*args, **kwargs)))
+        thread.daemon = True
+        thread.start()
+        return thread, result
+
+    def _wait_for(self, thread, result):
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "scan_fleet hung")
+        return result[0]
+
+    def test_host_list_read_lazily(self):
+        read = []
+
+        def addresses():
+            for i in range(100):
+                read.append(i)
+                yield 'host%d' % i
+
+        release = threading.Event()
+
+        def scan(address):
+            release.wait(10)
+            return {}
+
+        thread, result = self._scan_in_thread(addresses(), scan, StringIO(), workers=1)
+        # Wait for the feeder to block on the full queue
+        last = None
+        while last != len(read):
+            last = len(read)
+            threading.Event().wait(0.05)
+        release.set()
+        # One host being scanned, two queued, and one the feeder is holding
+        self.assertTrue(len(read) <= 4)
+        self.assertEqual(self._wait_for(thread, result), 0)
+        self.assertEqual(len(read), 100)
+
+    def test_output_not_utf8(self):
+        out = StringIO()
+        thread, result = self._scan_in_thread(['host%d' % i for i in range(20)],
+                                              lambda address: {'x': '\xff\xfe'}, out, workers=2)
+        self.assertEqual(self._wait_for(thread, result), 20)
+        recs = self._lines(out)
+        self.assertEqual(len(recs), 20)
+        self.assertTrue(all('error' in rec and 'hwinfo' not in rec for rec in recs))
+
+    def test_unicode_error_message(self):
+        def scan(address):
+            raise Exception(u'caf\xe9 unreachable')
+
+        out = StringIO()
+        self.assertEqual(fleet.scan_fleet(['a'], scan, out, workers=1), 1)
+        self.assertEqual(self._lines(out)[0]['error'], 'caf\\xe9 unreachable')
+
+    def test_reporting_failure_does_not_stop_workers(self):
+        class BrokenProgress(fleet.FleetProgress):
+            def host_done(self, rec):
+                raise IOError("progress went away")
+
+        progress = BrokenProgress(StringIO())
+        out = StringIO()
+        thread, result = self._scan_in_thread(['host%d' % i for i in range(20)],
+                                              lambda address: {}, out, workers=2, progress=progress)
+        # The hosts were scanned and written, so none of them failed
+        self.assertEqual(self._wait_for(thread, result), 0)
+        self.assertEqual(len(self._lines(out)), 20)
+
+    def test_no_workers(self):
+        self.assertRaises(ValueError, fleet.scan_fleet, ['a'], lambda address: {}, StringIO(), workers=0)
+
+    def test_progress(self):
+        times = iter([100.0, 102.5])
+        err = StringIO()
+        progress = fleet.FleetProgress(err, clock=lambda: next(times))
+        fleet.scan_fleet(['a'], lambda address: {}, StringIO(), workers=1, progress=progress)
+        lines = err.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("[1] a ok in "))
+        self.assertEqual(lines[-1], "Scanned 1 hosts (0 failed) in 2.50s")
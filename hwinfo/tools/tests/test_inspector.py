@@ -1,10 +1,19 @@
 import unittest
 import mock
 import sys
+import os
+import mmap
+import shutil
+import socket
+import subprocess
+import tempfile
+import json
+import threading
 from mock import patch
 from StringIO import StringIO
 
 from hwinfo.tools import inspector
+from hwinfo.pci.pciids import load_pci_ids
 import dummy_data
 
 class HostMock(inspector.Host):
@@ -15,6 +24,18 @@ class HostMock(inspector.Host):
     def get_dmidecode_data(self):
         return dummy_data.DMIDECODE_DUMMY
 
+    def get_smbios_decoder(self):
+        return None
+
+    def get_nic_records(self):
+        return {}
+
+    def get_lspci_vv_data(self):
+        fh = open('hwinfo/pci/tests/data/single_network_device_lspci_vv')
+        data = fh.read()
+        fh.close()
+        return data
+
     def get_cpuinfo_data(self):
         return dummy_data.CPUINFO_DUMMY
 
@@ -35,7 +56,29 @@ class HostObjectTests(unittest.TestCase):
         mclient = get_ssh_client.return_value = mock.MagicMock()
         host = inspector.Host('mymachine', 'root', 'pass')
         host.exec_command('ls')
-        inspector.remote_command.assert_called_once_with(mclient, 'ls')
+        inspector.remote_command.assert_called_once_with(mclient, 'ls', None)
+
+    @patch('time.time')
+    @patch('hwinfo.tools.inspector.get_ssh_client')
+    @patch('hwinfo.tools.inspector.remote_command')
+    def test_remote_timeout(self, remote_command, get_ssh_client, time):
+        time.return_value = 1000.0
+        mclient = get_ssh_client.return_value = mock.MagicMock()
+        host = inspector.Host('mymachine', 'root', 'pass', timeout=60)
+        get_ssh_client.assert_called_once_with('mymachine', 'root', 'pass', 10)
+        time.return_value = 1045.0
+        host.exec_command('ls')
+        inspector.remote_command.assert_called_once_with(mclient, 'ls', 15.0)
+        time.return_value = 1060.0
+        self.assertRaises(inspector.HostTimeout, host.exec_command, 'ls')
+
+    @patch('hwinfo.tools.inspector.get_ssh_client')
+    @patch('hwinfo.tools.inspector.remote_command')
+    def test_remote_read_timeout(self, remote_command, get_ssh_client):
+        get_ssh_client.return_value = mock.MagicMock()
+        remote_command.side_effect = socket.timeout()
+        host = inspector.Host('mymachine', 'root', 'pass', timeout=60)
+        self.assertRaises(inspector.HostTimeout, host.exec_command, 'ls')
 
     @patch('hwinfo.tools.inspector.Host.exec_command')
     def test_get_pci_devices(self, exec_command):
@@ -43,9 +86,11 @@ class HostObjectTests(unittest.TestCase):
         devs = host.get_pci_devices()
         exec_command.assert_called_once_with(['lspci', '-nnmm'])
 
+    @patch('hwinfo.tools.inspector.Host.get_smbios_decoder')
     @patch('hwinfo.host.dmidecode.DmidecodeParser')
     @patch('hwinfo.tools.inspector.Host.exec_command')
-    def test_get_info(self, mock_exec_command, mock_dmidecode_parser_cls):
+    def test_get_info(self, mock_exec_command, mock_dmidecode_parser_cls, get_smbios_decoder):
+        get_smbios_decoder.return_value = None
         mock_exec_command.return_value = 'blah'
         mparser = mock_dmidecode_parser_cls.return_value = mock.Mock()
         mparser.parse.return_value = {'key':'value'}
@@ -53,6 +98,95 @@ class HostObjectTests(unittest.TestCase):
         rec = host.get_info()
         self.assertEqual(rec, {'key':'value'})
 
+    @patch('hwinfo.tools.inspector.Host.stream_command')
+    def test_get_pci_devices_stream(self, stream_command):
+        stream_command.return_value = StringIO(dummy_data.LSPCI_DUMMY)
+        host = inspector.Host()
+        devs = host.get_pci_devices(stream=True)
+        stream_command.assert_called_once_with(['lspci', '-nnmm'])
+        expected = HostMock().get_pci_devices()
+        self.assertEqual([d.get_rec() for d in devs], [d.get_rec() for d in expected])
+
+    @patch('hwinfo.tools.inspector.Host.open_file')
+    def test_get_cpu_info_stream(self, open_file):
+        fh = open_file.return_value = mock.MagicMock(wraps=StringIO(dummy_data.CPUINFO_DUMMY))
+        host = inspector.Host()
+        recs = host.get_cpu_info(stream=True)
+        self.assertEqual(recs, HostMock().get_cpu_info())
+        fh.close.assert_called_once_with()
+
+    def test_get_cpu_info_compact(self):
+        host = HostMock()
+        recs = host.get_cpu_info(compact=True)
+        self.assertEqual(recs, host.get_cpu_info())
+        self.assertTrue(recs[0].shape is recs[-1].shape)
+
+    def test_get_info_socket_count(self):
+        rec = HostMock().get_info()
+        self.assertEqual(rec['socket_count'], 2)
+        self.assertEqual(rec['socket_designation'], 'Proc 1, Proc 2')
+
+    @patch('hwinfo.tools.inspector.Host.exec_command')
+    def test_local_files_read_directly(self, exec_command):
+        root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, 'proc'))
+        os.makedirs(os.path.join(root, 'etc'))
+        for path, data in [('proc/cpuinfo', dummy_data.CPUINFO_DUMMY),
+                           ('etc/xensource-inventory', dummy_data.OS_DUMMY)]:
+            fh = open(os.path.join(root, path), 'w')
+            fh.write(data)
+            fh.close()
+        host = inspector.Host(root=root)
+        self.assertEqual(host.get_cpu_info(), HostMock().get_cpu_info())
+        self.assertEqual(host.get_cpu_info(stream=True), HostMock().get_cpu_info())
+        self.assertEqual(host.get_os_info(), HostMock().get_os_info())
+        shutil.rmtree(root)
+        self.assertFalse(exec_command.called)
+
+    @patch('hwinfo.tools.inspector.Host.exec_command')
+    def test_get_pci_devices_sysfs(self, exec_command):
+        root = tempfile.mkdtemp()
+        path = os.path.join(root, 'sys/bus/pci/devices/0000:02:00.0')
+        os.makedirs(path)
+        for attr, value in [('vendor', '0x14e4'), ('device', '0x163b'), ('class', '0x020000'),
+                            ('subsystem_vendor', '0x1028'), ('subsystem_device', '0x02a3')]:
+            fh = open(os.path.join(path, attr), 'w')
+            fh.write(value + '\n')
+            fh.close()
+        os.makedirs(os.path.join(root, 'sys/bus/pci/drivers/bnx2'))
+        os.symlink('../../../../bus/pci', os.path.join(path, 'subsystem'))
+        os.symlink('../../../../bus/pci/drivers/bnx2', os.path.join(path, 'driver'))
+        os.makedirs(os.path.join(root, 'sys/class/net/eth0'))
+        os.symlink('../../../bus/pci/devices/0000:02:00.0', os.path.join(root, 'sys/class/net/eth0/device'))
+        devices = inspector.Host(root=root).get_pci_devices(sysfs=True)
+        shutil.rmtree(root)
+        self.assertEqual(len(devices), 1)
+        self.assertEqual(devices[0].get_pci_id(), '14e4:163b 1028:02a3')
+        self.assertEqual(devices[0].get_device_bus_id(), '02:00.0')
+        self.assertEqual(devices[0].get_kernel_name(), 'eth0')
+        self.assertEqual(devices[0].get_driver(), 'bnx2')
+        self.assertFalse(exec_command.called)
+
+    @patch('hwinfo.tools.inspector.Host.exec_command')
+    def test_get_info_from_smbios_tables(self, exec_command):
+        host = inspector.Host(root='hwinfo/host/tests/data/sysfs')
+        rec = host.get_info()
+        self.assertEqual(rec['system_product_name'], 'PowerEdge R310')
+        self.assertEqual(rec['socket_count'], 2)
+        self.assertFalse(exec_command.called)
+
+    def test_no_smbios_tables(self):
+        host = inspector.Host(root=tempfile.gettempdir())
+        self.assertEqual(host.get_smbios_decoder(), None)
+
+    @patch('hwinfo.tools.inspector.get_ssh_client')
+    @patch('hwinfo.tools.inspector.Host.exec_command')
+    def test_remote_files_read_with_cat(self, exec_command, get_ssh_client):
+        exec_command.return_value = dummy_data.CPUINFO_DUMMY
+        host = inspector.Host('mymachine', 'root', 'pass')
+        host.get_cpu_info()
+        exec_command.assert_called_once_with(['cat', '/proc/cpuinfo'])
+
     def test_is_not_remote(self):
         host = inspector.Host()
         self.assertEqual(host.is_remote(), False)
@@ -64,6 +198,174 @@ class HostObjectTests(unittest.TestCase):
         self.assertEqual(host.is_remote(), True)
 
 
+class HostCacheTests(unittest.TestCase):
+
+    def _host(self, cls=inspector.Host):
+        host = cls()
+        host.set_cache_ttl(60)
+        return host
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_command_output_cached(self, local_command):
+        local_command.return_value = dummy_data.LSPCI_DUMMY
+        host = self._host()
+        host.exec_command(['lspci', '-nnmm'])
+        host.exec_command(['lspci', '-nnmm'])
+        local_command.assert_called_once_with(['lspci', '-nnmm'])
+
+    @patch('hwinfo.tools.inspector.LspciNNMMParser')
+    def test_parsed_results_cached(self, parser_cls):
+        parser_cls.return_value.parse_items.return_value = [{'pci_device_bus_id': '02:00.0'}]
+        host = self._host(HostMock)
+        first = host.get_pci_devices()
+        second = host.get_pci_devices()
+        self.assertEqual(parser_cls.call_count, 1)
+        self.assertEqual([d.get_rec() for d in first], [d.get_rec() for d in second])
+        self.assertFalse(first is second)
+
+    def test_cached_results_copied(self):
+        host = self._host(HostMock)
+        host.get_cpu_info()[0]['processor'] = 'changed'
+        host.get_pci_devices().pop()
+        host.get_info()['bios_version'] = 'changed'
+        self.assertEqual(host.get_cpu_info(), HostMock().get_cpu_info())
+        self.assertEqual(len(host.get_pci_devices()), len(HostMock().get_pci_devices()))
+        self.assertEqual(host.get_info(), HostMock().get_info())
+
+    def test_cached_records_shared(self):
+        host = self._host(HostMock)
+        self.assertTrue(host.get_pci_devices()[0] is host.get_pci_devices()[0])
+        compact = host.get_cpu_info(compact=True)
+        self.assertTrue(compact[0] is host.get_cpu_info(compact=True)[0])
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_cache_off_by_default(self, local_command):
+        host = inspector.Host()
+        host.exec_command('ls')
+        host.exec_command('ls')
+        self.assertEqual(local_command.call_count, 2)
+        self.assertEqual(host.get_cache(), None)
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_cache_disabled(self, local_command):
+        host = self._host()
+        host.set_cache_ttl(0)
+        host.exec_command('ls')
+        host.exec_command('ls')
+        self.assertEqual(local_command.call_count, 2)
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_cache_expires(self, local_command):
+        host = self._host()
+        now = [1000.0]
+        host.get_cache().clock = lambda: now[0]
+        host.exec_command('ls')
+        now[0] += 61
+        host.exec_command('ls')
+        self.assertEqual(local_command.call_count, 2)
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_invalidate(self, local_command):
+        host = self._host()
+        host.exec_command('ls')
+        host.invalidate('exec')
+        host.exec_command('ls')
+        host.invalidate()
+        host.exec_command('ls')
+        self.assertEqual(local_command.call_count, 3)
+
+    def test_invalidate_one_kind(self):
+        host = self._host(HostMock)
+        host.get_info()
+        host.get_cpu_info()
+        host.invalidate('info')
+        self.assertEqual(sorted([key[0] for key in host.get_cache().keys()]), ['cpu_info', 'os_info'])
+
+    @patch('hwinfo.tools.inspector.local_command')
+    def test_failures_not_cached(self, local_command):
+        local_command.side_effect = [Exception("dmidecode failed"), 'output']
+        host = self._host()
+        self.assertRaises(Exception, host.exec_command, 'dmidecode')
+        self.assertEqual(host.exec_command('dmidecode'), 'output')
+
+
+class HostCollectTests(unittest.TestCase):
+
+    def test_collect(self):
+        host = HostMock()
+        results = host.collect(['info', 'cpu_info', 'pci_devices'])
+        self.assertEqual(sorted(results.keys()), ['cpu_info', 'info', 'pci_devices'])
+        self.assertEqual(results['cpu_info'], host.get_cpu_info())
+        self.assertEqual(len(results['pci_devices']), len(host.get_pci_devices()))
+
+    def test_commands_run_at_once(self):
+        lspci_started = threading.Event()
+        cpuinfo_started = threading.Event()
+
+        class SlowHostMock(HostMock):
+
+            def get_lspci_data(self):
+                lspci_started.set()
+                # Only returns if cpuinfo is being read at the same time
+                if not cpuinfo_started.wait(5):
+                    raise Exception("lspci ran alone")
+                return HostMock.get_lspci_data(self)
+
+            def get_cpuinfo_data(self):
+                cpuinfo_started.set()
+                if not lspci_started.wait(5):
+                    raise Exception("cpuinfo read alone")
+                return HostMock.get_cpuinfo_data(self)
+
+        results = SlowHostMock().collect(['pci_devices', 'cpu_info'])
+        self.assertEqual(sorted(results.keys()), ['cpu_info', 'pci_devices'])
+
+    @patch.object(HostMock, 'get_lspci_data')
+    def test_failed_section_left_out(self, get_lspci_data):
+        get_lspci_data.side_effect = Exception("lspci not found")
+        host = HostMock()
+        results = host.collect(['pci_devices', 'cpu_info'])
+        self.assertEqual(results.keys(), ['cpu_info'])
+        with self.assertRaises(Exception) as context:
+            inspector.collected(host, results, 'pci_devices')
+        self.assertEqual(context.exception.message, "lspci not found")
+        # The error is raised again rather than running lspci a second time
+        self.assertEqual(get_lspci_data.call_count, 1)
+
+    def test_workers_bounded(self):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+
+        class CountingHostMock(HostMock):
+
+            def get_cpu_info(self, stream=False, compact=False):
+                with lock:
+                    running[0] += 1
+                    most[0] = max(most[0], running[0])
+                threading.Event().wait(0.05)
+                with lock:
+                    running[0] -= 1
+                return []
+
+            get_info = get_os_info = get_pci_devices = get_degraded_pci_links = get_cpu_info
+
+        host = CountingHostMock()
+        host.collect_workers = 2
+        results = host.collect(inspector.SECTIONS.keys())
+        self.assertEqual(len(results), len(inspector.SECTIONS))
+        self.assertEqual(most[0], 2)
+
+    def test_unknown_section(self):
+        self.assertRaises(ValueError, HostMock().collect, ['dmesg'])
+
+    @patch.object(HostMock, 'collect')
+    def test_system_info_collects_sections_once(self, collect):
+        collect.return_value = {}
+        inspector.system_info(HostMock(), ['bios', 'nic', 'storage', 'cpu', 'link'])
+        collect.assert_called_once_with(['info', 'pci_devices', 'cpu_info', 'degraded_pci_links'])
+
+
 class HostFromTarballTests(unittest.TestCase):
 
     @patch('hwinfo.tools.inspector.find_in_tarball')
@@ -80,6 +382,113 @@ class HostFromTarballTests(unittest.TestCase):
         find_in_tarball.assert_called_once_with(tarball_name, filename)
         read_from_tarball.assert_called_once_with(tarball_name, filepath)
 
+class HostFromLogsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        for filename, data in [('cpuinfo', dummy_data.CPUINFO_DUMMY),
+                               ('lspci-nnm.out', dummy_data.LSPCI_DUMMY),
+                               ('dmidecode.out', dummy_data.DMIDECODE_DUMMY),
+                               ('xensource-inventory', dummy_data.OS_DUMMY)]:
+            fh = open(os.path.join(self.dirname, filename), 'w')
+            fh.write(data)
+            fh.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_load_from_file_is_mapped(self):
+        host = inspector.HostFromLogs(self.dirname)
+        self.assertTrue(isinstance(host._load_from_file('cpuinfo'), mmap.mmap))
+
+    def test_close_unmaps_files(self):
+        host = inspector.HostFromLogs(self.dirname)
+        data = host._load_from_file('cpuinfo')
+        host.get_cpu_info()
+        host.close()
+        self.assertEqual(host.mappings, [])
+        self.assertRaises(ValueError, data.read, 1)
+
+    def test_mapped_parse_matches(self):
+        host = inspector.HostFromLogs(self.dirname)
+        expected = HostMock()
+        self.assertEqual(host.get_cpu_info(), expected.get_cpu_info())
+        self.assertEqual(host.get_info(), expected.get_info())
+        self.assertEqual([d.get_rec() for d in host.get_pci_devices()],
+                         [d.get_rec() for d in expected.get_pci_devices()])
+
+    def test_fallback_names_from_pci_ids(self):
+        os.remove(os.path.join(self.dirname, 'lspci-nnm.out'))
+        shutil.copy('hwinfo/pci/tests/data/single_network_device_lspci_vv',
+                    os.path.join(self.dirname, 'lspci-vv.out'))
+        fh = open(os.path.join(self.dirname, 'lspci-n.out'), 'w')
+        fh.write('02:00.0 0200: 14e4:163b (rev 20)\n')
+        fh.close()
+        host = inspector.HostFromLogs(self.dirname)
+        host.set_pci_ids(load_pci_ids('hwinfo/pci/tests/data/pci.ids',
+                                      os.path.join(self.dirname, 'pci.ids.idx')))
+        devices = host.get_pci_devices()
+        self.assertEqual(devices[0].get_vendor_name(), 'Broadcom Corporation')
+        self.assertEqual(devices[0].get_device_name(), 'NetXtreme II BCM5716 Gigabit Ethernet')
+
+    def test_get_info_prefers_smbios_dump(self):
+        shutil.copy('hwinfo/host/tests/data/dmidecode.bin', self.dirname)
+        host = inspector.HostFromLogs(self.dirname)
+        rec = host.get_info()
+        self.assertEqual(rec['system_serial_number'], 'GZ7BS4J')
+        self.assertEqual(rec['socket_designation'], 'CPU1, CPU2')
+
+
+class HostFromOutputsTests(unittest.TestCase):
+
+    def _outputs(self):
+        fh = open('hwinfo/pci/tests/data/single_network_device_lspci_vv')
+        lspci_vv = fh.read()
+        fh.close()
+        return {
+            ('dmidecode',): dummy_data.DMIDECODE_DUMMY,
+            ('cat', '/etc/xensource-inventory'): dummy_data.OS_DUMMY,
+            ('cat', '/proc/cpuinfo'): dummy_data.CPUINFO_DUMMY,
+            ('lspci', '-nnmm'): dummy_data.LSPCI_DUMMY,
+            ('lspci', '-vv'): lspci_vv,
+        }
+
+    def test_matches_host(self):
+        host = inspector.HostFromOutputs(self._outputs())
+        expected = HostMock()
+        self.assertEqual(host.get_info(), expected.get_info())
+        self.assertEqual(host.get_cpu_info(), expected.get_cpu_info())
+        self.assertEqual(host.get_cpu_info(stream=True), expected.get_cpu_info())
+        self.assertEqual([d.get_rec() for d in host.get_pci_devices()],
+                         [d.get_rec() for d in expected.get_pci_devices()])
+        self.assertEqual(host.get_degraded_pci_links(), expected.get_degraded_pci_links())
+
+    def test_output_missing(self):
+        host = inspector.HostFromOutputs()
+        self.assertRaises(inspector.OutputMissing, host.get_cpu_info)
+        host.set_output('cat /proc/cpuinfo', dummy_data.CPUINFO_DUMMY)
+        self.assertEqual(host.get_cpu_info(), HostMock().get_cpu_info())
+
+    def test_info_without_os_inventory(self):
+        host = inspector.HostFromOutputs({('dmidecode',): dummy_data.DMIDECODE_DUMMY})
+        self.assertFalse('os' in host.get_info())
+
+    def test_get_section_commands(self):
+        self.assertEqual(inspector.get_section_commands(['info', 'os_info', 'pci_devices']),
+                         [['dmidecode'], ['cat', '/etc/xensource-inventory'], ['lspci', '-nnmm']])
+
+    @patch('hwinfo.tools.inspector.get_ssh_client')
+    @patch('hwinfo.tools.inspector.remote_command')
+    def test_section_commands_match_remote_host(self, remote_command, get_ssh_client):
+        outputs = self._outputs()
+        for section, cmds in inspector.SECTION_COMMANDS.iteritems():
+            run = []
+            remote_command.side_effect = lambda client, cmd, timeout: run.append(cmd) or outputs[tuple(cmd)]
+            host = inspector.Host('test', 'user', 'pass')
+            getattr(host, inspector.SECTIONS[section])()
+            self.assertEqual(sorted(run), sorted(cmds))
+
+
 class UtilTests(unittest.TestCase):
 
     @patch('tarfile.open')
@@ -126,7 +535,8 @@ class RemoteCommandTests(unittest.TestCase):
         client = ssh_client_cls.return_value = mock.Mock()
         client.exec_command.return_value = self.stdout, self.stdin, self.stderr
         inspector.get_ssh_client('test', 'user', 'pass')
-        client.connect.assert_called_with('test', password='pass', username='user', timeout=10)
+        client.connect.assert_called_with('test', password='pass', username='user', timeout=10,
+                                          banner_timeout=10, auth_timeout=10)
 
     @patch('paramiko.SSHClient')
     def test_ssh_connect_error(self, ssh_client_cls):
@@ -136,8 +546,49 @@ class RemoteCommandTests(unittest.TestCase):
             inspector.remote_command(client, 'ls')
         self.assertEqual(context.exception.message, "stderr: ['Error']")
 
+    def test_remote_stream_error(self):
+        client = mock.Mock()
+        client.exec_command.return_value = self.stdin, StringIO('out'), StringIO("Error")
+        fh = inspector.remote_stream_command(client, ['ls'])
+        self.assertEqual(fh.read(), 'out')
+        with self.assertRaises(Exception) as context:
+            fh.close()
+        self.assertEqual(context.exception.message, "stderr: ['Error']")
+
 class LocalCommandTests(unittest.TestCase):
 
+    @patch('subprocess.Popen')
+    def test_local_call_without_shell(self, mock_popen_cls):
+        mprocess = mock_popen_cls.return_value = mock.MagicMock()
+        mprocess.communicate.return_value = 'test', None
+        mprocess.returncode = 0
+        inspector.local_command(['lspci', '-nnmm'])
+        inspector.local_command("echo 'a test'")
+        mock_popen_cls.assert_has_calls([
+            mock.call(['lspci', '-nnmm'], stdout=subprocess.PIPE),
+            mock.call(['echo', 'a test'], stdout=subprocess.PIPE),
+        ], any_order=True)
+
+    @patch('subprocess.Popen')
+    def test_local_stream(self, mock_popen_cls):
+        mprocess = mock_popen_cls.return_value = mock.MagicMock()
+        mprocess.stdout = StringIO('test')
+        mprocess.wait.return_value = 0
+        fh = inspector.local_stream_command(['echo', 'test'])
+        self.assertEqual(fh.read(), 'test')
+        fh.close()
+        mprocess.wait.assert_called_once_with()
+
+    @patch('subprocess.Popen')
+    def test_local_stream_error(self, mock_popen_cls):
+        mprocess = mock_popen_cls.return_value = mock.MagicMock()
+        mprocess.stdout = StringIO('')
+        mprocess.wait.return_value = mprocess.returncode = 1
+        fh = inspector.local_stream_command(['false'])
+        with self.assertRaises(Exception) as context:
+            fh.close()
+        self.assertEqual(context.exception.message, "RC: 1")
+
     @patch('subprocess.Popen')
     def test_local_call(self, mock_popen_cls):
         mprocess =mock_popen_cls.return_value = mock.MagicMock()
@@ -338,7 +789,7 @@ class CombineRecsTests(unittest.TestCase):
 
 class CLITests(unittest.TestCase):
 
-    OPTIONS = ['bios', 'nic', 'storage', 'gpu', 'cpu']
+    OPTIONS = ['bios', 'nic', 'storage', 'gpu', 'cpu', 'link']
 
     @patch('hwinfo.tools.inspector.system_info')
     @patch('hwinfo.tools.inspector.Host')
@@ -347,7 +798,7 @@ class CLITests(unittest.TestCase):
         argv = ['hwinfo']
         mhost = host_cls.return_value = mock.MagicMock()
         inspector.main()
-        host_cls.assert_called_with('localhost',None, None)
+        host_cls.assert_called_with('localhost',None, None, timeout=300)
         system_info.assert_called_with(mhost, self.OPTIONS)
 
     @patch('hwinfo.tools.inspector.system_info')
@@ -356,7 +807,7 @@ class CLITests(unittest.TestCase):
         sys.argv = ['hwinfo', '-m', 'test', '-u', 'root', '-p', 'pass']
         mhost = host_cls.return_value = mock.MagicMock()
         inspector.main()
-        host_cls.assert_called_with('test', 'root' , 'pass')
+        host_cls.assert_called_with('test', 'root' , 'pass', timeout=300)
         system_info.assert_called_with(mhost, self.OPTIONS)
 
     @patch('hwinfo.tools.inspector.system_info')
@@ -384,6 +835,16 @@ class CLITests(unittest.TestCase):
         inspector.main()
         system_info.assert_called_with(mhost, ['gpu'])
 
+    @patch('hwinfo.tools.inspector.system_info')
+    @patch('hwinfo.tools.inspector.Host')
+    def test_cache_ttl(self, host_cls, system_info):
+        sys.argv = ['hwinfo']
+        inspector.main()
+        host_cls.return_value.set_cache_ttl.assert_called_with(0)
+        sys.argv = ['hwinfo', '--cache-ttl', '60']
+        inspector.main()
+        host_cls.return_value.set_cache_ttl.assert_called_with(60)
+
     @patch('hwinfo.tools.inspector.export_system_info')
     @patch('hwinfo.tools.inspector.Host')
     def test_export(self, host_cls, export_system_info):
@@ -396,6 +857,7 @@ class CLITests(unittest.TestCase):
     def test_validate_args_no_username(self, exit):
         args = mock.MagicMock()
         args.machine = 'test'
+        args.hosts = None
         args.username = None
         args.password = 'test'
         inspector.validate_args(args)
@@ -405,6 +867,7 @@ class CLITests(unittest.TestCase):
     def test_validate_args_no_password(self, exit):
         args = mock.MagicMock()
         args.machine = 'test'
+        args.hosts = None
         args.username = 'user'
         args.password = None
         inspector.validate_args(args)
@@ -413,10 +876,33 @@ class CLITests(unittest.TestCase):
     def test_validate_local_machine(self):
         args = mock.MagicMock()
         args.machine = 'localhost'
+        args.hosts = None
         args.username = None
         args.password = None
         inspector.validate_args(args)
 
+    @patch('sys.exit')
+    def test_validate_args_fleet_needs_credentials(self, exit):
+        args = mock.MagicMock()
+        args.machine = 'localhost'
+        args.hosts = 'hosts.txt'
+        args.username = None
+        args.password = None
+        inspector.validate_args(args)
+        exit.assert_called_with(1)
+
+    @patch('sys.exit')
+    @patch('hwinfo.tools.inspector.scan_fleet')
+    @patch('hwinfo.tools.inspector.Host')
+    def test_fleet(self, host_cls, scan_fleet, exit):
+        sys.argv = ['hwinfo', '-H', 'hosts.txt', '-u', 'root', '-p', 'pass', '-w', '4', '-f', 'nic', '-T', '30']
+        scan_fleet.return_value = 0
+        inspector.main()
+        args, options = scan_fleet.call_args[0]
+        self.assertEqual((args.hosts, args.workers, args.timeout), ('hosts.txt', 4, 30))
+        self.assertEqual(options, ['nic'])
+        exit.assert_called_with(0)
+
     @patch('hwinfo.tools.inspector.system_info')
     @patch('hwinfo.tools.inspector.HostFromTarball')
     def test_from_tarball(self, host_cls, system_info):
@@ -438,3 +924,51 @@ class SystemInfoTests(unittest.TestCase):
         options = ['bios']
         out = inspector.system_info(mhost, options)
         self.assertEqual(len(out.split(" Info:\n\n")), 2)
+
+    def test_print_degraded_links(self):
+        out = inspector.system_info(HostMock(), ['link'])
+        self.assertTrue(out.startswith("Degraded PCIe Link Info:"))
+        self.assertTrue('2.5GT/s x2' in out)
+
+    @patch.object(HostMock, 'get_lspci_vv_data')
+    def test_no_degraded_links_section(self, get_lspci_vv_data):
+        get_lspci_vv_data.side_effect = inspector.CommandError("stderr: lspci: command not found")
+        self.assertEqual(inspector.system_info(HostMock(), ['link']), '')
+
+    @patch.object(HostMock, 'get_lspci_vv_data')
+    def test_degraded_links_parser_errors_raised(self, get_lspci_vv_data):
+        get_lspci_vv_data.side_effect = ValueError("bad record")
+        self.assertRaises(ValueError, inspector.system_info, HostMock(), ['link'])
+
+    def test_export_degraded_links(self):
+        rec = json.loads(inspector.export_system_info(HostMock(), ['link']))
+        self.assertEqual(rec['degraded_pci_links'], [{
+            'device_bus_id': '02:00.0',
+            'class_name': 'Ethernet controller',
+            'device_string': 'Broadcom Corporation NetXtreme II BCM5716 Gigabit Ethernet (rev 20)',
+            'capable': '2.5GT/s x4',
+            'current': '2.5GT/s x2',
+            'capable_gbps': 8.0,
+            'current_gbps': 4.0,
+            'lost_gbps': 4.0,
+        }])
+
+    @patch.object(HostMock, 'get_pci_devices')
+    def test_pci_devices_collected_once(self, get_pci_devices):
+        get_pci_devices.return_value = []
+        options = ['nic', 'storage', 'gpu']
+        inspector.system_info(HostMock(), options)
+        inspector.export_system_info(HostMock(), options)
+        self.assertEqual(get_pci_devices.call_count, 2)
+
+    @patch('hwinfo.tools.inspector.Host')
+    def test_scan_host(self, host_cls):
+        host_cls.return_value = HostMock()
+        rec = inspector.scan_host('test', 'root', 'pass', ['cpu'], timeout=30)
+        host_cls.assert_called_with('test', 'root', 'pass', timeout=30)
+        self.assertEqual(rec.keys(), ['cpu'])
+
+    @patch.object(HostMock, 'get_pci_devices')
+    def test_no_pci_devices_needed(self, get_pci_devices):
+        inspector.export_system_info(HostMock(), ['bios', 'cpu'])
+        self.assertFalse(get_pci_devices.called)
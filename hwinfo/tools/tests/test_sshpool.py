@@ -0,0 +1,275 @@
+import unittest
+import mock
+import itertools
+import socket
+import threading
+
+import paramiko
+
+from hwinfo.tools import inspector
+from hwinfo.tools.sshpool import SSHPool, SSHPoolError, pool_key
+
+KEY = pool_key('test', 'root', 'pass')
+
+def fake_client(active=True):
+    client = mock.MagicMock()
+    client.get_transport.return_value.is_active.return_value = active
+    return client
+
+class SSHPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.pool = SSHPool(max_per_host=2, idle_timeout=300, clock=lambda: self.now)
+        self.connect = mock.Mock(side_effect=lambda: fake_client())
+
+    def test_reuses_released_connection(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.release(client)
+        self.assertTrue(self.pool.acquire(KEY, self.connect) is client)
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertFalse(client.close.called)
+
+    def test_keys(self):
+        self.assertNotEqual(pool_key('test', 'root', 'pass'), pool_key('test', 'root', 'wrong'))
+        self.assertNotEqual(pool_key('test', 'root', 'pass'), pool_key('test', 'admin', 'pass'))
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.release(client)
+        self.pool.acquire(pool_key('test', 'root', 'wrong'), self.connect)
+        self.assertEqual(self.connect.call_count, 2)
+
+    def test_keepalive(self):
+        client = self.pool.acquire(KEY, self.connect)
+        client.get_transport.return_value.set_keepalive.assert_called_with(30)
+
+    def test_cap_per_host(self):
+        self.pool.acquire(KEY, self.connect)
+        self.pool.acquire(KEY, self.connect)
+        self.assertRaises(SSHPoolError, self.pool.acquire, KEY, self.connect, 0)
+        self.assertEqual(self.pool.size(KEY), 2)
+        self.pool.acquire(pool_key('other', 'root', 'pass'), self.connect)
+        self.assertEqual(self.pool.size(), 3)
+
+    def test_timeout_uses_clock(self):
+        # Each reading of the clock is a minute later
+        times = itertools.count(1000, 61)
+        pool = SSHPool(max_per_host=1, clock=lambda: next(times))
+        pool.acquire(KEY, self.connect)
+        self.assertRaises(SSHPoolError, pool.acquire, KEY, self.connect, 60)
+
+    def test_waits_for_release(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.acquire(KEY, self.connect)
+        timer = threading.Timer(0.05, self.pool.release, [client])
+        timer.start()
+        self.assertTrue(self.pool.acquire(KEY, self.connect, 5) is client)
+        timer.join()
+
+    def test_failed_connect_frees_slot(self):
+        self.connect.side_effect = [Exception("Authentication failed."), fake_client(), fake_client()]
+        self.assertRaises(Exception, self.pool.acquire, KEY, self.connect)
+        self.pool.acquire(KEY, self.connect)
+        self.pool.acquire(KEY, self.connect)
+        self.assertEqual(self.pool.size(KEY), 2)
+
+    def test_dead_connection_replaced(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.release(client)
+        client.get_transport.return_value.is_active.return_value = False
+        self.assertFalse(self.pool.acquire(KEY, self.connect) is client)
+        self.assertTrue(client.close.called)
+        self.assertEqual(self.pool.size(KEY), 1)
+
+    def test_dropped_connection_replaced(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.release(client)
+        # The transport still looks active, but the other end has gone
+        client.get_transport.return_value.send_ignore.side_effect = EOFError()
+        self.assertFalse(self.pool.acquire(KEY, self.connect) is client)
+        self.assertTrue(client.close.called)
+        self.assertEqual(self.pool.size(KEY), 1)
+
+    def test_probe_does_not_hold_lock(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.release(client)
+        probing = threading.Event()
+        answered = threading.Event()
+
+        def send_ignore():
+            probing.set()
+            answered.wait(5)
+        client.get_transport.return_value.send_ignore.side_effect = send_ignore
+        thread = threading.Thread(target=self.pool.acquire, args=(KEY, self.connect))
+        thread.start()
+        try:
+            self.assertTrue(probing.wait(5))
+            # Other hosts, and the pool's own state, are still available
+            self.pool.acquire(pool_key('other', 'root', 'pass'), self.connect, 0)
+            self.assertEqual(self.pool.size(), 2)
+        finally:
+            answered.set()
+            thread.join()
+        self.assertTrue(client in self.pool.borrowed)
+
+    def test_dead_connection_not_returned(self):
+        client = self.pool.acquire(KEY, self.connect)
+        client.get_transport.return_value = None
+        self.pool.release(client)
+        self.assertTrue(client.close.called)
+        self.assertEqual(self.pool.size(), 0)
+
+    def test_idle_eviction(self):
+        first = self.pool.acquire(KEY, self.connect)
+        second = self.pool.acquire(KEY, self.connect)
+        self.pool.release(first)
+        self.now += 200
+        self.pool.release(second)
+        self.now += 100
+        self.pool.evict_idle()
+        self.assertTrue(first.close.called)
+        self.assertFalse(second.close.called)
+        self.assertEqual(self.pool.size(KEY), 1)
+
+    def test_discard(self):
+        client = self.pool.acquire(KEY, self.connect)
+        self.pool.discard(client)
+        self.assertTrue(client.close.called)
+        self.assertEqual(self.pool.size(), 0)
+
+    def test_release_unknown_client(self):
+        client = fake_client()
+        self.pool.release(client)
+        self.assertTrue(client.close.called)
+
+    def test_close(self):
+        idle = self.pool.acquire(KEY, self.connect)
+        borrowed = self.pool.acquire(KEY, self.connect)
+        self.pool.release(idle)
+        self.pool.close()
+        self.assertTrue(idle.close.called)
+        self.pool.release(borrowed)
+        self.assertTrue(borrowed.close.called)
+        self.assertEqual(self.pool.size(), 0)
+
+    def test_acquire_after_close(self):
+        self.pool.close()
+        self.assertRaises(SSHPoolError, self.pool.acquire, KEY, self.connect)
+        self.assertFalse(self.connect.called)
+
+
+class HostPoolTests(unittest.TestCase):
+
+    @mock.patch('hwinfo.tools.inspector.get_ssh_client')
+    def test_hosts_share_connection(self, get_ssh_client):
+        get_ssh_client.side_effect = lambda host, username, password, timeout: fake_client()
+        pool = SSHPool()
+        with mock.patch.object(inspector.Host, 'ssh_pool', pool):
+            host = inspector.Host('test', 'root', 'pass')
+            client = host.client
+            host.close()
+            self.assertFalse(client.close.called)
+            self.assertTrue(inspector.Host('test', 'root', 'pass').client is client)
+        get_ssh_client.assert_called_once_with('test', 'root', 'pass', 10)
+
+    @mock.patch('hwinfo.tools.inspector.get_ssh_client')
+    def test_no_pool(self, get_ssh_client):
+        host = inspector.Host('test', 'root', 'pass')
+        client = host.client
+        host.close()
+        client.close.assert_called_once_with()
+
+
+class StubServer(paramiko.ServerInterface):
+    """Accepts root/pass and answers every exec with the command line"""
+
+    def check_auth_password(self, username, password):
+        if (username, password) == ('root', 'pass'):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        def reply():
+            channel.sendall(command + '\n')
+            channel.send_exit_status(0)
+            channel.close()
+        # Reply once the server has acknowledged the exec request
+        threading.Timer(0.05, reply).start()
+        return True
+
+class InProcessServerTests(unittest.TestCase):
+    """The pool against a real paramiko server on the loopback interface"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.host_key = paramiko.RSAKey.generate(1024)
+
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.accepting = True
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.accepting = False
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+    def _serve(self):
+        while self.accepting:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            self.transports.append(transport)
+            transport.start_server(server=StubServer())
+
+    def _connect(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect('127.0.0.1', port=self.port, username='root', password='pass',
+                       timeout=10, look_for_keys=False, allow_agent=False)
+        return client
+
+    def test_borrowed_connection_runs_commands(self):
+        pool = SSHPool(keepalive=5)
+        key = pool_key('127.0.0.1', 'root', 'pass')
+        client = pool.acquire(key, self._connect)
+        self.assertEqual(inspector.remote_command(client, ['lspci', '-nnmm']), 'lspci -nnmm\n')
+        pool.release(client)
+
+        again = pool.acquire(key, self._connect)
+        self.assertTrue(again is client)
+        self.assertEqual(inspector.remote_command(again, ['dmidecode']), 'dmidecode\n')
+        self.assertEqual(len(self.transports), 1)
+        pool.release(again)
+        pool.close()
+
+    def test_dropped_connection_replaced(self):
+        pool = SSHPool()
+        key = pool_key('127.0.0.1', 'root', 'pass')
+        client = pool.acquire(key, self._connect)
+        pool.release(client)
+
+        self.transports[0].close()
+        client.get_transport().join(5)
+        again = pool.acquire(key, self._connect)
+        self.assertFalse(again is client)
+        self.assertEqual(inspector.remote_command(again, ['dmidecode']), 'dmidecode\n')
+        pool.release(again)
+        pool.close()
@@ -1,39 +1,309 @@
 """Util Module for functionality shared between modules"""
 
+import os
 import re
+import hashlib
+import sys
+import mmap
+import multiprocessing
 
-def combine_dicts(recs):
-    """Combine a list of recs, appending values to matching keys"""
+from hwinfo.util.cache import cache_key
+
+CHUNK_SIZE = 64 * 1024
+
+# Outputs smaller than this are not worth forking worker processes for
+PARALLEL_MIN_SIZE = 1024 * 1024
+
+# Shards handed out per worker process, to even out uneven items
+SHARDS_PER_PROCESS = 4
+
+# Data types parsed in place, with bytes regexs, rather than as strings
+BUFFER_TYPES = (mmap.mmap, memoryview)
+
+_NON_SPACE = re.compile(br'\S')
+
+def combine_dicts(recs, as_lists=False):
+    """Combine a list of recs, appending values to matching keys
+
+    Repeated values are joined into a single ', ' separated string. With
+    as_lists set, every key maps to the list of its values instead.
+    """
     if not recs:
         return None
 
-    if len(recs) == 1:
+    if len(recs) == 1 and not as_lists:
         return recs.pop()
 
     new_rec = {}
     for rec in recs:
         for k, v in rec.iteritems():
             if k in new_rec:
-                new_rec[k] = "%s, %s" % (new_rec[k], v)
+                new_rec[k].append(v)
+            else:
+                new_rec[k] = [v]
+
+    if as_lists:
+        return new_rec
+    return join_values(new_rec)
+
+def join_values(rec):
+    """Return the ', ' joined string view of a rec holding value lists"""
+    joined = {}
+    for k, v in rec.iteritems():
+        if not isinstance(v, list):
+            joined[k] = v
+        elif len(v) == 1:
+            joined[k] = v[0]
+        else:
+            joined[k] = ", ".join(["%s" % value for value in v])
+    return joined
+
+def iter_split(fileobj, seperator, chunk_size=CHUNK_SIZE):
+    """Split a file-like object on seperator while reading it in chunks
+
+    Yields the same items as fileobj.read().strip().split(seperator), each
+    one as soon as the seperator following it has been read.
+    """
+    # Trailing whitespace is stripped from the whole output, so with a
+    # whitespace seperator any blank items are held back until some content
+    # follows them, and the last item with content until we know whether it
+    # is the final one.
+    ws_sep = not seperator.strip()
+    pending = ''
+    started = False
+    last = None
+    blanks = []
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+
+        search_from = max(len(pending) - len(seperator) + 1, 0)
+        pending += chunk
+        start = 0
+        idx = pending.find(seperator, search_from)
+        while idx != -1:
+            item = pending[start:idx]
+            if item.strip() or not ws_sep:
+                if last is not None:
+                    yield last
+                for blank in blanks:
+                    yield blank
+                blanks = []
+                last = item
+            else:
+                blanks.append(item)
+            start = idx + len(seperator)
+            idx = pending.find(seperator, start)
+        pending = pending[start:]
+
+    if not started:
+        yield ''
+    elif pending.strip() or not ws_sep:
+        if last is not None:
+            yield last
+        for blank in blanks:
+            yield blank
+        yield pending.rstrip()
+    else:
+        yield last.rstrip()
+
+def to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+def decode_groups(groups):
+    """Decode the captured bytes in a match groupdict"""
+    rec = {}
+    for k, v in groups.iteritems():
+        if v is not None:
+            v = v.decode('utf-8', 'replace')
+        rec[k] = v
+    return rec
+
+def map_file(filename):
+    """Memory-map filename for reading, or return '' if it is empty"""
+    fh = open(filename, 'rb')
+    try:
+        if not os.fstat(fh.fileno()).st_size:
+            return ''
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        fh.close()
+
+def as_searchable(buf):
+    if isinstance(buf, memoryview) and sys.version_info[0] < 3:
+        # re can not search a memoryview on python 2
+        return buf.tobytes()
+    return buf
+
+def strip_span(buf):
+    """Return the (start, end) offsets of buf.strip() within buf"""
+    m = _NON_SPACE.search(buf)
+    if m is None:
+        return 0, 0
+    end = len(buf)
+    while bytes(buf[end - 1:end]).isspace():
+        end -= 1
+    return m.start(), end
+
+def iter_spans(buf, seperator):
+    """Yield the (start, end) offsets of the items in buf
+
+    The spans cover the same items as buf.strip().split(seperator), without
+    copying any of them out of buf.
+    """
+    start, end = strip_span(buf)
+    if not seperator:
+        yield start, end
+        return
+
+    sep = re.compile(re.escape(to_bytes(seperator)))
+    pos = start
+    m = sep.search(buf, pos, end)
+    while m is not None:
+        yield pos, m.start()
+        pos = m.end()
+        m = sep.search(buf, pos, end)
+    yield pos, end
+
+class ParsePlan(object):
+    """A set of item regexs compiled once and shared between parsers"""
+
+    def __init__(self, regexs):
+        self.regexs = tuple(regexs)
+        self.compiled = [re.compile(regex) for regex in self.regexs]
+        self.compiled_bytes = None
+        self.digest = hashlib.sha1(repr(self.regexs)).hexdigest()
+
+    def parse_item(self, item, as_lists=False):
+        rec = {}
+        for regex in self.compiled:
+            matches = [m.groupdict() for m in regex.finditer(item)]
+            mdicts = combine_dicts(matches, as_lists)
+            if mdicts:
+                rec.update(mdicts)
+        return rec
+
+    def parse_span(self, buf, start, end, as_lists=False):
+        """Parse buf[start:end] in place, decoding only the captured fields"""
+        if self.compiled_bytes is None:
+            self.compiled_bytes = [re.compile(to_bytes(regex)) for regex in self.regexs]
+        rec = {}
+        for regex in self.compiled_bytes:
+            matches = [decode_groups(m.groupdict()) for m in regex.finditer(buf, start, end)]
+            mdicts = combine_dicts(matches, as_lists)
+            if mdicts:
+                rec.update(mdicts)
+        return rec
+
+class KeyValuePlan(object):
+    """A single pass tokenizer for 'key : value' style outputs
+
+    Each line is split once on the first colon and the key looked up in a
+    table of field names. Records match those of the equivalent
+    '<key>[ \\t]+: (?P<field>.*)' regexs: the key must be followed by
+    whitespace, and the value is whatever follows ': '.
+    """
+
+    def __init__(self, keys):
+        self.keys = dict(keys)
+        self.digest = hashlib.sha1(repr(sorted(self.keys.items()))).hexdigest()
+
+    def parse_item(self, item, as_lists=False):
+        keys = self.keys
+        rec = {}
+        repeated = {}
+        for line in item.split('\n'):
+            key, sep, value = line.partition(':')
+            if not sep or not key or key[-1] not in ' \t' or value[:1] != ' ':
+                continue
+            field = keys.get(key.strip())
+            if field is None:
+                continue
+            value = value[1:]
+            if as_lists:
+                rec.setdefault(field, []).append(value)
+            elif field in rec:
+                repeated.setdefault(field, [rec[field]]).append(value)
             else:
-                new_rec[k] = v
-    return new_rec
+                rec[field] = value
+        if repeated:
+            rec.update(join_values(repeated))
+        return rec
+
+    def parse_span(self, buf, start, end, as_lists=False):
+        item = bytes(buf[start:end]).decode('utf-8', 'replace')
+        return self.parse_item(item, as_lists)
+
+_PLANS = {}
+
+def get_parse_plan(regexs):
+    """Return the shared ParsePlan for a list of regexs, compiling on first use"""
+    key = tuple(regexs)
+    plan = _PLANS.get(key)
+    if plan is None:
+        plan = _PLANS[key] = ParsePlan(key)
+    return plan
+
+def get_key_value_plan(keys):
+    """Return the shared KeyValuePlan for a key to field name mapping"""
+    key = ('keys', frozenset(keys.iteritems()))
+    plan = _PLANS.get(key)
+    if plan is None:
+        plan = _PLANS[key] = KeyValuePlan(keys)
+    return plan
+
+# Parser class -> (ITEM_REGEXS, ITEM_KEYS, plan), see CommandParser.get_plan
+_CLASS_PLANS = {}
+
+def get_plan(regexs, keys=None):
+    if keys:
+        return get_key_value_plan(keys)
+    return get_parse_plan(regexs)
+
+def parse_shard(args):
+    """Parse a list of items in a worker process"""
+    regexs, keys, items, as_lists, is_bytes = args
+    plan = get_plan(regexs, keys)
+    if is_bytes:
+        return [plan.parse_span(item, 0, len(item), as_lists) for item in items]
+    return [plan.parse_item(item, as_lists) for item in items]
 
 class CommandParser(object):
     """Object for extending to parse command outputs"""
 
     ITEM_REGEXS = []
+    # Optional mapping of 'key : value' keys to field names. When set, items
+    # are parsed with a line tokenizer instead of ITEM_REGEXS.
+    ITEM_KEYS = None
     ITEM_SEPERATOR = False
     DATA = None
     MUST_HAVE_FIELDS = []
+    # Optional hwinfo.util.cache.ParseCache for parse and parse_items results
+    CACHE = None
+    # Part of the cache key. Bump it when a change to the parser's code,
+    # rather than to its regexs or keys, changes the records it returns.
+    CACHE_VERSION = 1
 
-    def __init__(self, data, regexs=None, seperator=None):
+    def __init__(self, data=None, regexs=None, seperator=None, cache=None):
         self.set_data(data)
         self.set_regexs(regexs)
         self.set_seperator(seperator)
+        self.set_cache(cache)
 
     def set_data(self, data):
-        if data:
+        if isinstance(data, BUFFER_TYPES):
+            data = as_searchable(data)
+        if isinstance(data, BUFFER_TYPES):
+            self.DATA = data
+        elif data:
             self.DATA = data.strip()
         else:
             self.DATA = ""
@@ -41,33 +311,142 @@ class CommandParser(object):
     def set_regexs(self, regexs):
         if regexs:
             self.ITEM_REGEXS = regexs
+            self.ITEM_KEYS = None
 
     def set_seperator(self, seperator):
         if seperator:
             self.ITEM_SEPERATOR = seperator
 
-    def parse_item(self, item):
-        rec = {}
-        for regex in self.ITEM_REGEXS:
-            matches = [m.groupdict() for m in re.finditer(regex, item)]
-            mdicts = combine_dicts(matches)
-            if mdicts:
-                rec = dict(list(rec.items()) + list(mdicts.items()))
-        return rec
+    def set_cache(self, cache):
+        if cache:
+            self.CACHE = cache
+
+    def get_plan(self):
+        """The plan for this parser's fields, looked up once per class
+
+        Hashing the fields to find their shared plan costs more than a
+        small item takes to parse, so each class remembers its plan for as
+        long as it keeps the same ITEM_REGEXS and ITEM_KEYS objects.
+        """
+        cls = type(self)
+        cached = _CLASS_PLANS.get(cls)
+        if cached is not None and cached[0] is self.ITEM_REGEXS and cached[1] is self.ITEM_KEYS:
+            return cached[2]
+        plan = get_plan(self.ITEM_REGEXS, self.ITEM_KEYS)
+        if self.ITEM_REGEXS is cls.ITEM_REGEXS and self.ITEM_KEYS is cls.ITEM_KEYS:
+            _CLASS_PLANS[cls] = (self.ITEM_REGEXS, self.ITEM_KEYS, plan)
+        return plan
+
+    def _cached(self, method, as_lists, parse):
+        if self.CACHE is None:
+            return parse(as_lists)
+        key = cache_key(type(self), self.get_plan().digest, method, as_lists, self.DATA)
+        return self.CACHE.fetch(key, lambda: parse(as_lists))
+
+    def parse_item(self, item, as_lists=False):
+        return self.get_plan().parse_item(item, as_lists)
 
-    def parse_items(self):
+    def parse_items(self, as_lists=False):
+        return self._cached('parse_items', as_lists, self._parse_items)
+
+    def _parse_items(self, as_lists):
+        if isinstance(self.DATA, BUFFER_TYPES):
+            return self.parse_buffer(self.DATA, as_lists)
+        plan = self.get_plan()
         if not self.ITEM_SEPERATOR:
-            return [self.parse_item(self.DATA)]
+            return [plan.parse_item(self.DATA, as_lists)]
         else:
             recs = []
             for data in self.DATA.decode().split(self.ITEM_SEPERATOR):
-                rec = self.parse_item(data)
+                rec = plan.parse_item(data, as_lists)
                 recs.append(rec)
             return recs
 
-    def parse(self):
+    def parse_items_parallel(self, processes=None, min_size=PARALLEL_MIN_SIZE, as_lists=False):
+        """Parse items across a pool of worker processes
+
+        The items are split into shards at ITEM_SEPERATOR boundaries and the
+        shards parsed concurrently. Records are returned in input order, the
+        same as parse_items. Outputs smaller than min_size are parsed
+        serially, since forking the pool would cost more than it saves.
+
+        The workers only run the plan over each item, so parsers that
+        override _parse_items or _parse are always parsed serially.
+        """
+        processes = processes or multiprocessing.cpu_count()
+        if processes < 2 or not self.ITEM_SEPERATOR or len(self.DATA) < min_size \
+                or self.overrides_parsing():
+            return self.parse_items(as_lists)
+
+        return self._cached('parse_items', as_lists,
+                            lambda as_lists: self._parse_items_parallel(processes, as_lists))
+
+    def overrides_parsing(self):
+        """Whether this parser replaces the plan based item parsing"""
+        cls = type(self)
+        return cls._parse_items.im_func is not CommandParser._parse_items.im_func \
+            or cls._parse.im_func is not CommandParser._parse.im_func
+
+    def _parse_items_parallel(self, processes, as_lists):
+        is_bytes = isinstance(self.DATA, BUFFER_TYPES)
+        if is_bytes:
+            items = [bytes(self.DATA[start:end])
+                     for start, end in iter_spans(self.DATA, self.ITEM_SEPERATOR)]
+        else:
+            items = self.DATA.decode().split(self.ITEM_SEPERATOR)
+
+        shard_size = max(len(items) // (processes * SHARDS_PER_PROCESS), 1)
+        keys = self.ITEM_KEYS and dict(self.ITEM_KEYS)
+        shards = [(tuple(self.ITEM_REGEXS), keys, items[i:i + shard_size], as_lists, is_bytes)
+                  for i in range(0, len(items), shard_size)]
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(parse_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+
+        recs = []
+        for shard_recs in results:
+            recs.extend(shard_recs)
+        return recs
+
+    def iter_items(self, fileobj, chunk_size=CHUNK_SIZE, as_lists=False):
+        """Parse the output in fileobj, yielding records as they are read
+
+        fileobj can be anything with a read(size) method, e.g. a file, a
+        subprocess pipe or a paramiko channel file. The records are the same
+        as those parse_items would return for the whole output, but only the
+        item currently being parsed is held in memory.
+        """
+        plan = self.get_plan()
+        if not self.ITEM_SEPERATOR:
+            yield plan.parse_item(fileobj.read().strip(), as_lists)
+            return
+
+        for item in iter_split(fileobj, self.ITEM_SEPERATOR, chunk_size):
+            yield plan.parse_item(item, as_lists)
+
+    def parse_buffer(self, buf, as_lists=False):
+        """Parse the output held in an mmap or other bytes buffer
+
+        The regexs run directly against buf and only the captured fields are
+        decoded, so the output is never copied into a string.
+        """
+        plan = self.get_plan()
+        buf = as_searchable(buf)
+        return [plan.parse_span(buf, start, end, as_lists)
+                for start, end in iter_spans(buf, self.ITEM_SEPERATOR)]
+
+    def parse(self, as_lists=False):
         if self.ITEM_SEPERATOR:
             raise Exception("A seperator has been specified: '%s'. " + \
             "Please use 'parse_items' instead")
 
-        return self.parse_item(self.DATA)
+        return self._cached('parse', as_lists, self._parse)
+
+    def _parse(self, as_lists):
+        if isinstance(self.DATA, BUFFER_TYPES):
+            return self.parse_buffer(self.DATA, as_lists)[0]
+        return self.parse_item(self.DATA, as_lists)
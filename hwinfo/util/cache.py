@@ -0,0 +1,265 @@
+"""Caches of parsed records, content addressed on disk or held in memory"""
+
+import os
+import json
+import zlib
+import time
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+SUFFIX = '.json.z'
+
+def content_digest(data):
+    """sha1 of a parser's data, which may be a string or a bytes buffer"""
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+def cache_key(parser_cls, plan_digest, method, as_lists, data):
+    """Key for the records parser_cls produces from data with a given plan
+
+    The parser's CACHE_VERSION is part of the key, so parsers whose output
+    comes from code rather than from their plan can retire old entries.
+    """
+    parts = [
+        "%s.%s" % (parser_cls.__module__, parser_cls.__name__),
+        str(getattr(parser_cls, 'CACHE_VERSION', 0)),
+        plan_digest,
+        method,
+        as_lists and 'lists' or 'strings',
+        content_digest(data),
+    ]
+    return hashlib.sha1('|'.join(parts)).hexdigest()
+
+def _has_unicode(value):
+    if isinstance(value, unicode):
+        return True
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, list):
+        for item in value:
+            if _has_unicode(item):
+                return True
+    return False
+
+def restore_strings(value, text_type):
+    """Undo JSON turning every string into unicode
+
+    Keys become str, as parsers produce them, and values text_type.
+    """
+    if isinstance(value, unicode):
+        if text_type is str:
+            return value.encode('utf-8')
+        return value
+    if isinstance(value, list):
+        return [restore_strings(item, text_type) for item in value]
+    if isinstance(value, dict):
+        return dict([(k.encode('utf-8'), restore_strings(v, text_type))
+                     for k, v in value.iteritems()])
+    return value
+
+class ParseCache(object):
+    """Parsed records stored as compressed JSON files in a directory
+
+    Entries are evicted least recently used first once the directory grows
+    past max_bytes. Reading an entry updates its mtime, which is what the
+    eviction order is based on. The total size is tracked as entries are
+    written, so the directory is only listed when it has to be evicted.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total = None
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Every lookup is then a miss, and nothing is stored
+                pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """Return the records stored for key, or None"""
+        path = self._path(key)
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            text, recs = json.loads(zlib.decompress(fh.read()))
+            text_type = {'str': str, 'unicode': unicode}[text]
+        except (ValueError, TypeError, KeyError, zlib.error):
+            # A damaged entry is a miss, and is dropped
+            fh.close()
+            self._remove(path)
+            self.total = None
+            return None
+        fh.close()
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        # Hand back the same string types the parser produced
+        return restore_strings(recs, text_type)
+
+    def put(self, key, recs):
+        text = _has_unicode(recs) and 'unicode' or 'str'
+        data = zlib.compress(json.dumps([text, recs], separators=(',', ':')))
+        path = self._path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            fh = os.fdopen(fd, 'wb')
+            try:
+                fh.write(data)
+            finally:
+                fh.close()
+            os.rename(tmppath, path)
+        except EnvironmentError:
+            self._remove(tmppath)
+            raise
+
+        if self.total is None:
+            self.total = self.size()
+        else:
+            self.total += len(data) - replaced
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def fetch(self, key, parse):
+        """Return the records for key, calling parse() to create them on a miss
+
+        The cache is only an optimization, so records that can't be stored,
+        e.g. in a read-only or full directory, are returned all the same.
+        """
+        recs = self.get(key)
+        if recs is None:
+            recs = parse()
+            try:
+                self.put(key, recs)
+            except (EnvironmentError, ValueError, TypeError):
+                # ValueError covers UnicodeDecodeError, from JSON encoding
+                # byte strings that aren't UTF-8
+                pass
+        return recs
+
+    def _entries(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def size(self):
+        return sum([size for _, size, _ in self._entries()])
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes"""
+        entries = sorted(self._entries())
+        total = sum([size for _, size, _ in entries])
+        while entries and total > self.max_bytes:
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+        self.total = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+        self.total = 0
+
+class MemoCache(object):
+    """Results held in memory, which expire ttl seconds after being stored
+
+    Safe to share between threads. Threads fetching the same missing key
+    wait for the first one's create() rather than repeating it.
+    """
+
+    def __init__(self, ttl, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key, default):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if self.clock() >= expires:
+            self.entries.pop(key, None)
+            return default
+        return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self._get(key, default)
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+
+    def fetch(self, key, create):
+        """Return the value for key, calling create() to make it on a miss
+
+        Failures are not cached, so the next fetch calls create() again.
+        """
+        missing = object()
+        with self.lock:
+            value = self._get(key, missing)
+            if value is not missing:
+                return value
+            pending = self.pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.pending[key] = threading.Event()
+
+        if not owner:
+            # Another thread is creating it; if that fails, try ourselves
+            pending.wait()
+            return self.fetch(key, create)
+
+        try:
+            value = create()
+            self.put(key, value)
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.set()
+        return value
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def invalidate(self, key=None):
+        """Drop the entry for key, or every entry if no key is given"""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
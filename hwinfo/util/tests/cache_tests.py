@@ -0,0 +1,244 @@
+"""Unittests for the parse result cache"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import mock
+
+from hwinfo.util import CommandParser
+from hwinfo.util.cache import ParseCache, MemoCache, cache_key
+
+class TestParseCache(unittest.TestCase):
+
+    DATA = "eth0 Link encap:Ethernet\n\nlo Link encap:Local Loopback"
+    REGEXS = [r'Link encap:(?P<encap>[\w]+)']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParseCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _parser(self, data=None, regexs=None):
+        return CommandParser(data or self.DATA, regexs or self.REGEXS, '\n\n', self.cache)
+
+    def test_miss_then_hit(self):
+        recs = self._parser().parse_items()
+        self.assertEqual(recs, [{'encap': 'Ethernet'}, {'encap': 'Local'}])
+        with mock.patch('hwinfo.util.ParsePlan.parse_item') as parse_item:
+            self.assertEqual(self._parser().parse_items(), recs)
+            self.assertFalse(parse_item.called)
+
+    def test_key_depends_on_content_regexs_and_mode(self):
+        key = cache_key(CommandParser, 'plan', 'parse_items', False, self.DATA)
+        self.assertNotEqual(key, cache_key(CommandParser, 'plan', 'parse_items', False, self.DATA + ' '))
+        self.assertNotEqual(key, cache_key(CommandParser, 'other', 'parse_items', False, self.DATA))
+        self.assertNotEqual(key, cache_key(CommandParser, 'plan', 'parse_items', True, self.DATA))
+        self.assertNotEqual(key, cache_key(CommandParser, 'plan', 'parse', False, self.DATA))
+
+    def test_regex_change_is_a_miss(self):
+        self._parser().parse_items()
+        recs = self._parser(regexs=[r'(?P<name>\w+)\ Link']).parse_items()
+        self.assertEqual(recs, [{'name': 'eth0'}, {'name': 'lo'}])
+
+    def test_parse(self):
+        cp = CommandParser(self.DATA, self.REGEXS, cache=self.cache)
+        self.assertEqual(cp.parse(as_lists=True), {'encap': ['Ethernet', 'Local']})
+        self.assertEqual(cp.parse(as_lists=True), {'encap': ['Ethernet', 'Local']})
+        self.assertEqual(cp.parse(), {'encap': 'Ethernet, Local'})
+
+    def test_damaged_entry_is_a_miss(self):
+        self.cache.put('abc', [{'a': 'b'}])
+        fh = open(os.path.join(self.directory, 'abc.json.z'), 'wb')
+        fh.write('not compressed')
+        fh.close()
+        self.assertEqual(self.cache.get('abc'), None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_lru_eviction(self):
+        self.cache.put('one', [{'v': 'x' * 100}])
+        entry_size = self.cache.size()
+        self.cache.max_bytes = entry_size * 2
+        self.cache.put('two', [{'v': 'y' * 100}])
+        past = time.time() - 100
+        os.utime(os.path.join(self.directory, 'one.json.z'), (past, past))
+        os.utime(os.path.join(self.directory, 'two.json.z'), (past - 10, past - 10))
+        # Reading 'two' makes 'one' the least recently used
+        self.assertEqual(self.cache.get('two'), [{'v': 'y' * 100}])
+        self.cache.put('three', [{'v': 'z' * 100}])
+        self.assertEqual(self.cache.get('one'), None)
+        self.assertNotEqual(self.cache.get('two'), None)
+        self.assertNotEqual(self.cache.get('three'), None)
+        self.assertTrue(self.cache.size() <= self.cache.max_bytes)
+
+    def test_version_in_key(self):
+        class NewParser(CommandParser):
+            CACHE_VERSION = 2
+
+        key = cache_key(CommandParser, 'plan', 'parse', False, self.DATA)
+        self.assertNotEqual(key, cache_key(NewParser, 'plan', 'parse', False, self.DATA))
+        NewParser.__name__ = 'CommandParser'
+        NewParser.__module__ = CommandParser.__module__
+        self.assertNotEqual(key, cache_key(NewParser, 'plan', 'parse', False, self.DATA))
+
+    def test_hit_has_miss_types(self):
+        miss = self._parser().parse_items()
+        hit = self._parser().parse_items()
+        self.assertEqual(hit, miss)
+        self.assertEqual(type(hit[0]['encap']), type(miss[0]['encap']))
+        self.assertEqual(type(hit[0].keys()[0]), str)
+
+        cp = CommandParser(self.DATA, self.REGEXS, cache=self.cache)
+        miss = cp.parse()
+        hit = CommandParser(self.DATA, self.REGEXS, cache=self.cache).parse()
+        self.assertEqual(type(miss['encap']), str)
+        self.assertEqual(type(hit['encap']), str)
+
+    def test_size_tracked_without_listing(self):
+        self.cache.put('one', [{'v': 'x'}])
+        with mock.patch.object(self.cache, '_entries') as entries:
+            self.cache.put('two', [{'v': 'y'}])
+            self.cache.put('two', [{'v': 'yy'}])
+            self.assertFalse(entries.called)
+        self.assertEqual(self.cache.total, self.cache.size())
+
+    def _entries(self):
+        return [f for f in os.listdir(self.directory) if f.endswith('.json.z')]
+
+    def test_unwritable_directory(self):
+        with mock.patch('tempfile.mkstemp', side_effect=OSError(13, "Permission denied")):
+            self.assertEqual(self._parser().parse_items(), [{'encap': 'Ethernet'}, {'encap': 'Local'}])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_rename_cleaned_up(self):
+        with mock.patch('os.rename', side_effect=OSError(28, "No space left on device")):
+            self.assertEqual(len(self._parser().parse_items()), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_directory_not_created(self):
+        with mock.patch('os.makedirs', side_effect=OSError(13, "Permission denied")):
+            cache = ParseCache(os.path.join(self.directory, 'missing'))
+        self.assertEqual(cache.fetch('abc', lambda: [{'a': 'b'}]), [{'a': 'b'}])
+
+    def test_non_ascii_records(self):
+        utf8 = [{'name': 'caf\xc3\xa9'}]
+        self.assertEqual(self.cache.fetch('utf8', lambda: utf8), utf8)
+        self.assertEqual(self.cache.fetch('utf8', lambda: None), utf8)
+        self.assertTrue(isinstance(self.cache.get('utf8')[0]['name'], str))
+
+        latin1 = [{'name': 'caf\xe9'}]
+        self.assertEqual(self.cache.fetch('latin1', lambda: latin1), latin1)
+        self.assertEqual(self.cache.get('latin1'), None)
+        self.assertEqual(len(self._entries()), 1)
+
+    def test_clear(self):
+        self.cache.put('one', [])
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+
+class TestMemoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = MemoCache(60, clock=lambda: self.now)
+
+    def test_miss(self):
+        self.assertEqual(self.cache.get('lspci'), None)
+
+    def test_hit(self):
+        self.cache.put('lspci', 'output')
+        self.assertEqual(self.cache.get('lspci'), 'output')
+
+    def test_expires(self):
+        self.cache.put('lspci', 'output')
+        self.now += 59
+        self.assertEqual(self.cache.get('lspci'), 'output')
+        self.now += 1
+        self.assertEqual(self.cache.get('lspci'), None)
+        self.assertEqual(self.cache.keys(), [])
+
+    def test_fetch(self):
+        create = mock.Mock(return_value=['rec'])
+        self.assertEqual(self.cache.fetch('lspci', create), ['rec'])
+        self.assertEqual(self.cache.fetch('lspci', create), ['rec'])
+        self.assertEqual(create.call_count, 1)
+
+    def test_fetch_caches_none(self):
+        create = mock.Mock(return_value=None)
+        self.cache.fetch('lspci', create)
+        self.cache.fetch('lspci', create)
+        self.assertEqual(create.call_count, 1)
+
+    def test_fetch_failure_not_cached(self):
+        create = mock.Mock(side_effect=[IOError(), 'output'])
+        self.assertRaises(IOError, self.cache.fetch, 'lspci', create)
+        self.assertEqual(self.cache.fetch('lspci', create), 'output')
+
+    def test_invalidate_key(self):
+        self.cache.put('lspci', 'output')
+        self.cache.put('dmidecode', 'output')
+        self.cache.invalidate('lspci')
+        self.assertEqual(self.cache.keys(), ['dmidecode'])
+
+    def test_invalidate_all(self):
+        self.cache.put('lspci', 'output')
+        self.cache.put('dmidecode', 'output')
+        self.cache.invalidate()
+        self.assertEqual(self.cache.keys(), [])
+
+    def test_fetch_from_threads_creates_once(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def create():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'output'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.fetch('lspci', create)))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['output'] * 4)
+
+    def test_waiting_thread_retries_after_failure(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise IOError()
+
+        errors = []
+
+        def first():
+            try:
+                self.cache.fetch('lspci', fail)
+            except IOError:
+                errors.append(1)
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        started.wait(5)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(self.cache.fetch('lspci', lambda: 'output')))
+        waiter.start()
+        release.set()
+        thread.join(5)
+        waiter.join(5)
+        self.assertEqual(errors, [1])
+        self.assertEqual(results, ['output'])
@@ -1,7 +1,12 @@
 """Unittests for parser objects"""
 
 import unittest
-from hwinfo.util import CommandParser
+import tempfile
+from mock import patch
+from StringIO import StringIO
+from hwinfo.util import CommandParser, ParsePlan, KeyValuePlan, get_parse_plan, iter_split
+from hwinfo.util import combine_dicts, join_values, map_file, iter_spans
+from hwinfo.bench import suite
 
 class TestCommandParser(unittest.TestCase):
 
@@ -81,3 +86,228 @@ eth0      Link encap:Ethernet  HWaddr f8:b1:56:d5:e6:8c
         regexs = [r'(?<anything>[\w+])']
         cp = CommandParser(data, regexs, seperator='\n')
         self.assertRaises(Exception, cp.parse)
+
+
+class TestParsePlan(unittest.TestCase):
+
+    REGEXS = [r'four:\ (?P<num>\w+)', r'(?P<first>\w+)\ two']
+
+    def test_parse_item(self):
+        plan = ParsePlan(self.REGEXS)
+        rec = plan.parse_item('one two three four: 845 six')
+        self.assertEqual(rec, {'num': '845', 'first': 'one'})
+
+    def test_plan_is_shared(self):
+        cp_a = CommandParser('a', list(self.REGEXS))
+        cp_b = CommandParser('b', list(self.REGEXS))
+        self.assertTrue(cp_a.get_plan() is cp_b.get_plan())
+
+    def test_plan_follows_regexs(self):
+        cp = CommandParser('one two three four: 845 six', self.REGEXS)
+        plan = cp.get_plan()
+        cp.ITEM_REGEXS = [r'three\ (?P<next>\w+)']
+        self.assertFalse(cp.get_plan() is plan)
+        self.assertEqual(cp.parse(), {'next': 'four'})
+
+    def test_regexs_compiled_once(self):
+        plan = get_parse_plan(self.REGEXS)
+        self.assertEqual(len(plan.compiled), 2)
+        self.assertTrue(get_parse_plan(tuple(self.REGEXS)) is plan)
+
+
+class TestKeyValuePlan(unittest.TestCase):
+
+    KEYS = {'cpu family': 'cpu_family', 'model': 'model', 'flags': 'flags'}
+
+    def test_parse_item(self):
+        data = "cpu family\t: 6\nmodel\t\t: 30\nmodel name\t: Xeon\nflags\t\t: fpu vme"
+        rec = KeyValuePlan(self.KEYS).parse_item(data)
+        self.assertEqual(rec, {'cpu_family': '6', 'model': '30', 'flags': 'fpu vme'})
+
+    def test_value_keeps_colons(self):
+        rec = KeyValuePlan(self.KEYS).parse_item("model\t: a: b")
+        self.assertEqual(rec, {'model': 'a: b'})
+
+    def test_requires_separator_spacing(self):
+        rec = KeyValuePlan(self.KEYS).parse_item("model: 30\nflags\t:")
+        self.assertEqual(rec, {})
+
+    def test_repeated_keys_combined(self):
+        rec = KeyValuePlan(self.KEYS).parse_item("model\t: 30\nmodel\t: 31")
+        self.assertEqual(rec, {'model': '30, 31'})
+
+    def test_command_parser_uses_keys(self):
+        cp = CommandParser("model\t: 30\n\nmodel\t: 31", seperator='\n\n')
+        cp.ITEM_KEYS = self.KEYS
+        self.assertTrue(isinstance(cp.get_plan(), KeyValuePlan))
+        self.assertEqual(cp.parse_items(), [{'model': '30'}, {'model': '31'}])
+
+    def test_plan_cached_per_class(self):
+        class KeysParser(CommandParser):
+            ITEM_KEYS = self.KEYS
+
+        class OtherKeysParser(KeysParser):
+            ITEM_KEYS = {'flags': 'flags'}
+
+        plan = KeysParser().get_plan()
+        with patch('hwinfo.util.get_key_value_plan') as get_key_value_plan:
+            self.assertTrue(KeysParser().get_plan() is plan)
+            self.assertFalse(get_key_value_plan.called)
+        self.assertEqual(OtherKeysParser().get_plan().keys, {'flags': 'flags'})
+        self.assertTrue(KeysParser().get_plan() is plan)
+
+
+class TestIterItems(unittest.TestCase):
+
+    DATA = "\n\nmodel\t: 30\n\nmodel\t: 31\n\n\n\nmodel\t: 32 \n\n  \n"
+    KEYS = {'model': 'model'}
+
+    def _parser(self):
+        cp = CommandParser(seperator='\n\n')
+        cp.ITEM_KEYS = self.KEYS
+        return cp
+
+    def test_matches_parse_items(self):
+        expected = CommandParser(self.DATA, seperator='\n\n')
+        expected.ITEM_KEYS = self.KEYS
+        for chunk_size in [1, 2, 3, 7, 1024]:
+            recs = list(self._parser().iter_items(StringIO(self.DATA), chunk_size))
+            self.assertEqual(recs, expected.parse_items())
+
+    def test_yields_before_end_of_input(self):
+        fh = StringIO(self.DATA)
+        recs = self._parser().iter_items(fh, chunk_size=4)
+        self.assertEqual(recs.next(), {'model': '30'})
+        self.assertTrue(fh.tell() < len(self.DATA))
+
+    def test_no_seperator(self):
+        cp = CommandParser(regexs=[r'four:\ (?P<num>\w+)'])
+        recs = list(cp.iter_items(StringIO(' one four: 845 six ')))
+        self.assertEqual(recs, [{'num': '845'}])
+
+    def test_iter_split(self):
+        data = ";;a;b  ;; "
+        for chunk_size in [1, 2, 3, 100]:
+            items = list(iter_split(StringIO(data), ';', chunk_size))
+            self.assertEqual(items, data.strip().split(';'))
+
+
+class TestCombineDicts(unittest.TestCase):
+
+    RECS = [
+        {'socket': 'CPU1', 'speed': '2400'},
+        {'socket': 'CPU2'},
+        {'socket': 'CPU3', 'speed': None},
+    ]
+
+    def test_combine_strings(self):
+        rec = combine_dicts([dict(r) for r in self.RECS])
+        self.assertEqual(rec, {'socket': 'CPU1, CPU2, CPU3', 'speed': '2400, None'})
+
+    def test_combine_lists(self):
+        rec = combine_dicts([dict(r) for r in self.RECS], as_lists=True)
+        self.assertEqual(rec, {'socket': ['CPU1', 'CPU2', 'CPU3'], 'speed': ['2400', None]})
+
+    def test_single_rec_as_lists(self):
+        rec = combine_dicts([{'socket': 'CPU1'}], as_lists=True)
+        self.assertEqual(rec, {'socket': ['CPU1']})
+
+    def test_join_values(self):
+        rec = join_values({'a': ['1'], 'b': ['1', '2'], 'c': 'x'})
+        self.assertEqual(rec, {'a': '1', 'b': '1, 2', 'c': 'x'})
+
+    def test_parse_as_lists(self):
+        cp = CommandParser('CPU1 CPU2 Mem', [r'(?P<socket>CPU\d)', r'(?P<mem>Mem)'])
+        self.assertEqual(cp.parse(as_lists=True), {'socket': ['CPU1', 'CPU2'], 'mem': ['Mem']})
+        self.assertEqual(cp.parse(), {'socket': 'CPU1, CPU2', 'mem': 'Mem'})
+
+    def test_key_value_plan_as_lists(self):
+        plan = KeyValuePlan({'model': 'model'})
+        self.assertEqual(plan.parse_item("model\t: 1\nmodel\t: 2", as_lists=True), {'model': ['1', '2']})
+
+
+class TestParseBuffer(unittest.TestCase):
+
+    DATA = "\n eth0 Link encap:Ethernet\n\n\n\nlo Link encap:Local Loopback\n\n "
+    REGEXS = [r'Link encap:(?P<encap>[\w]+)']
+
+    def setUp(self):
+        self.tmpfile = tempfile.NamedTemporaryFile()
+        self.tmpfile.write(self.DATA)
+        self.tmpfile.flush()
+
+    def tearDown(self):
+        self.tmpfile.close()
+
+    def test_parse_mmap(self):
+        cp = CommandParser(map_file(self.tmpfile.name), self.REGEXS, seperator='\n\n')
+        expected = CommandParser(self.DATA, self.REGEXS, seperator='\n\n')
+        self.assertEqual(cp.parse_items(), expected.parse_items())
+
+    def test_parse_memoryview(self):
+        cp = CommandParser(memoryview(self.DATA), self.REGEXS)
+        self.assertEqual(cp.parse(as_lists=True), {'encap': ['Ethernet', 'Local']})
+
+    def test_map_empty_file(self):
+        tmpfile = tempfile.NamedTemporaryFile()
+        self.assertEqual(map_file(tmpfile.name), '')
+        tmpfile.close()
+
+    def test_iter_spans(self):
+        spans = list(iter_spans(self.DATA, '\n\n'))
+        items = [self.DATA[start:end] for start, end in spans]
+        self.assertEqual(items, self.DATA.strip().split('\n\n'))
+
+
+class TestParseItemsParallel(unittest.TestCase):
+
+    REGEXS = [r'Link encap:(?P<encap>[\w]+)', r'MTU:(?P<mtu>\d+)']
+
+    def _data(self, count):
+        items = ["dev%d Link encap:Ethernet%d MTU:%d" % (n, n, n) for n in range(count)]
+        return "\n\n".join(items)
+
+    def test_matches_parse_items(self):
+        cp = CommandParser(self._data(500), self.REGEXS, seperator='\n\n')
+        recs = cp.parse_items_parallel(processes=3, min_size=0)
+        self.assertEqual(recs, cp.parse_items())
+
+    def test_key_value_plan(self):
+        data = "\n\n".join(["model\t: %d" % n for n in range(100)])
+        cp = CommandParser(data, seperator='\n\n')
+        cp.ITEM_KEYS = {'model': 'model'}
+        recs = cp.parse_items_parallel(processes=2, min_size=0, as_lists=True)
+        self.assertEqual(recs, [{'model': [str(n)]} for n in range(100)])
+
+    def test_mmap(self):
+        tmpfile = tempfile.NamedTemporaryFile()
+        tmpfile.write(self._data(50))
+        tmpfile.flush()
+        cp = CommandParser(map_file(tmpfile.name), self.REGEXS, seperator='\n\n')
+        recs = cp.parse_items_parallel(processes=2, min_size=0)
+        self.assertEqual(recs, cp.parse_items())
+        tmpfile.close()
+
+    @patch('multiprocessing.Pool')
+    def test_overridden_parsing_is_serial(self, pool_cls):
+        class SectionParser(CommandParser):
+            def _parse_items(self, as_lists):
+                return [{'items': str(len(self.DATA.split('\n\n')))}]
+
+        cp = SectionParser(self._data(50), self.REGEXS, seperator='\n\n')
+        self.assertEqual(cp.parse_items_parallel(processes=2, min_size=0), [{'items': '50'}])
+        self.assertFalse(pool_cls.called)
+
+    def test_matches_parse_items_for_every_parser(self):
+        for name, parser_cls, generator, _, _ in suite.BENCHMARKS:
+            data = generator(40)
+            serial = parser_cls(data).parse_items()
+            parallel = parser_cls(data).parse_items_parallel(processes=2, min_size=0)
+            self.assertEqual(parallel, serial, name)
+
+    @patch('multiprocessing.Pool')
+    def test_small_input_is_serial(self, pool_cls):
+        cp = CommandParser(self._data(10), self.REGEXS, seperator='\n\n')
+        recs = cp.parse_items_parallel(processes=4)
+        self.assertEqual(recs, cp.parse_items())
+        self.assertFalse(pool_cls.called)